@@ -2,17 +2,15 @@ import numpy as np
 import plotly.graph_objects as go
 import plotly.subplots as sp
 from scipy.signal import savgol_filter, find_peaks
-from scipy.optimize import curve_fit
-import scipy.constants as const
+from mlmiv.fitting import fit_line, linear_func  # Closed-form least squares instead of curve_fit
+from mlmiv.archive import ArchiveIndex
 
-# Physical constants
-e = 1.602e-19  # Elementary charge in C
-kb = 1.38e-23  # Boltzmann constant in J/K
-me = 9.11e-31  # Electron mass in kg
-mi = 1.67e-27  # Ion mass (assumed proton) in kg
+# Physical constants (e, kb, me, mi) and the probe area, shared with the simulation scripts
+from mlmiv.physics import e, kb, me, mi, probe_area
 
-# Load the data
-data = np.load('LMSIMData\\20241126-112819-LangmuirSIM_eV2_theory.npy')
+# Load the data (memory-mapped, looked up through the cached LMSIMData index)
+archive = ArchiveIndex('LMSIMData')
+data = archive.load(archive.select(Te=2, timestamp='20241126-112819', kind='theory')[0])
 voltage = data[0]
 current = data[1]
 
@@ -24,13 +22,9 @@ peaks, _ = find_peaks(current_derivative)
 primary_peak_index = peaks[np.argmax(current_derivative[peaks])]
 Vp = voltage[primary_peak_index]
 
-# Fit a linear function for ion saturation in the range -20V to -5V
-def linear_func(x, a, b):
-    return a * x + b
-
 # Ion saturation fit (for subtraction only)
 ion_saturation_mask = (voltage >= -20) & (voltage <= -5)
-ion_fit_params, _ = curve_fit(linear_func, voltage[ion_saturation_mask], current[ion_saturation_mask])
+ion_fit_params = fit_line(voltage[ion_saturation_mask], current[ion_saturation_mask]).params
 ion_saturation_fit = linear_func(voltage, *ion_fit_params)
 
 # Calculate Ii_sat by extending the ion saturation fit to Vp
@@ -42,11 +36,11 @@ ln_subtracted_current = np.log(np.clip(subtracted_current, 1e-15, None))
 
 # Define specific range for electron retardation fit, close to Vp (Vp to Vp - 5 volts)
 electron_retardation_mask = (voltage >= Vp - 5) & (voltage <= Vp)
-retardation_fit_params, _ = curve_fit(linear_func, voltage[electron_retardation_mask], ln_subtracted_current[electron_retardation_mask])
+retardation_fit_params = fit_line(voltage[electron_retardation_mask], ln_subtracted_current[electron_retardation_mask]).params
 
 # Define electron saturation region in the original voltage range and fit
 electron_saturation_mask = voltage >= Vp + 1
-saturation_fit_params, _ = curve_fit(linear_func, voltage[electron_saturation_mask], np.log(current[electron_saturation_mask]))
+saturation_fit_params = fit_line(voltage[electron_saturation_mask], np.log(current[electron_saturation_mask])).params
 
 # Calculate intersection of the two fits for another Vp and Ie_sat estimate
 intersection_voltage = (saturation_fit_params[1] - retardation_fit_params[1]) / (retardation_fit_params[0] - saturation_fit_params[0])
@@ -101,7 +95,7 @@ Ie_sat = np.exp(intersection_current)  # Electron saturation current
 
 ProbeDia = 2.5e-3  # Probe diameter in m
 ProbeLength = 0.000275  # Probe length in m (added length parameter)
-Aprobe = (2 * np.pi * (ProbeDia / 2) * ProbeLength) + (np.pi * (ProbeDia / 2) ** 2)  # Probe area including cylindrical surface and end area in m^2
+Aprobe = probe_area(ProbeDia, ProbeLength)  # Probe area including cylindrical surface and end area in m^2
 
 ve_th = np.sqrt(8 * kb * Te_K / (np.pi * me))  # Thermal velocity of electrons
 ne = Ie_sat / (0.25 * e * ve_th * Aprobe)  # Electron density
@@ -3,15 +3,16 @@ import plotly.graph_objs as go
 import plotly.subplots as sp
 from scipy.optimize import curve_fit, least_squares
 from scipy.integrate import simpson, trapezoid
+from mlmiv.archive import ArchiveIndex
+from mlmiv.fitting import fit_line  # Closed-form least squares for the straight-line fits
 
-# Constants for EEDF calculation
-q_e = 1.602e-19  # Elementary charge in C
-m_e = 9.109e-31  # Electron mass in kg
-A_probe = 1.41372e-5  # Probe area in m^2
+# Constants for EEDF calculation (elementary charge in C, electron mass in kg, probe area in m^2),
+# shared with the batch EEDF analysis
+from mlmiv.eedf import q_e, m_e, A_probe
 
-# Load the data
-file_path = 'LMSIMData\\20241126-112819-LangmuirSIM_eV2_theory.npy'
-data = np.load(file_path, allow_pickle=True)
+# Load the data (memory-mapped, looked up through the cached LMSIMData index)
+archive = ArchiveIndex('LMSIMData')
+data = archive.load(archive.select(Te=2, timestamp='20241126-112819', kind='theory')[0])
 voltage = data[0]
 current = data[1]
 
@@ -39,8 +40,8 @@ def linear_fit(x, a, b):
 # Fit the lower and higher voltage ranges
 low_voltage_range = voltage < -15
 high_voltage_range = voltage > 15
-popt_low, _ = curve_fit(linear_fit, voltage[low_voltage_range], smoothed_current[low_voltage_range])
-popt_high, _ = curve_fit(linear_fit, voltage[high_voltage_range], smoothed_current[high_voltage_range])
+popt_low = fit_line(voltage[low_voltage_range], smoothed_current[low_voltage_range]).params
+popt_high = fit_line(voltage[high_voltage_range], smoothed_current[high_voltage_range]).params
 
 # Create leakage model for the entire voltage range using piecewise linear functions
 leakage_model = np.piecewise(voltage, 
@@ -60,13 +61,10 @@ crossing_right = np.argmax((voltage > Vp) & (difference < 0))  # Start point to
 adjusted_current = np.copy(current)
 
 # Apply corrections towards Vmin starting from crossing_left, removing a fixed value to ensure visible change
-for i in range(crossing_left):
-    adjusted_current[i] -= 0.5 * current[i]  # Remove 50% of the original current for a more pronounced effect
+adjusted_current[:crossing_left] -= 0.5 * current[:crossing_left]  # Remove 50% of the original current for a more pronounced effect
 
 # Apply corrections towards Vmin starting from crossing_right, leaving midsection untouched
-for i in range(crossing_right, len(voltage)):
-    adjustment = 0.5 * difference[i]
-    adjusted_current[i] += adjustment
+adjusted_current[crossing_right:] += 0.5 * difference[crossing_right:]
 
 # Fit the improved model to the adjusted current using least_squares for a more flexible optimization
 def adjusted_improved_fit_function(x, a, b, c, d):
@@ -1,26 +1,37 @@
 import numpy as np
 import plotly.graph_objects as go
 import os
+import time
 from datetime import datetime
 
+# Theoretical curve components, including the knee smoothing of the Ie current (see mlmiv.smoothing),
+# memoized on the physical parameters
+from mlmiv.cache import theory_curve
+# Gaussian noise with highest amplitude around Vp, drawn from a seeded generator per curve
+from mlmiv.noise import add_gaussian_noise, noise_statistics, spawn_seeds
+# Point reduction for dense sample plots
+from mlmiv.decimate import decimate_samples, render_stats, sample_band
+
 # Flags
 PLOTALL_SAMPLEDATA = True  # Set to True to plot all sample data
 PLOT_AVERAGE_OF_SAMPLEDATA = False  # Set to True to plot the average of sample data
 
+# How the samples are drawn with PLOTALL_SAMPLEDATA: 'traces' (one trace per sample),
+# 'merged' (one WebGL trace per Te, decimated with DECIMATION) or 'band' (shaded spread)
+SAMPLE_RENDERING = 'traces'
+DECIMATION = 'minmax'  # 'minmax' (extremes per pixel bin over all samples) or 'lttb' (per sample)
+plot_bins = 800  # Horizontal pixel bins for the decimation
+REPORT_RENDER_STATS = True  # Print trace count, figure size and build/serialize time
+
 # Output directory
 output_dir = "LMSIMData"
 os.makedirs(output_dir, exist_ok=True)
 
-# Physical constants
-e = 1.602e-19  # Elementary charge in C
-kb = 1.38e-23  # Boltzmann constant in J/K
-me = 9.11e-31  # Electron mass in kg
-mi = 1.67e-27  # Ion mass (assumed proton) in kg
+# Physical constants and the probe model are in mlmiv.physics
 
 # Experimental parameters
 ProbeDia = 2.5e-3  # Probe diameter in m
 ProbeLength = 0.000275  # Probe length in m (added length parameter)
-Aprobe = (2 * np.pi * (ProbeDia / 2) * ProbeLength) + (np.pi * (ProbeDia / 2) ** 2)  # Probe area including cylindrical surface and end area in m^2
 ne = 1e16  # Electron density in m^-3
 ni = 1e16  # Ion density in m^-3
 
@@ -42,119 +53,65 @@ slope_electron = 0.2e-4 # Slope for electron current leakage above Vp
 # Noise parameters for simulated data
 num_samples = 10  # Number of noisy samples to generate
 noise_amplitude = 0.00008  # Amplitude of Gaussian noise
+noise_seed = None  # Set to an integer to reproduce the same noisy samples on every run
 
 # Setting the Langmuir IV curve voltage range
 V_range = np.linspace(V_min, V_max, V_points)
 
-# Helper functions
-def calculate_Vp(Te):
-    return Te * np.log(np.sqrt(mi / (2 * np.pi * me)))
-
-# Calculate the electron saturation current using eV converted to Kelvin
-def calculate_Ie_sat(Te):
-    Te_K = Te * 11600  # Convert Te from eV to K
-    return 0.25 * e * ne * (np.sqrt((8 * kb * Te_K) / (np.pi * me))) * Aprobe
-
-# Calculate the ion saturation current using eV converted to Kelvin
-def calculate_Ii_sat(Te):
-    Te_K = Te * 11600  # Convert Te from eV to K
-    return 0.61 * e * ni * (np.sqrt((kb * Te_K) / mi)) * Aprobe
-
-# Electron current
-def Ie(V, Vp, Ie_sat, Te):
-    exponent = (V - Vp) / Te
-    exponent = np.clip(exponent, -700, 700)  # Limit exponent to prevent overflow
-    return np.where(V < Vp, Ie_sat * np.exp(exponent), Ie_sat)
-
-# Electron leakage current above Vp
-def Ie_leakage(V, Vp, Ie_sat, Te):
-    exponent = (V - Vp) / Te
-    exponent = np.clip(exponent, -700, 700)  # Limit exponent to prevent overflow
-    base_current = np.where(V < Vp, Ie_sat * np.exp(exponent), Ie_sat)
-    distance_from_Vp = np.maximum(V - Vp, 0)
-    weight = distance_from_Vp / (max(V_range) - Vp)
-    leakage_current = weight * slope_electron * (V - Vp)
-    return base_current + np.where(V > Vp, leakage_current, 0)
-
-# Ion current
-def Ip(V, Vp, Ii_sat):
-    exponent = (Vp - V) / Tp
-    exponent = np.clip(exponent, -700, 700)  # Limit exponent to prevent overflow
-    return np.where(V < Vp, -Ii_sat, np.where(V > Vp, -Ii_sat * np.exp(exponent), -Ii_sat))
-
-# Ion leakage current below Vp
-def Ip_leakage(V, Vp, Ii_sat):
-    return np.where(V < Vp, -Ii_sat + slope_ion * (V - Vp), 0)
-
-
-# Experimental artifact settings for the Ie current which rounds the "knee"
-def smooth_transition_curve(Ie_values, Vp_index, height_modifier, stretch_modifier):
-    Ie_values_scaled = height_modifier * Ie_values.copy()
-    transition_start = max(0, Vp_index - int(5 * stretch_modifier))
-    transition_end = min(len(Ie_values), Vp_index + int(10 * stretch_modifier))
-    window_size = int(3 * stretch_modifier)
-    
-    for i in range(transition_start, transition_end):
-        if i >= window_size and i < len(Ie_values_scaled) - window_size:
-            Ie_values_scaled[i] = np.mean(Ie_values_scaled[i - window_size:i + window_size])
-    
-    return Ie_values_scaled
-
-# Additional function for adding Gaussian noise with highest amplitude around Vp
-def add_gaussian_noise(It_values, V_range, Vp, num_samples=num_samples, noise_amplitude=noise_amplitude):
-    distance_from_Vp = np.abs(V_range - Vp)
-    max_distance = max(distance_from_Vp)
-    noise_factor = 1 - (distance_from_Vp / max_distance)
-    noisy_samples = []
-    for _ in range(num_samples):
-        noise = noise_factor * np.random.normal(0, noise_amplitude, size=It_values.shape)
-        noisy_samples.append(It_values + noise)
-    return noisy_samples
-
-# Pre-calculate values
-Vp_values = []
-Ie_sat_values = []
-Ii_sat_values = []
-for Te in Te_values:
-    Vp = calculate_Vp(Te)
-    Ie_sat = calculate_Ie_sat(Te)
-    Ii_sat = calculate_Ii_sat(Te)
-    
-    Vp_values.append(Vp)
-    Ie_sat_values.append(Ie_sat)
-    Ii_sat_values.append(Ii_sat)
+# Smoothed electron current, electron leakage, ion current and ion leakage of every Te from the
+# shared curve cache (only the noise below is drawn fresh for every run)
+theory_curves = [theory_curve(Te, ne=ne, ni=ni, Tp=Tp, ProbeDia=ProbeDia, ProbeLength=ProbeLength,
+                              V_range=V_range, height_modifier=height_modifier,
+                              stretch_modifier=stretch_modifier, slope_ion=slope_ion,
+                              slope_electron=slope_electron)
+                 for Te in Te_values]
+Vp_values = [curve.Vp for curve in theory_curves]
 
 # Generate a new figure for the noisy plot
 fig_noisy = go.Figure()
+sample_build_time = 0.0
 
 # Loop through Te values and generate the noisy total current plot for each
 colors = ['blue', 'orange', 'green', 'red', 'purple']
-for Te, Vp, Ie_sat, Ii_sat, color in zip(Te_values, Vp_values, Ie_sat_values, Ii_sat_values, colors):
-    # Calculate smoothed electron current with leakage for total current
-    Ie_values = Ie(V_range, Vp, Ie_sat, Te)
-    Vp_index = np.searchsorted(V_range, Vp)
-    smooth_Ie_values = smooth_transition_curve(Ie_values, Vp_index, height_modifier, stretch_modifier)
-    
-    # Calculate the electron leakage current with weighting
-    Ie_leakage = np.where(V_range > Vp, (V_range - Vp) * slope_electron, 0)
-    
-    # Calculate the ion current with leakage
-    Ip_values = Ip(V_range, Vp, Ii_sat)
-    Ip_leakage = np.where(V_range < Vp, (V_range - Vp) * slope_ion, 0)
+curve_seeds = spawn_seeds(noise_seed, len(Te_values))
+for Te, Vp, curve, color, curve_seed in zip(Te_values, Vp_values, theory_curves, colors, curve_seeds):
+    Ie_values = curve.Ie
+    Ip_values = curve.Ip
 
     # Combine smoothed electron current, electron leakage, ion current, and ion leakage for total
-    It_values = smooth_Ie_values + Ie_leakage + Ip_values + Ip_leakage
+    It_values = curve.total
     
-    # Add Gaussian noise and calculate the average of the samples
-    noisy_samples = add_gaussian_noise(It_values, V_range, Vp)
-    averaged_noisy_sample = np.mean(noisy_samples, axis=0)
+    # Add Gaussian noise and calculate the average of the samples. The individual samples are
+    # only kept when they are plotted, otherwise only a running mean is accumulated.
+    if PLOTALL_SAMPLEDATA:
+        noisy_samples = add_gaussian_noise(It_values, V_range, Vp, num_samples, noise_amplitude, curve_seed)
+        averaged_noisy_sample = np.mean(noisy_samples, axis=0)
+    else:
+        averaged_noisy_sample, _ = noise_statistics(It_values, V_range, Vp, num_samples, noise_amplitude, curve_seed)
 
     # Plot all noisy samples if PLOTALL_SAMPLEDATA is True
     if PLOTALL_SAMPLEDATA:
-        for noisy_sample in noisy_samples:
-            fig_noisy.add_trace(go.Scatter(x=V_range, y=noisy_sample, mode='markers',
-                                           marker=dict(color=color, size=3),
-                                           showlegend=False))
+        build_start = time.perf_counter()
+        if SAMPLE_RENDERING == 'merged':
+            V_plot, sample_plot = decimate_samples(V_range, noisy_samples, DECIMATION, plot_bins)
+            fig_noisy.add_trace(go.Scattergl(x=V_plot, y=sample_plot, mode='markers',
+                                             marker=dict(color=color, size=3),
+                                             showlegend=False))
+        elif SAMPLE_RENDERING == 'band':
+            # Full range of the samples, lighter, around the 10-90 % range
+            lowest, low, high, highest = sample_band(noisy_samples)
+            for lower, upper, opacity in ((lowest, highest, 0.2), (low, high, 0.4)):
+                fig_noisy.add_trace(go.Scatter(x=V_range, y=lower, mode='lines', line=dict(width=0),
+                                               hoverinfo='skip', showlegend=False))
+                fig_noisy.add_trace(go.Scatter(x=V_range, y=upper, mode='lines', line=dict(width=0),
+                                               fill='tonexty', fillcolor=color, opacity=opacity,
+                                               showlegend=False))
+        else:
+            for noisy_sample in noisy_samples:
+                fig_noisy.add_trace(go.Scatter(x=V_range, y=noisy_sample, mode='markers',
+                                               marker=dict(color=color, size=3),
+                                               showlegend=False))
+        sample_build_time += time.perf_counter() - build_start
 
     # Plot the averaged noisy sample if PLOT_AVERAGE_OF_SAMPLEDATA is True
     if PLOT_AVERAGE_OF_SAMPLEDATA:
@@ -194,5 +151,8 @@ fig_noisy.update_layout(
     template="plotly_white"
 )
 
+if REPORT_RENDER_STATS:
+    print(f"Noisy plot: {render_stats(fig_noisy, sample_build_time).summary()}")
+
 # Show the noisy plot
 fig_noisy.show()
@@ -1,15 +1,17 @@
+from functools import lru_cache
+
 import numpy as np
 import plotly.graph_objects as go
 from dash import Dash, dcc, html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
+
+from mlmiv.cache import theory_curve
+from mlmiv.curvetable import curve_table, slider_steps
 
 # ------------------ Constants ------------------
-e = 1.602e-19  # Elementary charge in C
-kb = 1.38e-23  # Boltzmann constant in J/K
-me = 9.11e-31  # Electron mass in kg
-mi = 1.67e-27  # Ion mass (proton) in kg
+# Physical constants and the probe model are in mlmiv.physics; this explorer uses a 3 mm probe
+# with its end area only (ProbeLength = 0 below)
 ProbeDia = 3e-3  # Probe diameter in m
-Aprobe = np.pi * (ProbeDia / 2) ** 2
 ne = 1e16
 ni = 1e16
 Tp = 0.03
@@ -18,66 +20,143 @@ V_max = 20
 V_points = 1000
 V_range = np.linspace(V_min, V_max, V_points)
 
-# ------------------ Helper Functions ------------------
-def calculate_Vp(Te):
-    return Te * np.log(np.sqrt(mi / (2 * np.pi * me)))
+# ------------------ Explorer Settings ------------------
+# With CLIENTSIDE the Te slider redraws the plot in the browser from a table of all
+# slider steps (float32, base64) sent once; otherwise every step rebuilds the figure
+# on the server. The ne, Tp and probe diameter sliders always go to the server, which
+# caches a table per setting.
+CLIENTSIDE = True
+Te_min, Te_max, Te_step = 0.1, 2, 0.05  # Te slider in eV
+Te_steps = slider_steps(Te_min, Te_max, Te_step)
+log_ne_min, log_ne_max, log_ne_step = 15, 17, 0.25  # ne slider, log10 of m^-3
+Tp_min, Tp_max, Tp_step = 0.01, 0.1, 0.01  # Tp slider in eV
+dia_min, dia_max, dia_step = 1, 5, 0.5  # Probe diameter slider in mm
 
-def calculate_Ie_sat(Te):
-    Te_K = Te * 11600
-    return 0.25 * e * ne * (np.sqrt((8 * kb * Te_K) / (np.pi * me))) * Aprobe
+# ------------------ Theoretical Curves ------------------
+# Curves are memoized on the physical parameters, so revisiting a slider position
+# reuses the computed Ie and Ip. The probe area here is the end area only
+# (ProbeLength = 0); the smoothed components are not plotted, so the fast kernel is used.
+def theory(Te, ne=ne, Tp=Tp, ProbeDia=ProbeDia):
+    return theory_curve(Te, ne=ne, ni=ni, Tp=Tp, ProbeDia=ProbeDia, ProbeLength=0,
+                        V_range=V_range, smoothing_mode='fast')
 
-def calculate_Ii_sat(Te):
-    Te_K = Te * 11600
-    return 0.61 * e * ni * (np.sqrt((kb * Te_K) / mi)) * Aprobe
+# Ie and Ip of every Te slider step for one ne, Tp and probe diameter
+@lru_cache(maxsize=64)
+def theory_table(ne=ne, Tp=Tp, ProbeDia=ProbeDia):
+    table = curve_table(Te_steps, V_range, ne=ne, ni=ni, Tp=Tp, ProbeDia=ProbeDia, ProbeLength=0,
+                        smoothing_mode='fast')
+    table['key'] = f"{ne:g}/{Tp:g}/{ProbeDia:g}"  # Lets the browser keep its decoded arrays
+    return table
 
-def Ie(V, Vp, Ie_sat, Te):
-    exponent = (V - Vp) / Te
-    exponent = np.clip(exponent, -700, 700)
-    return np.where(V < Vp, Ie_sat * np.exp(exponent), Ie_sat)
+def slider_values(log_ne, Tp_value, dia_mm):
+    # Rounded so that slider positions map to the same cache keys
+    return float(np.round(10.0 ** log_ne, 6)), round(Tp_value, 6), round(dia_mm * 1e-3, 9)
 
-def Ip(V, Vp, Ii_sat):
-    exponent = (Vp - V) / Tp
-    exponent = np.clip(exponent, -700, 700)
-    return np.where(V < Vp, -Ii_sat, -Ii_sat * np.exp(exponent))
+# Layout shared by both modes; the clientside figure needs the template expanded here
+base_layout = go.Layout(
+    xaxis_title="Voltage (V)",
+    yaxis_title="Current (A)",
+    template="plotly_white",
+    uirevision='theory'  # Keep zoom and pan while the sliders move
+).to_plotly_json()
 
 # ------------------ Dash App ------------------
 app = Dash(__name__)
 
+def labelled_slider(label, **slider):
+    return html.Div([html.Label(label), dcc.Slider(**slider)])
+
 app.layout = html.Div([
     html.H1("Langmuir Probe Characteristics"),
     html.Label("Select Electron Temperature (Te) in eV:"),
     dcc.Slider(
         id='te-slider',
-        min=0.1, max=2, step=0.05, value=1,
-        marks={i: f"{i}" for i in np.arange(0.1, 2.1, 0.5)}
+        min=Te_min, max=Te_max, step=Te_step, value=1,
+        marks={float(i): f"{i}" for i in np.arange(0.1, 2.1, 0.5)}
     ),
+    labelled_slider("Electron density (ne) in m^-3:", id='ne-slider',
+                    min=log_ne_min, max=log_ne_max, step=log_ne_step, value=float(np.log10(ne)),
+                    marks={i: f"1e{i}" for i in range(log_ne_min, log_ne_max + 1)}),
+    labelled_slider("Ion temperature (Tp) in eV:", id='tp-slider',
+                    min=Tp_min, max=Tp_max, step=Tp_step, value=Tp,
+                    marks={i: f"{i:g}" for i in (0.01, 0.03, 0.05, 0.1)}),
+    labelled_slider("Probe diameter in mm:", id='dia-slider',
+                    min=dia_min, max=dia_max, step=dia_step, value=ProbeDia * 1e3,
+                    marks={i: f"{i}" for i in range(dia_min, dia_max + 1)}),
+    dcc.Store(id='theory-table', data=theory_table() if CLIENTSIDE else None),
+    dcc.Store(id='base-layout', data=base_layout),
     dcc.Graph(id='langmuir-plot')
 ])
 
-@app.callback(
-    Output('langmuir-plot', 'figure'),
-    [Input('te-slider', 'value')]
-)
-def update_plot(Te):
-    Vp = calculate_Vp(Te)
-    Ie_sat = calculate_Ie_sat(Te)
-    Ii_sat = calculate_Ii_sat(Te)
-    
-    Ie_values = Ie(V_range, Vp, Ie_sat, Te)
-    Ip_values = Ip(V_range, Vp, Ii_sat)
-    It_values = Ie_values + Ip_values
+if CLIENTSIDE:
+    # New ne, Tp or probe diameter: a new table from the server (cached per setting)
+    @app.callback(
+        Output('theory-table', 'data'),
+        [Input('ne-slider', 'value'), Input('tp-slider', 'value'), Input('dia-slider', 'value')],
+        prevent_initial_call=True
+    )
+    def update_table(log_ne, Tp_value, dia_mm):
+        return theory_table(*slider_values(log_ne, Tp_value, dia_mm))
 
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=V_range, y=Ie_values, mode='lines', name='Electron Current'))
-    fig.add_trace(go.Scatter(x=V_range, y=Ip_values, mode='lines', name='Ion Current'))
-    fig.add_trace(go.Scatter(x=V_range, y=It_values, mode='lines', name='Total Current'))
-    fig.update_layout(
-        title=f"Langmuir Probe Characteristics (Te={Te} eV)",
-        xaxis_title="Voltage (V)",
-        yaxis_title="Current (A)",
-        template="plotly_white"
+    # Te steps are drawn in the browser from the decoded table, without a round-trip
+    app.clientside_callback(
+        """
+        function(Te, table, layout) {
+            var store = window.mlmivTheory || (window.mlmivTheory = {});
+            if (store.key !== table.key) {
+                var decode = function(text) {
+                    var binary = atob(text);
+                    var bytes = new Uint8Array(binary.length);
+                    for (var i = 0; i < binary.length; i++) { bytes[i] = binary.charCodeAt(i); }
+                    return new Float32Array(bytes.buffer);
+                };
+                store.key = table.key;
+                store.V = decode(table.V);
+                store.Ie = decode(table.Ie);
+                store.Ip = decode(table.Ip);
+            }
+            var n = table.n_points;
+            var steps = table.Te.length;
+            var row = Math.round((Te - table.Te[0]) / (table.Te[steps - 1] - table.Te[0]) * (steps - 1));
+            row = Math.max(0, Math.min(steps - 1, row));
+            var Ie = store.Ie.subarray(row * n, (row + 1) * n);
+            var Ip = store.Ip.subarray(row * n, (row + 1) * n);
+            var It = new Float32Array(n);
+            for (var j = 0; j < n; j++) { It[j] = Ie[j] + Ip[j]; }
+            var figureLayout = Object.assign({}, layout,
+                {title: {text: 'Langmuir Probe Characteristics (Te=' + table.Te[row] + ' eV)'}});
+            return {
+                data: [
+                    {type: 'scatter', x: store.V, y: Ie, mode: 'lines', name: 'Electron Current'},
+                    {type: 'scatter', x: store.V, y: Ip, mode: 'lines', name: 'Ion Current'},
+                    {type: 'scatter', x: store.V, y: It, mode: 'lines', name: 'Total Current'}
+                ],
+                layout: figureLayout
+            };
+        }
+        """,
+        Output('langmuir-plot', 'figure'),
+        [Input('te-slider', 'value'), Input('theory-table', 'data')],
+        [State('base-layout', 'data')]
+    )
+else:
+    @app.callback(
+        Output('langmuir-plot', 'figure'),
+        [Input('te-slider', 'value'), Input('ne-slider', 'value'), Input('tp-slider', 'value'),
+         Input('dia-slider', 'value')]
     )
-    return fig
+    def update_plot(Te, log_ne, Tp_value, dia_mm):
+        curve = theory(Te, *slider_values(log_ne, Tp_value, dia_mm))
+        Ie_values = curve.Ie
+        Ip_values = curve.Ip
+        It_values = curve.theory
+
+        fig = go.Figure(layout=base_layout)
+        fig.add_trace(go.Scatter(x=V_range, y=Ie_values, mode='lines', name='Electron Current'))
+        fig.add_trace(go.Scatter(x=V_range, y=Ip_values, mode='lines', name='Ion Current'))
+        fig.add_trace(go.Scatter(x=V_range, y=It_values, mode='lines', name='Total Current'))
+        fig.update_layout(title=f"Langmuir Probe Characteristics (Te={Te} eV)")
+        return fig
 
 if __name__ == '__main__':
-    app.run_server(debug=False)
+    app.run(debug=False)
@@ -0,0 +1,107 @@
+"""Benchmark mlmiv.align: align a mixed archive of voltage grids and check the result.
+
+A temporary archive is filled with simulated curves on several voltage
+grids, as written by instruments rather than by MLM-IV-SimPlot.py: other
+ranges and point counts, descending sweeps, up-and-down sweeps that
+measure every voltage twice, and captures that stop at 5 V, short of the
+target grid. It is aligned twice:
+
+- per curve: ``np.unique`` and ``np.interp`` on every curve, as a script
+  would;
+- with ``align.align_archive``, which writes the HDF5 dataset.
+
+The maximum difference between the two and the error against the model
+evaluated on the target grid are printed. The aligned curves are then
+analysed with ``analysis.analyze_batch``: the partial captures must give
+``nan`` results and the others finite ones. The script exits with status 1
+if the alignments differ or either check fails.
+
+Run from the repository root:
+
+    python benchmarks/bench_align.py --curves 4000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mlmiv import align, analysis, dataset, physics, simulate  # noqa: E402
+
+# Source grids: (V_min, V_max, V_points, description)
+GRIDS = ((-20, 20, 1000, 'simulated'), (-25, 22, 700, 'wider'), (-18, 18, 1500, 'dense'),
+         (18, -18, 900, 'descending'), (-19, 19, 600, 'up and down'), (-20, 5, 600, 'partial'))
+
+
+def source_voltage(V_min, V_max, V_points, description):
+    voltage = np.linspace(V_min, V_max, V_points)
+    return np.concatenate([voltage, voltage[::-1]]) if description == 'up and down' else voltage
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--curves', type=int, default=4000)
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--chunk-size', type=int, default=align.chunk_size)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    Te = np.exp(rng.uniform(np.log(0.5), np.log(2), args.curves))
+    source_grids = rng.integers(0, len(GRIDS), args.curves)
+    target = simulate.voltage_range(-18, 18, physics.V_points)
+    # The model on a fine grid, with the 1000-point knee, sampled onto the source and target grids
+    fine = simulate.voltage_range(-25, 25, 5001)
+    model = np.empty((args.curves, len(target)))
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for first in range(0, args.curves, 500):
+            curves = simulate.simulate_batch(Te[first:first + 500], V_range=fine, smoothing_mode='fast',
+                                             smoothing_points=physics.V_points).total
+            for row, curve in enumerate(curves, first):
+                model[row] = np.interp(target, fine, curve)
+                voltage = source_voltage(*GRIDS[source_grids[row]])
+                path = os.path.join(directory, f"capture-{row:06d}.npy")
+                np.save(path, np.array([voltage, np.interp(voltage, fine, curve)]))
+                paths.append(path)
+
+        start = time.perf_counter()
+        loop = np.empty((len(paths), len(target)))
+        for row, path in enumerate(paths):
+            voltage, current = np.load(path)
+            unique, inverse = np.unique(voltage, return_inverse=True)
+            mean = np.bincount(inverse, current) / np.bincount(inverse)
+            loop[row] = np.interp(target, unique, mean, left=np.nan, right=np.nan)
+        t_loop = time.perf_counter() - start
+
+        output = os.path.join(directory, 'aligned.h5')
+        report = align.align_archive(paths, output, target, workers=args.workers, chunk_size=args.chunk_size)
+        aligned = dataset.read_rows(output, align.ALIGNED_KIND)
+        with dataset.DatasetReader(output) as reader:
+            uncovered_points = reader.params(names=['uncovered_points'])['uncovered_points']
+
+    difference = np.nanmax(np.abs(aligned - loop))
+    covered = source_grids != len(GRIDS) - 1
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = analysis.analyze_batch(target, aligned)
+    analysed = np.isfinite(result['Te'])
+    print(f"{args.curves} curves on {len(GRIDS)} source grids -> {len(target)} points, -18..18 V")
+    print(f"per-curve np.interp: {t_loop * 1e3:9.1f} ms ({args.curves / t_loop:8.0f} curves/s)")
+    print(f"align_archive      : {report.elapsed * 1e3:9.1f} ms ({report.curves_per_second:8.0f} curves/s, "
+          f"including the HDF5 writes)")
+    print(report.summary())
+    print(f"max |align - per-curve| = {difference:.3e} A, "
+          f"max relative error against the model = "
+          f"{np.nanmax(np.abs(aligned - model)) / np.max(np.abs(model)):.2e}")
+    print(f"{np.count_nonzero(~covered)} partial curves, {np.count_nonzero(uncovered_points)} rows with uncovered "
+          f"samples; analysed {np.count_nonzero(analysed)} of {args.curves} curves")
+    if (difference > 1e-12 or np.isnan(aligned[covered]).any() or not np.array_equal(uncovered_points > 0, ~covered)
+            or not np.array_equal(analysed, covered)):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Benchmark mlmiv.analysis.analyze_batch and check that rows with bad samples fail alone.
+
+Averaged noisy curves over a Te sweep are analysed once as they are and once
+with a ``nan`` or ``inf`` written into some rows (at either end, where the
+Savitzky-Golay filter fits its edge polynomials, and in the middle). The
+corrupted rows must come back as ``nan`` and every other row exactly as in
+the clean batch; the script exits with status 1 otherwise.
+
+Run from the repository root:
+
+    python benchmarks/bench_analysis.py --curves 5000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mlmiv import analysis, noise, simulate  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--curves', type=int, default=2000)
+    args = parser.parse_args()
+
+    V_range = simulate.voltage_range()
+    Te = np.geomspace(0.1, 2, args.curves)
+    batch = simulate.simulate_batch(Te, V_range=V_range, smoothing_mode='fast')
+    currents, _ = noise.averaged_noisy_batch(batch.total, V_range, batch.Vp, seeds=0)
+    analysis.analyze_batch(V_range, currents[:2])  # Warm-up (SciPy imports)
+
+    start = time.perf_counter()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        clean = analysis.analyze_batch(V_range, currents)
+    elapsed = time.perf_counter() - start
+    print(f"{args.curves} curves: {args.curves / elapsed:.0f} curves/s")
+
+    corrupted = currents.copy()
+    bad = np.arange(1, args.curves, 7)
+    for number, row in enumerate(bad):
+        column = (0, -1, len(V_range) // 2)[number % 3]
+        corrupted[row, column] = (np.nan, np.inf, -np.inf)[number % 3]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = analysis.analyze_batch(V_range, corrupted)
+    good = np.setdiff1d(np.arange(args.curves), bad)
+    failed = False
+    for name in analysis.RESULT_DTYPE.names:
+        bad_ok = np.all(np.isnan(result[name][bad]))
+        good_ok = np.array_equal(result[name][good], clean[name][good], equal_nan=True)
+        failed |= not (bad_ok and good_ok)
+        if not (bad_ok and good_ok):
+            print(f"{name}: corrupted rows nan {bad_ok}, other rows unchanged {good_ok}")
+    print(f"{len(bad)} rows with a non-finite sample: "
+          f"{'only those rows are nan' if not failed else 'FAILED'}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark the simulate_batch backends (NumPy vs the fused numba kernel) on large grids.
+
+The grid is simulated in chunks of ``--chunk-size`` curves (a 1e5 x 1000
+grid is 800 MB per output matrix). For every backend the throughput, and for
+one chunk the peak memory allocated beyond the two output matrices, are
+reported; the numba kernel is compiled (or loaded from its cache) before
+timing. Backends that are not installed are skipped.
+
+Run from the repository root:
+
+    python benchmarks/bench_backends.py --curves 100000 --v-points 1000
+"""
+import argparse
+import importlib.util
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mlmiv import physics, simulate  # noqa: E402
+
+
+def simulate_chunk(Te, ne, V_range, backend):
+    return simulate.simulate_batch(Te, ne=ne, V_range=V_range, smoothing_mode='fast', backend=backend)
+
+
+def peak_extra_memory(Te, ne, V_range, backend):
+    # Peak of the traced allocations minus the two (n_curves, V_points) outputs
+    tracemalloc.start()
+    batch = simulate_chunk(Te, ne, V_range, backend)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak - batch.theory.nbytes - batch.total.nbytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--curves', type=int, default=100_000)
+    parser.add_argument('--v-points', type=int, default=physics.V_points)
+    parser.add_argument('--chunk-size', type=int, default=10_000)
+    args = parser.parse_args()
+
+    V_range = simulate.voltage_range(V_points=args.v_points)
+    rng = np.random.default_rng(0)
+    Te = rng.uniform(0.1, 5, args.curves)
+    ne = 10 ** rng.uniform(15, 17, args.curves)
+    chunks = [slice(start, start + args.chunk_size) for start in range(0, args.curves, args.chunk_size)]
+    backends = ['numpy'] + (['numba'] if importlib.util.find_spec('numba') else [])
+    print(f"{args.curves} curves x {args.v_points} points in chunks of {args.chunk_size}")
+    if len(backends) == 1:
+        print("numba is not installed; only the NumPy backend is measured")
+
+    first_chunk = {}
+    for backend in backends:
+        start = time.perf_counter()
+        first_chunk[backend] = simulate_chunk(Te[:2], ne[:2], V_range, backend)  # Compiles the numba kernel
+        warmup = time.perf_counter() - start
+        elapsed = 0.0
+        for rows in chunks:
+            start = time.perf_counter()
+            batch = simulate_chunk(Te[rows], ne[rows], V_range, backend)
+            elapsed += time.perf_counter() - start
+            if rows.start == 0:
+                first_chunk[backend] = batch
+        extra = peak_extra_memory(Te[chunks[0]], ne[chunks[0]], V_range, backend)
+        print(f"{backend:6}: {elapsed:8.2f} s ({args.curves / elapsed:9.0f} curves/s), "
+              f"first call {warmup * 1e3:.0f} ms, {extra / 1e6:8.1f} MB of temporaries per chunk")
+
+    if 'numba' in first_chunk:
+        reference, fused = first_chunk['numpy'], first_chunk['numba']
+        scale = np.abs(reference.total).max(axis=1, keepdims=True)
+        print(f"max |numba - numpy| / max |I| = theory {np.max(np.abs(fused.theory - reference.theory) / scale):.2e}, "
+              f"total {np.nanmax(np.abs(fused.total - reference.total) / scale):.2e}")
+
+
+if __name__ == '__main__':
+    main()
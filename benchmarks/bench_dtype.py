@@ -0,0 +1,112 @@
+"""Compare float64 and float32 simulation: memory, throughput, and the MLM-IV-Analysis results.
+
+For each dtype the grid is simulated in chunks with ``simulate_batch`` writing
+into one pair of reused ``out`` buffers, and the size of those buffers and the
+traced peak of the temporaries beyond them are reported. The averaged noisy
+curves of both runs (same seeds) are then analysed with
+``mlmiv.analysis.analyze_batch`` and the float32 Te, ne and Vp are checked
+against float64; the script exits with status 1 if any of them is outside the
+tolerances below.
+
+Run from the repository root:
+
+    python benchmarks/bench_dtype.py --curves 100000 --check-curves 5000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mlmiv import analysis, noise, physics, simulate  # noqa: E402
+
+# Allowed float32 deviation of the analysis results from float64; the analysis itself recovers
+# the simulated Te only to a few percent
+Te_rtol = 1e-3
+ne_rtol = 1e-3
+Vp_atol = 1e-3  # V; the derivative Vp sits on the voltage grid and must not move
+
+
+def simulate_chunk(Te, ne, V_range, backend, out):
+    return simulate.simulate_batch(Te, ne=ne, V_range=V_range, smoothing_mode='fast', backend=backend, out=out)
+
+
+def chunk_buffers(n_rows, n_points, dtype):
+    return np.empty((n_rows, n_points), dtype=dtype), np.empty((n_rows, n_points), dtype=dtype)
+
+
+def peak_extra_memory(Te, ne, V_range, backend, out):
+    # Traced peak of one chunk written into the existing buffers out
+    tracemalloc.start()
+    simulate_chunk(Te, ne, V_range, backend, out)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def analysed(Te, ne, V_range, backend, dtype):
+    batch = simulate.simulate_batch(Te, ne=ne, V_range=V_range, smoothing_mode='fast', backend=backend,
+                                    dtype=dtype)
+    averaged_noisy, _ = noise.averaged_noisy_batch(batch.total, V_range, batch.Vp, seeds=0, dtype=dtype)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return analysis.analyze_batch(V_range, averaged_noisy)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--curves', type=int, default=20_000)
+    parser.add_argument('--check-curves', type=int, default=2000, help="curves analysed for the accuracy check")
+    parser.add_argument('--v-points', type=int, default=physics.V_points)
+    parser.add_argument('--chunk-size', type=int, default=10_000)
+    parser.add_argument('--backend', choices=simulate.BACKENDS, default='auto')
+    args = parser.parse_args()
+
+    backend = simulate.resolve_backend(args.backend)
+    V_range = simulate.voltage_range(V_points=args.v_points)
+    rng = np.random.default_rng(0)
+    Te = rng.uniform(0.1, 5, args.curves)
+    ne = 10 ** rng.uniform(15, 17, args.curves)
+    print(f"{args.curves} curves x {args.v_points} points in chunks of {args.chunk_size}, {backend} backend")
+
+    for dtype in simulate.DTYPES:
+        out = chunk_buffers(args.chunk_size, args.v_points, dtype)
+        simulate_chunk(Te[:2], ne[:2], V_range, backend, tuple(buffer[:2] for buffer in out))  # Warm-up/compile
+        elapsed = 0.0
+        for start in range(0, args.curves, args.chunk_size):
+            rows = slice(start, start + args.chunk_size)
+            n_rows = len(Te[rows])
+            start_time = time.perf_counter()
+            simulate_chunk(Te[rows], ne[rows], V_range, backend, tuple(buffer[:n_rows] for buffer in out))
+            elapsed += time.perf_counter() - start_time
+        n_rows = len(Te[:args.chunk_size])
+        extra = peak_extra_memory(Te[:n_rows], ne[:n_rows], V_range, backend,
+                                  tuple(buffer[:n_rows] for buffer in out))
+        print(f"{dtype:8}: {args.curves / elapsed:9.0f} curves/s, per chunk {out[0].nbytes * 2 / 1e6:7.1f} MB of "
+              f"outputs + {extra / 1e6:6.1f} MB of temporaries; "
+              f"{args.curves * args.v_points * np.dtype(dtype).itemsize / 1e6:.0f} MB per stored curve kind")
+
+    check = slice(0, args.check_curves)
+    reference = analysed(Te[check], ne[check], V_range, backend, 'float64')
+    single = analysed(Te[check], ne[check], V_range, backend, 'float32')
+    failed = False
+    for name, rtol, atol in (('Te', Te_rtol, 0), ('ne', ne_rtol, 0), ('Vp_derivative', 0, Vp_atol),
+                             ('Vp_intersection', 0, Vp_atol)):
+        finite = np.isfinite(reference[name])
+        deviation = np.abs(single[name] - reference[name])
+        allowed = atol + rtol * np.abs(reference[name])
+        n_bad = (np.count_nonzero(finite & ~(deviation <= allowed))
+                 + np.count_nonzero(~finite & np.isfinite(single[name])))
+        relative = np.max(deviation[finite] / np.abs(reference[name][finite]), initial=0)
+        print(f"{name:16}: max |float32 - float64| {np.max(deviation[finite], initial=0):.3g} "
+              f"({relative:.2e} relative), {n_bad} of {args.check_curves} curves outside tolerance")
+        failed |= n_bad > 0
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Benchmark the batched EEDF moments of mlmiv.eedf against the script's per-curve integration.
+
+Run from the repository root:
+
+    python benchmarks/bench_eedf.py --curves 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.integrate import simpson, trapezoid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mlmiv import eedf, physics, simulate  # noqa: E402
+
+
+def script_moments(voltage, second_derivative, Vp):
+    # EEDF and moments of one curve exactly as MLM-IV-EEDF-Analysis.py computes them
+    middle_voltage_range = (voltage >= -15) & (voltage <= 15)
+    analysis_range = (voltage[middle_voltage_range] >= Vp - 2) & (voltage[middle_voltage_range] <= 20)
+    energies_eV = voltage[middle_voltage_range][analysis_range] - Vp
+    second_derivative_for_eedf = second_derivative[middle_voltage_range][analysis_range]
+    positive_energy_indices = energies_eV > 0
+    energies_eV = energies_eV[positive_energy_indices]
+    second_derivative_for_eedf = second_derivative_for_eedf[positive_energy_indices]
+    eedf_values = np.abs(eedf.scaling_factor * (2 / (eedf.A_probe * eedf.q_e))
+                         * np.sqrt(2 * eedf.m_e * energies_eV * eedf.q_e) * second_derivative_for_eedf)
+    integrand_density = eedf_values / np.sqrt(energies_eV)
+    integrand_temperature = (energies_eV ** (3 / 2)) * eedf_values
+    n_e_simpson = simpson(integrand_density, x=energies_eV)
+    n_e_trapz = trapezoid(integrand_density, x=energies_eV)
+    return (n_e_simpson, n_e_trapz,
+            (2 / (3 * n_e_simpson)) * simpson(integrand_temperature, x=energies_eV),
+            (2 / (3 * n_e_trapz)) * trapezoid(integrand_temperature, x=energies_eV))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--curves', type=int, default=2000)
+    parser.add_argument('--full', type=int, default=50, help="curves for the full pipeline comparison")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    V = simulate.voltage_range()
+    Te = rng.uniform(0.5, 3, args.curves)
+    batch = simulate.simulate_batch(Te, physics.ne, physics.ni, physics.Tp, physics.ProbeDia, physics.ProbeLength, V)
+    grid = eedf.EEDFGrid(V)
+    params = np.column_stack([batch.Ie_sat / 2, 1 / (2 * Te), batch.Vp, batch.Ie_sat / 2])
+    fit = eedf.tanh_curves(V, params)
+    second_derivative = np.gradient(np.gradient(fit, V, axis=1), V, axis=1)
+
+    start = time.perf_counter()
+    reference = np.array([script_moments(V, d2, Vp) for d2, Vp in zip(second_derivative, batch.Vp)])
+    t_loop = time.perf_counter() - start
+    for label, fresh in (("cold grid", True), ("warm grid", False)):
+        if fresh:
+            grid = eedf.EEDFGrid(V)
+        start = time.perf_counter()
+        moments = grid.moments(second_derivative, batch.Vp)
+        t_batch = time.perf_counter() - start
+        batched = np.column_stack([moments[name] for name in eedf.RESULT_FIELDS])
+        print(f"moments of {args.curves} curves, {label}: per-curve simpson/trapezoid {t_loop * 1e3:8.1f} ms, "
+              f"EEDFGrid.moments {t_batch * 1e3:7.1f} ms ({t_loop / t_batch:.0f}x)")
+    print(f"  max relative difference: {np.max(np.abs(batched - reference) / np.abs(reference)):.2e}")
+
+    # Whole pipeline on a few curves; the two tanh fits per curve dominate here
+    currents = batch.total[:args.full]
+    start = time.perf_counter()
+    for row in range(len(currents)):
+        eedf.analyze_eedf(V, currents[row], batch.Vp[row])
+    t_single = time.perf_counter() - start
+    start = time.perf_counter()
+    eedf.analyze_eedf_batch(V, currents, batch.Vp[:args.full], grid)
+    t_batch = time.perf_counter() - start
+    print(f"full pipeline, {len(currents)} curves: analyze_eedf loop {t_single * 1e3:.0f} ms, "
+          f"analyze_eedf_batch {t_batch * 1e3:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
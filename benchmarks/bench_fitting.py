@@ -0,0 +1,83 @@
+"""Benchmark mlmiv.fitting.fit_line against scipy.optimize.curve_fit on straight-line segments.
+
+Run from the repository root:
+
+    python benchmarks/bench_fitting.py --segments 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.optimize import curve_fit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mlmiv.fitting import fit_line, linear_func  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--segments', type=int, default=2000)
+    parser.add_argument('--points', type=int, default=375, help="points per segment (-20..-5 V of the default sweep)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    x = np.linspace(-20, -5, args.points)
+    slope = rng.uniform(1e-6, 1e-5, args.segments)
+    intercept = rng.uniform(-1e-4, -1e-5, args.segments)
+    sigma = rng.uniform(1e-7, 1e-5, (args.segments, 1)) * rng.uniform(0.5, 1.5, (1, args.points))
+    y = slope[:, None] * x + intercept[:, None] + sigma * rng.standard_normal((args.segments, args.points))
+    # Every segment uses a different sub-range, as the per-curve retardation fits do
+    lo = rng.integers(0, args.points // 3, args.segments)
+    mask = np.arange(args.points) >= lo[:, None]
+
+    def curve_fit_loop(weights, **tolerances):
+        params = np.empty((args.segments, 2))
+        se = np.empty((args.segments, 2))
+        for row in range(args.segments):
+            m = mask[row]
+            row_sigma = None if weights is None else np.broadcast_to(sigma[row], x.shape)[m]
+            popt, pcov = curve_fit(linear_func, x[m], y[row, m], sigma=row_sigma, **tolerances)
+            params[row] = popt
+            se[row] = np.sqrt(np.diag(pcov))
+        return params, se
+
+    def lstsq_loop(weights):
+        # Exact (QR/SVD based) weighted least squares, one segment at a time
+        params = np.empty((args.segments, 2))
+        for row in range(args.segments):
+            m = mask[row]
+            scale = np.ones(m.sum()) if weights is None else 1 / np.broadcast_to(sigma[row], x.shape)[m]
+            design = np.column_stack([x[m], np.ones(m.sum())]) * scale[:, None]
+            params[row] = np.linalg.lstsq(design, y[row, m] * scale, rcond=None)[0]
+        return params
+
+    for label, weights in (("unweighted", None), ("weighted", 1 / sigma ** 2)):
+        start = time.perf_counter()
+        reference, reference_se = curve_fit_loop(weights)
+        t_curve_fit = time.perf_counter() - start
+        exact = lstsq_loop(weights)
+
+        start = time.perf_counter()
+        fit = fit_line(x, y, mask, weights)
+        t_closed = time.perf_counter() - start
+
+        params = np.column_stack([fit.slope, fit.intercept])
+        se = np.column_stack([fit.slope_se, fit.intercept_se])
+        params_rel = np.max(np.abs(params - reference) / np.abs(reference))
+        exact_rel = np.max(np.abs(params - exact) / np.abs(exact))
+        curve_fit_rel = np.max(np.abs(reference - exact) / np.abs(exact))
+        se_rel = np.max(np.abs(se - reference_se) / np.abs(reference_se))
+        print(f"{label}: {args.segments} segments x <= {args.points} points")
+        print(f"  curve_fit loop : {t_curve_fit * 1e3:9.2f} ms")
+        print(f"  fit_line batch : {t_closed * 1e3:9.2f} ms  ({t_curve_fit / t_closed:.0f}x)")
+        print(f"  max relative difference of parameters to exact lstsq: fit_line {exact_rel:.2e}, "
+              f"curve_fit {curve_fit_rel:.2e}")
+        print(f"  max relative difference to curve_fit: parameters {params_rel:.2e}, standard errors {se_rel:.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Benchmark adaptive voltage grids (mlmiv.grid) against uniform sweeps: accuracy per point and speed.
+
+Curves over a Te sweep are simulated (noise-free, or averaged over noisy
+sweeps as in MLM-IV-SimPlot.py with ``--noise``) and analysed on uniform
+grids and on ``grid.adaptive_voltage_range`` grids of several sizes; the knee
+smoothing is the scripts' 1000-point one on every grid, so all grids sample
+the same curves. For each grid the median error of Te and of both Vp
+estimates against the simulated values, the median difference of Te from
+the analysis on the scripts' 1000-point grid and the simulation plus
+analysis rate are printed.
+
+Run from the repository root:
+
+    python benchmarks/bench_grid.py --curves 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mlmiv import analysis, grid, noise, physics, simulate  # noqa: E402
+
+
+def simulate_and_analyse(Te, V_range, add_noise):
+    batch = simulate.simulate_batch(Te, V_range=V_range, smoothing_mode='fast', smoothing_points=physics.V_points)
+    currents = batch.total
+    if add_noise:
+        currents, _ = noise.averaged_noisy_batch(currents, V_range, batch.Vp, seeds=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return batch, analysis.analyze_batch(V_range, currents)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--curves', type=int, default=1000)
+    parser.add_argument('--points', type=int, nargs='+', default=[150, 250, 500])
+    parser.add_argument('--noise', action='store_true', help="analyse averaged noisy curves")
+    args = parser.parse_args()
+
+    Te = np.geomspace(grid.adaptive_Te[0], grid.adaptive_Te[-1], args.curves)
+    simulate_and_analyse(Te[:10], simulate.voltage_range(), args.noise)  # Warm-up (SciPy imports)
+    grids = [('uniform', simulate.voltage_range())]
+    for points in args.points:
+        grids += [('uniform', simulate.voltage_range(V_points=points)),
+                  ('adaptive', grid.adaptive_voltage_range(Te, points))]
+
+    print(f"{args.curves} {'averaged noisy' if args.noise else 'noise-free'} curves, Te {Te[0]:g}..{Te[-1]:g} eV")
+    print(f"{'grid':>14} {'Te error':>9} {'Vp_der error':>13} {'Vp_int error':>13} "
+          f"{'Te vs 1000':>11} {'curves/s':>9}")
+    reference = None
+    for name, V_range in grids:
+        start = time.perf_counter()
+        batch, result = simulate_and_analyse(Te, V_range, args.noise)
+        rate = args.curves / (time.perf_counter() - start)
+        if reference is None:
+            reference = result
+        print(f"{name:>9} {len(V_range):4d} {np.nanmedian(np.abs(result['Te'] / Te - 1)):9.3f} "
+              f"{np.nanmedian(np.abs(result['Vp_derivative'] - batch.Vp)):11.3f} V "
+              f"{np.nanmedian(np.abs(result['Vp_intersection'] - batch.Vp)):11.3f} V "
+              f"{np.nanmedian(np.abs(result['Te'] / reference['Te'] - 1)):11.3f} {rate:9.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Compare the inverse fits of mlmiv.inverse with the graphical analysis on simulated curves.
+
+Curves are simulated with random Te, ne, ni, leakage slopes and
+stretch_modifier, averaged over noisy sweeps as in MLM-IV-SimPlot.py, and
+then analysed both ways. The median and 95th percentile of the relative error
+of every parameter are printed, followed by the fit rate in curves per second.
+The fits run on ``--workers`` processes (default: all cores).
+
+Run from the repository root:
+
+    python benchmarks/bench_inverse.py --curves 500
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mlmiv import analysis, inverse, noise, simulate  # noqa: E402
+
+
+def simulated_curves(n_curves, noisy, seed=0):
+    rng = np.random.default_rng(seed)
+    true = {
+        'Te': rng.uniform(0.5, 5, n_curves),
+        'ne': 10 ** rng.uniform(15.5, 17, n_curves),
+        'slope_ion': rng.uniform(2e-6, 8e-6, n_curves),
+        'slope_electron': rng.uniform(1e-5, 3e-5, n_curves),
+        'stretch_modifier': rng.choice([6.0, 8.0, 10.5, 13.0], n_curves),
+    }
+    true['ni'] = true['ne'] * rng.uniform(0.5, 1.5, n_curves)
+    V_range = simulate.voltage_range()
+    batch = simulate.simulate_batch(true['Te'], true['ne'], true['ni'], V_range=V_range,
+                                    stretch_modifier=true['stretch_modifier'], slope_ion=true['slope_ion'],
+                                    slope_electron=true['slope_electron'], smoothing_mode='fast')
+    true['Vp'] = batch.Vp
+    currents = batch.total
+    if noisy:
+        currents, _ = noise.averaged_noisy_batch(currents, V_range, batch.Vp, seeds=seed)
+    return V_range, currents, true
+
+
+def error_percentiles(estimate, true):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        error = np.abs(estimate / true - 1)
+    return np.nanpercentile(error, 50), np.nanpercentile(error, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--curves', type=int, default=200)
+    parser.add_argument('--no-noise', action='store_true', help="fit the noise-free model curves")
+    parser.add_argument('--chunk-size', type=int, default=inverse.chunk_size)
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    V_range, currents, true = simulated_curves(args.curves, not args.no_noise)
+    inverse.fit_curves(V_range, currents[:2], workers=1)  # Warm-up (SciPy imports)
+
+    start = time.perf_counter()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        graphical = analysis.analyze_batch(V_range, currents)
+    t_graphical = time.perf_counter() - start
+    fitted, report = inverse.fit_curves(V_range, currents, chunk_size=args.chunk_size, workers=args.workers)
+
+    print(f"{args.curves} {'noise-free' if args.no_noise else 'averaged noisy'} curves x {len(V_range)} points")
+    print(f"{'parameter':16} {'inverse median':>15} {'p95':>10} {'graphical median':>17} {'p95':>10}")
+    graphical_names = {'Te': 'Te', 'ne': 'ne', 'ni': 'ni', 'Vp': 'Vp_intersection'}
+    for name in ('Te', 'ne', 'ni', 'Vp', 'slope_ion', 'slope_electron', 'stretch_modifier'):
+        median, p95 = error_percentiles(fitted[name], true[name])
+        line = f"{name:16} {median:15.2e} {p95:10.2e}"
+        if name in graphical_names:
+            median, p95 = error_percentiles(graphical[graphical_names[name]], true[name])
+            line += f" {median:17.2e} {p95:10.2e}"
+        print(line)
+    print(report.summary())
+    print(f"graphical analysis: {args.curves / t_graphical:.0f} curves/s")
+
+
+if __name__ == '__main__':
+    main()
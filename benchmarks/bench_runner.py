@@ -0,0 +1,36 @@
+"""Strong-scaling check for mlmiv.runner: the same sweep with an increasing number of workers.
+
+Run from the repository root:
+
+    python benchmarks/bench_runner.py --curves 20000 --workers 1 2 4 8 16 32
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mlmiv import runner  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--curves', type=int, default=4000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--chunk-size', type=int, default=64)
+    args = parser.parse_args()
+
+    sweep = {'Te': np.linspace(0.1, 2, args.curves // 4), 'ne': [1e15, 3e15, 1e16, 3e16]}
+    baseline = None
+    print(f"{'workers':>8} {'curves/s':>10} {'speedup':>8} {'efficiency':>10}")
+    for workers in args.workers:
+        report = runner.run_sweep(sweep, workers=workers, chunk_size=args.chunk_size, seed=0, save=False)
+        baseline = baseline or report.curves_per_second
+        speedup = report.curves_per_second / baseline
+        print(f"{workers:8d} {report.curves_per_second:10.0f} {speedup:7.2f}x {speedup / workers:10.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Benchmark mlmiv.simulate.simulate_batch against the per-curve loop of MLM-IV-SimPlot.py.
+
+Run from the repository root:
+
+    python benchmarks/bench_simulate.py --te-points 50 --ne-points 20
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mlmiv import physics, simulate  # noqa: E402
+
+
+def legacy_smooth_transition_curve(Ie_values, Vp_index, height_modifier, stretch_modifier):
+    # smooth_transition_curve as written in MLM-IV-SimPlot.py
+    Ie_values_scaled = height_modifier * Ie_values.copy()
+    transition_start = max(0, Vp_index - int(5 * stretch_modifier))
+    transition_end = min(len(Ie_values), Vp_index + int(10 * stretch_modifier))
+    window_size = int(3 * stretch_modifier)
+
+    for i in range(transition_start, transition_end):
+        if i >= window_size and i < len(Ie_values_scaled) - window_size:
+            Ie_values_scaled[i] = np.mean(Ie_values_scaled[i - window_size:i + window_size])
+
+    return Ie_values_scaled
+
+
+def legacy_loop(params, V_range):
+    # The per-curve loop of MLM-IV-SimPlot.py, one parameter set at a time
+    curves = []
+    for Te, ne, ni, Tp, ProbeDia, ProbeLength in zip(*(params[name] for name in simulate.PARAMETER_NAMES)):
+        Aprobe = physics.probe_area(ProbeDia, ProbeLength)
+        Vp = physics.calculate_Vp(Te)
+        Ie_sat = physics.calculate_Ie_sat(Te, ne, Aprobe)
+        Ii_sat = physics.calculate_Ii_sat(Te, ni, Aprobe)
+        Ie_values = physics.Ie(V_range, Vp, Ie_sat, Te)
+        Vp_index = np.searchsorted(V_range, Vp)
+        smooth_Ie_values = legacy_smooth_transition_curve(Ie_values, Vp_index, simulate.height_modifier,
+                                                          simulate.stretch_modifier)
+        Ip_values = physics.Ip(V_range, Vp, Ii_sat, Tp)
+        curves.append(smooth_Ie_values + physics.Ie_leakage(V_range, Vp, simulate.slope_electron)
+                      + Ip_values + physics.Ip_leakage(V_range, Vp, simulate.slope_ion))
+    return np.array(curves)
+
+
+def legacy_theory_loop(params, V_range):
+    # Only the calculate_Vp / calculate_Ie_sat / calculate_Ii_sat / Ie / Ip stage, per curve
+    curves = []
+    for Te, ne, ni, Tp, ProbeDia, ProbeLength in zip(*(params[name] for name in simulate.PARAMETER_NAMES)):
+        Aprobe = physics.probe_area(ProbeDia, ProbeLength)
+        Vp = physics.calculate_Vp(Te)
+        curves.append(physics.Ie(V_range, Vp, physics.calculate_Ie_sat(Te, ne, Aprobe), Te)
+                      + physics.Ip(V_range, Vp, physics.calculate_Ii_sat(Te, ni, Aprobe), Tp))
+    return np.array(curves)
+
+
+def batch_theory(params, V_range):
+    # The same stage as a single broadcast evaluation
+    Te = params['Te'][:, None]
+    Aprobe = physics.probe_area(params['ProbeDia'], params['ProbeLength'])[:, None]
+    Vp = physics.calculate_Vp(Te)
+    return (physics.Ie(V_range, Vp, physics.calculate_Ie_sat(Te, params['ne'][:, None], Aprobe), Te)
+            + physics.Ip(V_range, Vp, physics.calculate_Ii_sat(Te, params['ni'][:, None], Aprobe),
+                         params['Tp'][:, None]))
+
+
+def best_of(repeat, func, *args):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--te-points', type=int, default=50)
+    parser.add_argument('--ne-points', type=int, default=20)
+    parser.add_argument('--v-points', type=int, default=physics.V_points)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    V_range = simulate.voltage_range(V_points=args.v_points)
+    params = simulate.parameter_grid(np.linspace(0.1, 2, args.te_points),
+                                     ne=np.logspace(15, 17, args.ne_points))
+    n_curves = len(params['Te'])
+
+    t_theory_loop, theory_loop = best_of(args.repeat, legacy_theory_loop, params, V_range)
+    t_theory_batch, theory_batch = best_of(args.repeat, batch_theory, params, V_range)
+    t_loop, loop_curves = best_of(args.repeat, legacy_loop, params, V_range)
+    t_batch, batch = best_of(args.repeat, lambda: simulate.simulate_batch(V_range=V_range, **params))
+
+    print(f"{n_curves} curves x {args.v_points} points")
+    print("theory stage (Vp, Ie_sat, Ii_sat, Ie, Ip):")
+    print(f"per-curve loop : {t_theory_loop * 1e3:9.2f} ms ({n_curves / t_theory_loop:10.0f} curves/s)")
+    print(f"broadcast      : {t_theory_batch * 1e3:9.2f} ms ({n_curves / t_theory_batch:10.0f} curves/s)")
+    print(f"speedup        : {t_theory_loop / t_theory_batch:9.2f}x")
+    print(f"max |difference| = {np.max(np.abs(theory_loop - theory_batch)):.3e} A")
+    print("full simulation including knee smoothing and leakage:")
+    print(f"per-curve loop : {t_loop * 1e3:9.2f} ms ({n_curves / t_loop:10.0f} curves/s)")
+    print(f"simulate_batch : {t_batch * 1e3:9.2f} ms ({n_curves / t_batch:10.0f} curves/s)")
+    print(f"speedup        : {t_loop / t_batch:9.2f}x")
+    print(f"max |difference| = {np.max(np.abs(loop_curves - batch.total)):.3e} A")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Benchmark the knee smoothing kernels of mlmiv.smoothing over a stretch_modifier sweep.
+
+Run from the repository root:
+
+    python benchmarks/bench_smoothing.py --curves 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mlmiv import physics, simulate  # noqa: E402
+from mlmiv.smoothing import smooth_transition_curve  # noqa: E402
+from bench_simulate import legacy_smooth_transition_curve  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--curves', type=int, default=2000)
+    parser.add_argument('--stretch', type=float, nargs='+', default=[2.5, 5.0, 10.5, 20.0])
+    args = parser.parse_args()
+
+    V_range = simulate.voltage_range()
+    Te = np.linspace(0.1, 2, args.curves)
+    Vp = physics.calculate_Vp(Te)
+    Ie_values = physics.Ie(V_range, Vp[:, None], physics.calculate_Ie_sat(Te)[:, None], Te[:, None])
+    Vp_index = np.searchsorted(V_range, Vp)
+
+    smooth_transition_curve(Ie_values[:1], Vp_index[:1], 0.9, 1.0, mode='filter')  # Imports SciPy
+    print(f"{args.curves} curves x {len(V_range)} points")
+    print(f"{'stretch':>8} {'per-curve':>12} {'legacy':>12} {'fast':>12} {'filter':>12} {'speedup':>8} "
+          f"{'max rel diff':>13}")
+    for stretch in args.stretch:
+        start = time.perf_counter()
+        reference = np.array([legacy_smooth_transition_curve(row, index, 0.9, stretch)
+                              for row, index in zip(Ie_values, Vp_index)])
+        t_loop = time.perf_counter() - start
+
+        start = time.perf_counter()
+        legacy = smooth_transition_curve(Ie_values, Vp_index, 0.9, stretch, mode='legacy')
+        t_legacy = time.perf_counter() - start
+
+        start = time.perf_counter()
+        fast = smooth_transition_curve(Ie_values, Vp_index, 0.9, stretch, mode='fast')
+        t_fast = time.perf_counter() - start
+
+        start = time.perf_counter()
+        filtered = smooth_transition_curve(Ie_values, Vp_index, 0.9, stretch, mode='filter')
+        t_filter = time.perf_counter() - start
+
+        assert np.array_equal(legacy, reference), "legacy mode is not bit-for-bit identical"
+        rel = max(np.max(np.abs(result - reference)) for result in (fast, filtered)) / np.max(np.abs(reference))
+        print(f"{stretch:8.2f} {t_loop * 1e3:10.1f}ms {t_legacy * 1e3:10.1f}ms {t_fast * 1e3:10.1f}ms "
+              f"{t_filter * 1e3:10.1f}ms {t_loop / min(t_fast, t_filter):7.1f}x {rel:13.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Benchmark the surrogate index of mlmiv.surrogate: build time, lookup rate and accuracy.
+
+Curves with random Te and ne inside the index's envelope are simulated,
+averaged over noisy sweeps as in MLM-IV-SimPlot.py, and estimated from the
+index and with the graphical analysis. The median and 95th percentile of the
+relative error are printed next to the median error the index reports.
+
+Run from the repository root:
+
+    python benchmarks/bench_surrogate.py --curves 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mlmiv import analysis, noise, simulate, surrogate  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--curves', type=int, default=1000)
+    parser.add_argument('--te-points', type=int, default=surrogate.Te_points)
+    parser.add_argument('--ne-points', type=int, default=surrogate.ne_points)
+    parser.add_argument('--no-noise', action='store_true', help="estimate the noise-free model curves")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = surrogate.SurrogateIndex.build(Te=np.geomspace(*surrogate.Te_range, args.te_points),
+                                           ne=np.geomspace(*surrogate.ne_range, args.ne_points))
+    print(f"{index.summary()}; built in {time.perf_counter() - start:.2f} s")
+
+    rng = np.random.default_rng(0)
+    Te = np.exp(rng.uniform(*np.log(surrogate.Te_range), args.curves))
+    ne = np.exp(rng.uniform(*np.log(surrogate.ne_range), args.curves))
+    V_range = index.V_range
+    batch = simulate.simulate_batch(Te, ne, surrogate.ni_ratio * ne, V_range=V_range, smoothing_mode='fast')
+    currents = batch.total
+    if not args.no_noise:
+        currents, _ = noise.averaged_noisy_batch(currents, V_range, batch.Vp, seeds=0)
+
+    start = time.perf_counter()
+    estimates = index.estimate(V_range, currents)
+    t_index = time.perf_counter() - start
+    start = time.perf_counter()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        graphical = analysis.analyze_batch(V_range, currents)
+    t_graphical = time.perf_counter() - start
+
+    print(f"{args.curves} {'noise-free' if args.no_noise else 'averaged noisy'} curves: index "
+          f"{args.curves / t_index:.0f} curves/s, graphical analysis {args.curves / t_graphical:.0f} curves/s")
+    print(f"{'parameter':10} {'index median':>13} {'p95':>10} {'reported':>10} {'graphical median':>17}")
+    for name, true, reference in (('Te', Te, graphical['Te']), ('ne', ne, graphical['ne']),
+                                  ('Vp', batch.Vp, graphical['Vp_intersection'])):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            error = np.abs(estimates[name] / true - 1)
+            reference_error = np.abs(reference / true - 1)
+        reported = estimates[f'{name}_error'] / (np.abs(estimates[name]) if name == 'Vp' else 1)
+        print(f"{name:10} {np.nanmedian(error):13.2e} {np.nanpercentile(error, 95):10.2e} "
+              f"{np.nanmedian(reported):10.2e} {np.nanmedian(reference_error):17.2e}")
+
+
+if __name__ == '__main__':
+    main()
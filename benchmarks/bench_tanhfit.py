@@ -0,0 +1,53 @@
+"""Benchmark the mlmiv.tanhfit starts against the EEDF script's tanh fits on an ordered Te sweep.
+
+Run from the repository root:
+
+    python benchmarks/bench_tanhfit.py --curves 200
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mlmiv import eedf, noise, physics, simulate, tanhfit  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--curves', type=int, default=200)
+    parser.add_argument('--te-min', type=float, default=0.05)
+    parser.add_argument('--te-max', type=float, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    V = simulate.voltage_range()
+    Te = np.linspace(args.te_min, args.te_max, args.curves)
+    batch = simulate.simulate_batch(Te, physics.ne, physics.ni, physics.Tp, physics.ProbeDia, physics.ProbeLength, V)
+    averaged_noisy, _ = noise.averaged_noisy_batch(batch.total, V, batch.Vp, noise.num_samples, noise.noise_amplitude,
+                                                   noise.spawn_seeds(args.seed, args.curves))
+    middle = eedf.EEDFGrid(V).middle
+    x = V[middle]
+
+    for label, currents in (("theory", batch.total), ("averaged noisy", averaged_noisy)):
+        y = eedf.moving_average(currents)[:, middle]
+        print(f"{label}: {args.curves} curves, Te {args.te_min:g}..{args.te_max:g} eV")
+        fits = {}
+        for name, method in (("script curve_fit", 'curve_fit'), ("script least_squares", 'least_squares')):
+            fits[name] = tanhfit.fit_tanh_legacy(x, y, method)
+        for guess in ('fixed', 'data', 'warm'):
+            fits[f"analytic, {guess} start"] = tanhfit.fit_tanh(x, y, guess)
+        best = np.nanmin([np.sum((eedf.tanh_curves(x, params) - y) ** 2, axis=1) for params, _ in fits.values()],
+                         axis=0)
+        for name, (params, report) in fits.items():
+            cost = np.sum((eedf.tanh_curves(x, params) - y) ** 2, axis=1)
+            # Fits whose residual is clearly above the best one found for the same curve
+            poor = np.count_nonzero(~(cost <= best * 1.001))
+            print(f"  {name:22s} {report.elapsed * 1e3:8.1f} ms  {report.mean_nfev:5.1f} evaluations/fit  "
+                  f"{report.failures} failed  {poor} not converged")
+
+
+if __name__ == '__main__':
+    main()
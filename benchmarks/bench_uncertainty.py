@@ -0,0 +1,60 @@
+"""Benchmark the Monte-Carlo intervals of mlmiv.uncertainty: draw rate and calibration.
+
+One simulated curve is averaged over noisy sweeps with ``--realisations``
+different seeds, as in MLM-IV-SimPlot.py. The analysis of each realisation
+then gets Monte-Carlo intervals from both drawing methods. Three things are
+printed:
+
+- the rate in draws per second;
+- the mean standard deviation over the draws;
+- the actual scatter of the point estimates over the realisations, which the
+  mean standard deviation should match.
+
+The script exits with status 1 if a method draws fewer than ``--target``
+draws per curve per second.
+
+Run from the repository root:
+
+    python benchmarks/bench_uncertainty.py --draws 2000
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mlmiv import noise, simulate, uncertainty  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--draws', type=int, default=uncertainty.n_draws, help="draws per curve")
+    parser.add_argument('--realisations', type=int, default=20, help="noisy copies of the curve analysed")
+    parser.add_argument('--te', type=float, default=1.0)
+    parser.add_argument('--target', type=float, default=1000, help="required draws per curve per second")
+    args = parser.parse_args()
+
+    V_range = simulate.voltage_range()
+    batch = simulate.simulate_batch([args.te], V_range=V_range, smoothing_mode='fast')
+    curves = np.array([noise.averaged_noisy_batch(batch.total, V_range, batch.Vp, seeds=[seed])[0][0]
+                       for seed in range(args.realisations)])
+    uncertainty.analysis_intervals(V_range, curves[:1], n_draws=10)  # Warm-up (SciPy imports)
+
+    print(f"Te = {args.te} eV, {args.realisations} noisy realisations x {args.draws} draws")
+    failed = False
+    for method in uncertainty.METHODS:
+        result, report = uncertainty.analysis_intervals(V_range, curves, n_draws=args.draws, method=method, seed=0)
+        print(f"{method}: {report.summary()}")
+        for name in ('Te', 'ne', 'Vp_derivative', 'Vp_intersection'):
+            print(f"  {name:16}: mean draw std {np.nanmean(result[f'{name}_std']):.3g}, "
+                  f"scatter of the estimates {np.nanstd(result[name]):.3g}")
+        failed |= report.draws_per_second < args.target
+    if failed:
+        print(f"below the target of {args.target:.0f} draws per curve per second")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
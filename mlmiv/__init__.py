@@ -0,0 +1,10 @@
+"""Importable building blocks for the MLM-IV simulation and analysis scripts.
+
+The top-level ``MLM-IV-*.py`` scripts remain the interactive entry points; this
+package holds the vectorized engines they (and headless batch jobs) share.
+
+The physical constants and probe model live in ``mlmiv.physics``. SciPy is
+imported inside the functions that use it, and Plotly only by
+``mlmiv.figures``, so simulation workers and the command-line tools start
+with NumPy alone.
+"""
@@ -0,0 +1,339 @@
+"""Align heterogeneous archives onto one voltage grid, as a single HDF5 dataset.
+
+LMSIMData simulations and instrument captures differ in their voltage rows:
+range, number of points, sweep direction, and points measured twice (e.g.
+up and down sweeps). The batch analyses need one shared row, so
+``align_archive`` reads the sources in tasks of ``chunk_size`` curves and
+
+1. groups the curves of a task by their voltage row;
+2. per group, drops non-finite voltages, sorts the voltages and averages the
+   currents of duplicated voltages (``clean_sweep``);
+3. interpolates every curve of the group linearly onto the target grid in
+   one call (``resample_curves``); target voltages outside a curve's range
+   are ``nan`` rather than extrapolated;
+4. appends the rows to an ``mlmiv.dataset`` file whose only current kind is
+   ``aligned``.
+
+Tasks run in a process pool and are written in source order, with at most
+``2 * workers`` tasks in flight, so memory stays bounded however large the
+archive. Per row the file records the source (``source_index`` into the
+JSON ``sources`` attribute, ``source_row``), the ``kind_index`` into the
+JSON ``kinds`` attribute, the ``Te`` label where one is known, the voltage
+span, number of distinct points and merged duplicates of the source grid,
+and ``uncovered_points``, the ``nan`` target samples of the row.
+The result can be read with ``dataset.DatasetReader`` or analysed in one
+pass with ``python -m mlmiv.reprocess``; rows with uncovered samples are
+not analysed there and get ``nan`` results (``analysis.analyze_batch``).
+
+Sources are LMSIMData-style directories, ``mlmiv.dataset`` HDF5 files and
+individual 2-row ``.npy`` files of any name; ``.npy`` files that cannot be
+read or do not hold 2 rows are left out and listed in the report. The file
+is written under a temporary name and renamed when complete, so a failed
+run leaves no partial output. The target grid defaults to
+``physics.V_points`` evenly spaced voltages over the span every source
+covers.
+
+Example, from the repository root:
+
+    python -m mlmiv.align LMSIMData captures/*.npy -o archive-aligned.h5
+    python -m mlmiv.reprocess archive-aligned.h5 -o archive-results.parquet
+"""
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+from . import dataset, grid, physics, reprocess, simulate
+
+ALIGNED_KIND = 'aligned'
+
+# Alignment settings
+chunk_size = 256  # Curves read, cleaned and resampled per task
+
+
+@dataclass
+class AlignReport:
+    n_curves: int
+    n_tasks: int
+    n_grids: int  # Distinct source voltage rows, counted per task
+    merged: int  # Duplicated source points averaged away
+    uncovered: int  # Target samples outside their curve's voltage range (nan)
+    elapsed: float  # Wall time in s
+    path: str
+    rejected: list  # (path, reason) of the .npy files left out
+
+    @property
+    def curves_per_second(self):
+        return self.n_curves / self.elapsed if self.elapsed > 0 else float('inf')
+
+    def summary(self):
+        return (f"{self.n_curves} curves from {self.n_grids} source grids aligned in {self.elapsed:.2f} s "
+                f"({self.curves_per_second:.0f} curves/s, {self.n_tasks} tasks); {self.merged} duplicated "
+                f"points merged, {self.uncovered} uncovered samples, {len(self.rejected)} files rejected")
+
+
+def clean_sweep(voltage, currents):
+    """``(voltage, currents, merged)`` with increasing, distinct voltages.
+
+    Non-finite voltages are dropped, and the currents of a voltage that
+    occurs several times are averaged over their finite values. ``currents``
+    is one curve or ``(n_curves, n_points)`` on ``voltage``; ``merged`` is the
+    number of points removed as duplicates.
+    """
+    voltage = np.asarray(voltage, dtype=float)
+    currents = np.atleast_2d(np.asarray(currents, dtype=float))
+    keep = np.isfinite(voltage)
+    order = np.argsort(voltage[keep], kind='stable')
+    voltage = voltage[keep][order]
+    currents = currents[:, keep][:, order]
+    unique, first = np.unique(voltage, return_index=True)
+    merged = len(voltage) - len(unique)
+    if merged:
+        finite = np.isfinite(currents)
+        sums = np.add.reduceat(np.where(finite, currents, 0), first, axis=1)
+        counts = np.add.reduceat(finite, first, axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            currents = sums / counts
+    return unique, currents, merged
+
+
+def resample_curves(voltage, currents, target):
+    """Every row of ``currents`` on the increasing ``voltage`` row, linearly interpolated to ``target``.
+
+    Samples of ``target`` outside ``voltage[0]..voltage[-1]`` are ``nan``.
+    """
+    target = np.asarray(target, dtype=float)
+    currents = np.atleast_2d(currents)
+    if len(voltage) < 2:
+        return np.full((len(currents), len(target)), np.nan)
+    resampled = grid.resample(voltage, currents, target)
+    resampled[:, (target < voltage[0]) | (target > voltage[-1])] = np.nan
+    return resampled
+
+
+def align_curves(voltage, currents, target):
+    """``clean_sweep`` then ``resample_curves``; returns ``(aligned, merged)``."""
+    voltage, currents, merged = clean_sweep(voltage, currents)
+    return resample_curves(voltage, currents, target), merged
+
+
+def plan_tasks(sources, kind=None, timestamp=None, chunk_size=chunk_size):
+    """``reprocess.plan_tasks`` of ``sources``, with ``.npy`` file paths as tasks of their own, in source order."""
+    tasks = []
+    files = []
+    for source in list(sources) + [None]:
+        if source is not None and source.lower().endswith('.npy'):
+            files.append(source)
+            continue
+        for start in range(0, len(files), chunk_size):
+            tasks.append({'type': 'files', 'paths': files[start:start + chunk_size]})
+        files = []
+        if source is not None:
+            tasks.extend(reprocess.plan_tasks([source], kind, timestamp, chunk_size))
+    return tasks
+
+
+def _load_curve(path, mmap_mode=None):
+    # (voltage, current) of a 2-row .npy file, as convert._load_curve
+    data = np.load(path, mmap_mode=mmap_mode)
+    if data.ndim != 2 or data.shape[0] != 2:
+        raise ValueError(f"expected 2 rows (voltage, current), got shape {data.shape}")
+    return data[0], data[1]
+
+
+def _load_task(task):
+    # reprocess._load_task, extended to lists of .npy files that are not in an LMSIMData index;
+    # also returns the (path, reason) of the files left out
+    if task['type'] != 'files':
+        return reprocess._load_task(task) + ([],)
+    grids = {}
+    labels = []
+    rejected = []
+    for path in task['paths']:
+        try:
+            voltage, current = _load_curve(path)
+        except (OSError, ValueError) as error:
+            rejected.append((path, str(error)))
+            continue
+        group = grids.setdefault(voltage.tobytes(), (voltage, [], []))
+        group[1].append(current)
+        group[2].append(len(labels))
+        labels.append({'source': path, 'row': -1, 'timestamp': '', 'Te_label': np.nan, 'kind': ''})
+    groups = [(voltage, np.array(currents), np.array(positions)) for voltage, currents, positions in grids.values()]
+    return groups, labels, rejected
+
+
+def _task_voltages(task):
+    # The voltage rows of one task, reading no currents (.npy files are memory-mapped)
+    if task['type'] == 'h5':
+        with dataset.DatasetReader(task['source']) as reader:
+            return [reader.V_range]
+    if task['type'] == 'files':
+        voltages = []
+        for path in task['paths']:
+            try:
+                voltages.append(_load_curve(path, mmap_mode='r')[0])
+            except (OSError, ValueError):
+                continue  # Rejected again, and reported, when the task is aligned
+        return voltages
+    paths = [os.path.join(task['source'], name) for name in task['names']]
+    return [np.load(path, mmap_mode='r')[0] for path in paths]
+
+
+def common_span(tasks):
+    """``(V_min, V_max)`` covered by every curve of ``tasks``."""
+    V_min, V_max = -np.inf, np.inf
+    for task in tasks:
+        for voltage in _task_voltages(task):
+            voltage = np.asarray(voltage, dtype=float)
+            voltage = voltage[np.isfinite(voltage)]
+            if len(voltage):
+                V_min, V_max = max(V_min, voltage.min()), min(V_max, voltage.max())
+    if not V_min < V_max:
+        raise ValueError("the sources share no voltage range; pass V_min and V_max explicitly")
+    return float(V_min), float(V_max)
+
+
+def align_task(task, target, dtype=np.float64):
+    """Load, clean and resample one task; returns ``(params, aligned, labels, n_grids, rejected)``.
+
+    ``params`` holds the per-row provenance columns except the source and
+    kind indices, which depend on the whole run. ``rejected`` lists the
+    ``(path, reason)`` of the task's ``.npy`` files that were left out.
+    """
+    groups, labels, rejected = _load_task(task)
+    n_curves = len(labels)
+    aligned = np.empty((n_curves, len(target)), dtype=dtype)
+    params = {'source_row': np.array([label['row'] for label in labels], dtype=int),
+              'Te': np.array([label['Te_label'] for label in labels], dtype=float),
+              'V_min_source': np.empty(n_curves), 'V_max_source': np.empty(n_curves),
+              'points_source': np.empty(n_curves, dtype=int), 'merged_points': np.empty(n_curves, dtype=int)}
+    for voltage, currents, positions in groups:
+        clean_voltage, clean_currents, merged = clean_sweep(voltage, currents)
+        aligned[positions] = resample_curves(clean_voltage, clean_currents, target)
+        params['V_min_source'][positions] = clean_voltage[0] if len(clean_voltage) else np.nan
+        params['V_max_source'][positions] = clean_voltage[-1] if len(clean_voltage) else np.nan
+        params['points_source'][positions] = len(clean_voltage)
+        params['merged_points'][positions] = merged
+    params['uncovered_points'] = np.count_nonzero(np.isnan(aligned), axis=1)
+    return params, aligned, labels, len(groups), rejected
+
+
+def align_archive(sources, output, V_range=None, kind=None, timestamp=None, workers=None, chunk_size=chunk_size,
+                  dtype=np.float64, compression=None):
+    """Align every curve of ``sources`` onto ``V_range`` and write them to the dataset file ``output``.
+
+    ``V_range`` defaults to ``physics.V_points`` evenly spaced voltages over
+    ``common_span`` of the sources. ``kind`` and ``timestamp`` filter the
+    sources as in ``reprocess.plan_tasks``. ``output`` must not exist yet; it
+    is written as ``<output>.tmp`` and renamed when every task is done.
+    Returns an ``AlignReport``.
+    """
+    if os.path.exists(output):
+        raise FileExistsError(f"{output} already exists")
+    dtype = simulate.check_dtype(dtype)
+    tasks = plan_tasks(sources, kind, timestamp, chunk_size)
+    if V_range is None:
+        V_range = simulate.voltage_range(*common_span(tasks), physics.V_points)
+    V_range = np.asarray(V_range, dtype=float)
+    if len(V_range) < 2 or np.any(np.diff(V_range) <= 0):
+        raise ValueError("V_range must be increasing")
+    workers = workers or os.cpu_count() or 1
+    output_dir = os.path.dirname(output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    source_names, kind_names = [], []
+    rejected = []
+    n_curves = n_grids = merged = uncovered = 0
+    start_time = time.perf_counter()
+    # Written under a temporary name, so a failed run leaves nothing that blocks the next one
+    partial = output + '.tmp'
+    if os.path.exists(partial):
+        os.remove(partial)  # Left by a killed run; the writer would append to it
+    try:
+        with dataset.DatasetWriter(partial, V_range, kinds=(ALIGNED_KIND,), dtype=dtype,
+                                   compression=compression) as writer:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                pending = deque()
+                remaining = iter(tasks)
+                while True:
+                    # Keep a bounded number of tasks in flight and write their results in source order
+                    for task in remaining:
+                        pending.append(executor.submit(align_task, task, V_range, dtype))
+                        if len(pending) >= 2 * workers:
+                            break
+                    if not pending:
+                        break
+                    params, aligned, labels, task_grids, task_rejected = pending.popleft().result()
+                    rejected.extend(task_rejected)
+                    if not labels:
+                        continue
+                    for label_name, names in (('source', source_names), ('kind', kind_names)):
+                        index_name = f'{label_name}_index'
+                        params[index_name] = np.empty(len(labels), dtype=int)
+                        for offset, label in enumerate(labels):
+                            if label[label_name] not in names:
+                                names.append(label[label_name])
+                            params[index_name][offset] = names.index(label[label_name])
+                    writer.append(params, **{ALIGNED_KIND: aligned})
+                    n_curves += len(labels)
+                    n_grids += task_grids
+                    merged += int(params['merged_points'].sum())
+                    uncovered += int(params['uncovered_points'].sum())
+            writer.attrs['sources'] = json.dumps(source_names)
+            writer.attrs['kinds'] = json.dumps(kind_names)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    os.replace(partial, output)
+    return AlignReport(n_curves, len(tasks), n_grids, merged, uncovered, time.perf_counter() - start_time, output,
+                       rejected)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resample LMSIMData directories, HDF5 datasets and .npy files "
+                                                 "onto one voltage grid, into a single HDF5 dataset.")
+    parser.add_argument('sources', nargs='+', help="LMSIMData-style directories, .h5 dataset files and .npy files")
+    parser.add_argument('-o', '--output', required=True, help="aligned dataset file (.h5), must not exist")
+    parser.add_argument('--kind', choices=('theory', 'averaged_noisy'), default=None,
+                        help="align only this kind of curve (default: all)")
+    parser.add_argument('--timestamp', default=None, help="only files whose run timestamp starts with this")
+    parser.add_argument('--v-min', type=float, default=None, help="default: the span every source covers")
+    parser.add_argument('--v-max', type=float, default=None)
+    parser.add_argument('--v-points', type=int, default=None,
+                        help=f"target points (default: {physics.V_points}, or {grid.adaptive_points} "
+                             f"with --grid adaptive)")
+    parser.add_argument('--grid', choices=('uniform', 'adaptive'), default='uniform',
+                        help="evenly spaced target voltages, or grid.adaptive_voltage_range")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--chunk-size', type=int, default=chunk_size, help="curves per task")
+    parser.add_argument('--dtype', choices=simulate.DTYPES, default='float64',
+                        help="storage type of the aligned curves")
+    args = parser.parse_args(argv)
+
+    V_min, V_max = args.v_min, args.v_max
+    if V_min is None or V_max is None:
+        span = common_span(plan_tasks(args.sources, args.kind, args.timestamp, args.chunk_size))
+        V_min = span[0] if V_min is None else V_min
+        V_max = span[1] if V_max is None else V_max
+    if args.grid == 'adaptive':
+        V_range = grid.adaptive_voltage_range(V_points=args.v_points or grid.adaptive_points, V_min=V_min,
+                                              V_max=V_max)
+    else:
+        V_range = simulate.voltage_range(V_min, V_max, args.v_points or physics.V_points)
+    report = align_archive(args.sources, args.output, V_range, args.kind, args.timestamp, args.workers,
+                           args.chunk_size, args.dtype)
+    print(f"{report.summary()}; written to {report.path}")
+    for path, reason in report.rejected:
+        print(f"rejected {path}: {reason}")
+
+
+if __name__ == '__main__':
+    main()
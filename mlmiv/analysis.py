@@ -0,0 +1,150 @@
+"""Batch Langmuir probe analysis: the MLM-IV-Analysis.py pipeline over a curve matrix.
+
+``analyze_batch`` takes a shared voltage row and an ``(n_curves, n_points)``
+current matrix and, for every row at once,
+
+1. smooths ``dI/dV`` with a Savitzky-Golay filter and takes the highest local
+   maximum as Vp (derivative peak);
+2. fits the ion saturation region (-20..-5 V) and extends it to Vp for Ii_sat;
+3. fits ln(I - ion fit) in the retardation region (Vp - 5..Vp) for Te;
+4. fits ln(I) in the electron saturation region (>= Vp + 1);
+5. intersects the two logarithmic fits for a second Vp and Ie_sat,
+
+then derives ne and ni as the script does. The straight-line fits are closed
+form masked least squares (``mlmiv.fitting``) instead of one ``curve_fit``
+call per fit and curve.
+"""
+import numpy as np
+
+from . import grid, physics
+from .fitting import masked_linear_fit
+
+RESULT_DTYPE = np.dtype([
+    ('Te', float),  # Electron temperature in eV
+    ('Vp_derivative', float),  # Plasma potential in V from the derivative peak
+    ('Vp_intersection', float),  # Plasma potential in V from the line crossing
+    ('Ie_sat', float),  # Electron saturation current in A
+    ('Ii_sat', float),  # Ion saturation current in A
+    ('ne', float),  # Electron density in m^-3
+    ('ni', float),  # Ion density in m^-3
+])
+
+# Analysis settings (as in MLM-IV-Analysis.py)
+savgol_window = 21
+savgol_order = 3
+ion_saturation_range = (-20, -5)  # V
+retardation_width = 5  # V below Vp
+saturation_offset = 1  # V above Vp
+
+
+def smoothed_derivative(voltage, currents, window=savgol_window, order=savgol_order):
+    # Savitzky-Golay smoothed dI/dV of every row, in voltage on non-uniform grids; scipy.signal
+    # takes over a second to import, so grid.savgol_filter only loads it in the first analysis
+    return grid.savgol_filter(voltage, np.gradient(currents, voltage, axis=-1), window, order)
+
+
+def derivative_peak_index(derivative):
+    """Index of the highest strict local maximum of every row (-1 if a row has none).
+
+    Matches the ``find_peaks`` + ``argmax`` selection of the script for curves
+    whose maximum is not a flat plateau.
+    """
+    derivative = np.atleast_2d(derivative)
+    inner = derivative[:, 1:-1]
+    is_peak = (inner > derivative[:, :-2]) & (inner > derivative[:, 2:])
+    index = np.argmax(np.where(is_peak, inner, -np.inf), axis=1) + 1
+    return np.where(is_peak.any(axis=1), index, -1)
+
+
+def analyze_batch(voltage, currents, Aprobe=physics.Aprobe, return_fits=False):
+    """Analyse every row of ``currents`` (``(n_curves, n_points)``, or one curve).
+
+    Returns a structured array with the fields of ``RESULT_DTYPE``. With
+    ``return_fits=True`` a dict with the slope/intercept of the ion,
+    retardation and saturation fits and the smoothed derivative is returned as
+    well. Rows with a non-finite current are not analysed; their results and
+    fits are ``nan``.
+    """
+    voltage = np.asarray(voltage, dtype=float)
+    currents = np.atleast_2d(np.asarray(currents, dtype=float))
+    n_curves = len(currents)
+    finite = np.all(np.isfinite(currents), axis=1)
+    if not finite.all():
+        # One nan or inf near the ends makes the Savitzky-Golay filter raise for the whole batch
+        return _analyze_finite_rows(voltage, currents, finite, Aprobe, return_fits)
+    weights = None if grid.is_uniform(voltage) else np.gradient(voltage)
+
+    current_derivative = smoothed_derivative(voltage, currents)
+    peak_index = derivative_peak_index(current_derivative)
+    Vp = np.where(peak_index >= 0, voltage[peak_index], np.nan)
+    Vp_col = Vp[:, None]
+
+    # Ion saturation fit (for subtraction only), extended to Vp for Ii_sat
+    ion_saturation_mask = (voltage >= ion_saturation_range[0]) & (voltage <= ion_saturation_range[1])
+    ion_a, ion_b = masked_linear_fit(voltage, currents, ion_saturation_mask, weights)
+    Ii_sat = ion_a * Vp + ion_b
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Electron retardation region: Ln(I) after subtracting the ion fit, Vp - 5 to Vp
+        subtracted_current = currents - (ion_a[:, None] * voltage + ion_b[:, None])
+        ln_subtracted_current = np.log(np.clip(subtracted_current, 1e-15, None))
+        electron_retardation_mask = (voltage >= Vp_col - retardation_width) & (voltage <= Vp_col)
+        retardation_a, retardation_b = masked_linear_fit(voltage, ln_subtracted_current,
+                                                         electron_retardation_mask, weights)
+
+        # Electron saturation region: Ln(I) from Vp + 1 (non-positive currents are left out)
+        electron_saturation_mask = voltage >= Vp_col + saturation_offset
+        saturation_a, saturation_b = masked_linear_fit(voltage, np.log(currents), electron_saturation_mask, weights)
+
+        # Intersection of the two fits for another Vp and Ie_sat estimate
+        intersection_voltage = (saturation_b - retardation_b) / (retardation_a - saturation_a)
+        intersection_current = saturation_a * intersection_voltage + saturation_b
+
+        Te = np.abs(-1 / retardation_a)
+        Te_K = np.maximum(Te * 11600, 1e-10)
+        Ie_sat = np.exp(intersection_current)
+        ve_th = np.sqrt(8 * physics.kb * Te_K / (np.pi * physics.me))  # Thermal velocity of electrons
+        ne = Ie_sat / (0.25 * physics.e * ve_th * Aprobe)
+        # Ion density from the Bohm current
+        ni = Ii_sat / (0.6 * physics.e * Aprobe * np.sqrt(np.maximum(physics.kb * Te_K / physics.mi, 1e-10)))
+
+    result = np.empty(n_curves, dtype=RESULT_DTYPE)
+    result['Te'] = Te
+    result['Vp_derivative'] = Vp
+    result['Vp_intersection'] = intersection_voltage
+    result['Ie_sat'] = Ie_sat
+    result['Ii_sat'] = Ii_sat
+    result['ne'] = ne
+    result['ni'] = ni
+    if not return_fits:
+        return result
+    fits = {
+        'ion': (ion_a, ion_b),
+        'retardation': (retardation_a, retardation_b),
+        'saturation': (saturation_a, saturation_b),
+        'derivative': current_derivative,
+    }
+    return result, fits
+
+
+def _analyze_finite_rows(voltage, currents, finite, Aprobe, return_fits):
+    # analyze_batch of the finite rows, scattered into nan results (and fits) for all rows
+    if np.ndim(Aprobe):
+        Aprobe = np.broadcast_to(Aprobe, len(currents))[finite]
+    result = np.full(len(currents), np.nan, dtype=RESULT_DTYPE)
+    fits = {name: (np.full(len(currents), np.nan), np.full(len(currents), np.nan))
+                for name in ('ion', 'retardation', 'saturation')}
+    fits['derivative'] = np.full(currents.shape, np.nan)
+    if not finite.any():
+        return (result, fits) if return_fits else result
+    analysed = analyze_batch(voltage, currents[finite], Aprobe, return_fits)
+    result[finite] = analysed[0] if return_fits else analysed
+    if not return_fits:
+        return result
+    for name, values in analysed[1].items():
+        if name == 'derivative':
+            fits[name][finite] = values
+        else:
+            for full, part in zip(fits[name], values):
+                full[finite] = part
+    return result, fits
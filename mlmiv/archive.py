@@ -0,0 +1,140 @@
+"""Index of the 2-row ``.npy`` files in LMSIMData, with memory-mapped access.
+
+File names written by MLM-IV-SimPlot.py and ``mlmiv.runner`` look like
+
+    20241126-112819-LangmuirSIM_eV2_theory.npy
+    20241126-112819-000042-LangmuirSIM_eV0.25_averaged_noisy.npy
+
+The run timestamp, optional sweep row, Te and kind are parsed from the name;
+array shape and dtype come from the ``.npy`` header, so no curve data is read
+while indexing. The index is cached in ``.mlmiv-index.json`` inside the
+directory and rebuilt only when the directory has been modified after the
+cache was written (a file added, removed or renamed).
+"""
+import json
+import os
+import re
+from collections import namedtuple
+
+import numpy as np
+
+CACHE_NAME = '.mlmiv-index.json'
+CACHE_VERSION = 1
+
+FILENAME_PATTERN = re.compile(
+    r'^(?P<timestamp>\d{8}-\d{6})(?:-(?P<row>\d+))?-LangmuirSIM_eV(?P<Te>[0-9.eE+-]+?)'
+    r'_(?P<kind>theory|averaged_noisy)\.npy$')
+
+ArchiveEntry = namedtuple('ArchiveEntry', ['name', 'timestamp', 'row', 'Te', 'kind', 'shape', 'dtype'])
+
+
+def parse_filename(name):
+    """Return ``(timestamp, row, Te, kind)`` for an LMSIMData file name, or None."""
+    match = FILENAME_PATTERN.match(name)
+    if match is None:
+        return None
+    row = match['row']
+    return match['timestamp'], None if row is None else int(row), float(match['Te']), match['kind']
+
+
+def _read_header(path):
+    with open(path, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+    return list(shape), dtype.str
+
+
+class ArchiveIndex:
+    """Filename index of one LMSIMData-style directory."""
+
+    def __init__(self, directory='LMSIMData', use_cache=True):
+        self.directory = directory
+        self.cache_path = os.path.join(directory, CACHE_NAME)
+        self.entries = None
+        if use_cache:
+            self.entries = self._load_cache()
+        if self.entries is None:
+            self.entries = self._scan()
+            if use_cache:
+                self._write_cache()
+
+    def _load_cache(self):
+        try:
+            # Valid only if the directory was last changed strictly before the cache was written;
+            # equal times are treated as stale because of coarse file system timestamps
+            if os.stat(self.directory).st_mtime_ns >= os.stat(self.cache_path).st_mtime_ns:
+                return None
+            with open(self.cache_path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cached.get('version') != CACHE_VERSION:
+            return None
+        return [ArchiveEntry(*entry) for entry in cached['entries']]
+
+    def _write_cache(self):
+        try:
+            with open(self.cache_path, 'w') as f:
+                json.dump({'version': CACHE_VERSION, 'entries': self.entries}, f)
+        except OSError:
+            pass  # Read-only archive: index again next time
+
+    def _scan(self):
+        entries = []
+        for name in sorted(os.listdir(self.directory)):
+            parsed = parse_filename(name)
+            if parsed is None:
+                continue
+            try:
+                shape, dtype = _read_header(os.path.join(self.directory, name))
+            except (OSError, ValueError):
+                continue
+            entries.append(ArchiveEntry(name, *parsed, shape, dtype))
+        return entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    @property
+    def timestamps(self):
+        return sorted({entry.timestamp for entry in self.entries})
+
+    def select(self, Te=None, timestamp=None, kind=None, rtol=1e-9):
+        """Entries matching all given filters.
+
+        ``Te`` is a value or a sequence of values (compared with ``rtol``);
+        ``timestamp`` is a run timestamp or a prefix of one (e.g. ``'20241126'``);
+        ``kind`` is ``'theory'`` or ``'averaged_noisy'``.
+        """
+        Te_values = None if Te is None else np.atleast_1d(np.asarray(Te, dtype=float))
+        selected = []
+        for entry in self.entries:
+            if kind is not None and entry.kind != kind:
+                continue
+            if timestamp is not None and not entry.timestamp.startswith(timestamp):
+                continue
+            if Te_values is not None and not np.isclose(entry.Te, Te_values, rtol=rtol, atol=0).any():
+                continue
+            selected.append(entry)
+        return selected
+
+    def path(self, entry):
+        return os.path.join(self.directory, entry.name)
+
+    def load(self, entry, mmap_mode='r'):
+        """Memory-mapped view of one file (2 rows: voltage, current)."""
+        return np.load(self.path(entry), mmap_mode=mmap_mode)
+
+    def load_all(self, entries, mmap_mode='r'):
+        # Views for several entries; nothing is read until the arrays are used
+        return [self.load(entry, mmap_mode) for entry in entries]
+
+
+def open_archive(directory='LMSIMData', use_cache=True):
+    return ArchiveIndex(directory, use_cache)
@@ -0,0 +1,232 @@
+"""Memoized theoretical IV-curve components, keyed on the physical parameters.
+
+A ``CurveCache`` stores the ``Ie``, smoothed ``Ie``, ``Ip`` and leakage
+curves of ``mlmiv.simulate.simulate_components`` for one parameter set
+under the key (Te, ne, ni, Tp, probe geometry, voltage grid, smoothing and
+leakage modifiers). Entries live in an in-memory LRU of ``maxsize`` curves;
+with a ``directory`` every computed curve is also written there as an
+``.npz`` file, so later runs and other processes start warm.
+
+Keys use the exact float values (no rounding), so a cached curve is
+bit-identical to a freshly computed one. The voltage grid enters the key as
+a digest of its values. Cached arrays are read-only; copy before modifying.
+"""
+import hashlib
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+from . import physics, simulate
+
+COMPONENTS = ('Ie', 'smooth_Ie', 'Ie_leakage', 'Ip', 'Ip_leakage')
+SCALARS = ('Vp', 'Ie_sat', 'Ii_sat')
+default_maxsize = 256  # Curves kept in memory
+
+
+@dataclass(frozen=True)
+class TheoryCurve:
+    """Components of one theoretical IV curve on ``V_range``."""
+    V_range: np.ndarray
+    Vp: float
+    Ie_sat: float
+    Ii_sat: float
+    Ie: np.ndarray  # Electron current
+    smooth_Ie: np.ndarray  # Electron current with the rounded knee
+    Ie_leakage: np.ndarray  # Electron leakage above Vp
+    Ip: np.ndarray  # Ion current
+    Ip_leakage: np.ndarray  # Ion leakage below Vp
+
+    @property
+    def theory(self):
+        # Ie + Ip without smoothing or leakage, as saved by MLM-IV-SimPlot.py
+        return self.Ie + self.Ip
+
+    @property
+    def total(self):
+        return self.smooth_Ie + self.Ie_leakage + self.Ip + self.Ip_leakage
+
+
+def grid_digest(V_range):
+    return hashlib.sha1(np.ascontiguousarray(V_range, dtype=float).tobytes()).hexdigest()
+
+
+def _read_only(array):
+    array = np.array(array, dtype=float)
+    array.flags.writeable = False
+    return array
+
+
+class CurveCache:
+    """LRU cache of ``TheoryCurve`` objects with an optional ``.npz`` directory tier."""
+
+    def __init__(self, maxsize=default_maxsize, directory=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self._curves = OrderedDict()
+        self._grids = {}  # digest -> read-only voltage grid, shared by its curves
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._curves)
+
+    def clear(self):
+        """Empty the memory tier (the directory is left as it is)."""
+        self._curves.clear()
+        self._grids.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 'size': len(self)}
+
+    def summary(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        rate = (self.hits + self.disk_hits) / lookups if lookups else 0.0
+        return (f"{lookups} curve lookups: {self.hits} memory hits, {self.disk_hits} disk hits, "
+                f"{self.misses} computed ({rate:.1%} reused), {len(self)} curves in memory")
+
+    def key(self, Te, ne, ni, Tp, ProbeDia, ProbeLength, digest, height_modifier, stretch_modifier,
+            slope_ion, slope_electron, smoothing_mode):
+        return (float(Te), float(ne), float(ni), float(Tp), float(ProbeDia), float(ProbeLength), digest,
+                float(height_modifier), float(stretch_modifier), float(slope_ion), float(slope_electron),
+                str(smoothing_mode))
+
+    def _path(self, key):
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, f"{name}.npz")
+
+    def _store(self, key, curve):
+        self._curves[key] = curve
+        self._curves.move_to_end(key)
+        while len(self._curves) > self.maxsize:
+            self._curves.popitem(last=False)
+
+    def _lookup(self, key, V_range):
+        curve = self._curves.get(key)
+        if curve is not None:
+            self._curves.move_to_end(key)
+            self.hits += 1
+            return curve
+        if self.directory is not None:
+            path = self._path(key)
+            try:
+                with np.load(path) as stored:
+                    if str(stored['key']) == repr(key):
+                        curve = TheoryCurve(V_range, *(float(stored[name]) for name in SCALARS),
+                                            *(_read_only(stored[name]) for name in COMPONENTS))
+            except (OSError, KeyError, ValueError):  # Missing or partly written file
+                curve = None
+            if curve is not None:
+                self.disk_hits += 1
+                self._store(key, curve)
+                return curve
+        return None
+
+    def _save(self, key, curve):
+        path = self._path(key)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'wb') as file:
+            np.savez(file, key=repr(key), **{name: getattr(curve, name) for name in SCALARS + COMPONENTS})
+        os.replace(temporary, path)
+
+    def _add(self, key, V_range, computed, row):
+        # Row ``row`` of a ``CurveComponents`` as a cached TheoryCurve
+        curve = TheoryCurve(V_range, *(float(getattr(computed, name)[row]) for name in SCALARS),
+                            *(_read_only(getattr(computed, name)[row]) for name in COMPONENTS))
+        self._store(key, curve)
+        if self.directory is not None:
+            self._save(key, curve)
+        return curve
+
+    def components(self, Te, ne=physics.ne, ni=physics.ni, Tp=physics.Tp,
+                   ProbeDia=physics.ProbeDia, ProbeLength=physics.ProbeLength,
+                   V_range=None, height_modifier=simulate.height_modifier,
+                   stretch_modifier=simulate.stretch_modifier, slope_ion=simulate.slope_ion,
+                   slope_electron=simulate.slope_electron, smoothing_mode='legacy'):
+        """``CurveComponents`` of every parameter set, computing only the ones not cached.
+
+        Takes the arguments of ``simulate.simulate_components`` (broadcast the
+        same way) and returns the same result.
+        """
+        if V_range is None:
+            V_range = simulate.voltage_range()
+        V_range = np.asarray(V_range, dtype=float)
+        digest = grid_digest(V_range)
+        V_range = self._grids.setdefault(digest, _read_only(V_range))
+        arrays = np.broadcast_arrays(*[np.atleast_1d(np.asarray(v, dtype=float))
+                                       for v in (Te, ne, ni, Tp, ProbeDia, ProbeLength, height_modifier,
+                                                 stretch_modifier, slope_ion, slope_electron)])
+        params, settings = arrays[:6], arrays[6:]
+        keys = [self.key(*row[:6], digest, *row[6:], smoothing_mode) for row in zip(*arrays)]
+
+        curves = [self._lookup(key, V_range) for key in keys]
+        missing = {}  # key -> rows, so repeated parameter sets are computed once
+        for row, (key, curve) in enumerate(zip(keys, curves)):
+            if curve is None:
+                missing.setdefault(key, []).append(row)
+        if missing:
+            # One vectorized simulation for all the curves that were not found
+            rows = [group[0] for group in missing.values()]
+            computed = simulate.simulate_components(*(a[rows] for a in params), V_range=V_range,
+                                                    height_modifier=settings[0][rows],
+                                                    stretch_modifier=settings[1][rows],
+                                                    slope_ion=settings[2][rows],
+                                                    slope_electron=settings[3][rows],
+                                                    smoothing_mode=smoothing_mode)
+            self.misses += len(rows)
+            for offset, (key, group) in enumerate(missing.items()):
+                curve = self._add(key, V_range, computed, offset)
+                for row in group:
+                    curves[row] = curve
+
+        stacked = {name: np.array([getattr(curve, name) for curve in curves]) for name in SCALARS + COMPONENTS}
+        return simulate.CurveComponents(V_range=V_range,
+                                        params={name: np.ascontiguousarray(a)
+                                                for name, a in zip(simulate.PARAMETER_NAMES, params)},
+                                        **stacked)
+
+    def batch(self, *args, **kwargs):
+        """``components(...)`` as a ``SimulationBatch``, a cached ``simulate.simulate_batch``."""
+        return self.components(*args, **kwargs).batch()
+
+    def curve(self, Te, ne=physics.ne, ni=physics.ni, Tp=physics.Tp,
+              ProbeDia=physics.ProbeDia, ProbeLength=physics.ProbeLength,
+              V_range=None, height_modifier=simulate.height_modifier,
+              stretch_modifier=simulate.stretch_modifier, slope_ion=simulate.slope_ion,
+              slope_electron=simulate.slope_electron, smoothing_mode='legacy'):
+        """The ``TheoryCurve`` of one parameter set (scalars)."""
+        if V_range is None:
+            V_range = simulate.voltage_range()
+        V_range = np.asarray(V_range, dtype=float)
+        digest = grid_digest(V_range)
+        V_range = self._grids.setdefault(digest, _read_only(V_range))
+        key = self.key(Te, ne, ni, Tp, ProbeDia, ProbeLength, digest, height_modifier, stretch_modifier,
+                       slope_ion, slope_electron, smoothing_mode)
+        curve = self._lookup(key, V_range)
+        if curve is None:
+            computed = simulate.simulate_components(Te, ne, ni, Tp, ProbeDia, ProbeLength, V_range,
+                                                    height_modifier, stretch_modifier, slope_ion,
+                                                    slope_electron, smoothing_mode)
+            self.misses += 1
+            curve = self._add(key, V_range, computed, 0)
+        return curve
+
+
+# Shared by the scripts in one process; replace with configure() to resize or add a directory
+default_cache = CurveCache()
+
+
+def configure(maxsize=default_maxsize, directory=None):
+    """Replace the shared ``default_cache`` and return it."""
+    global default_cache
+    default_cache = CurveCache(maxsize, directory)
+    return default_cache
+
+
+def theory_curve(Te, **kwargs):
+    """``default_cache.curve`` (see ``CurveCache.curve``)."""
+    return default_cache.curve(Te, **kwargs)
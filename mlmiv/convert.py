@@ -0,0 +1,395 @@
+"""Incremental conversion of LMSIMData ``.npy`` curves to spreadsheets.
+
+Every 2-row ``.npy`` file of a directory (voltage, current) is written as
+``xlsx``, ``csv`` or ``parquet``, in one of three layouts:
+
+- ``files``: one output per curve with the columns ``Voltage (V)`` and
+  ``Current (A)``, as MLM-NPY-to-Excel.py always wrote;
+- ``sheets``: one workbook per run (timestamp) with a sheet per curve and an
+  ``Index`` sheet naming the file of each sheet (xlsx only);
+- ``wide``: one table per run with a column per curve, next to one shared
+  ``Voltage (V)`` column when the curves share their grid (a voltage and a
+  current column per curve when they do not).
+
+Workbooks are written row by row with a streaming writer (xlsxwriter in
+``constant_memory`` mode if it is installed, otherwise openpyxl in
+``write_only`` mode), never through a DataFrame. Outputs are converted by a
+process pool.
+
+A manifest (``.mlmiv-convert.json``) in the output directory records the
+input files of every output with their size and modification time
+(``staleness='mtime'``) or a SHA-1 of their content (``'hash'``, which also
+survives copies that reset times). An output is rewritten only if it is
+missing, one of its inputs changed, or a run gained or lost files. Outputs
+without a manifest entry (written by the old script) count as current when
+they are newer than their input.
+
+Example, from the repository root:
+
+    python -m mlmiv.convert LMSIMData --workers 4
+    python -m mlmiv.convert LMSIMData -o LMSIMData/runs --pack sheets
+    python -m mlmiv.convert LMSIMData --format parquet --pack wide --staleness hash
+"""
+import argparse
+import hashlib
+import importlib.util
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from .archive import parse_filename
+
+FORMATS = ('xlsx', 'csv', 'parquet')
+PACK_MODES = ('files', 'sheets', 'wide')
+STALENESS = ('mtime', 'hash')
+MANIFEST = '.mlmiv-convert.json'
+MANIFEST_VERSION = 1
+COLUMNS = ('Voltage (V)', 'Current (A)')
+MAX_XLSX_COLUMNS = 16384
+SHEET_NAME_LENGTH = 31  # Excel limit
+
+
+def xlsx_engine():
+    """The streaming xlsx writer to use: ``'xlsxwriter'`` if installed, else ``'openpyxl'``."""
+    for engine in ('xlsxwriter', 'openpyxl'):
+        if importlib.util.find_spec(engine) is not None:
+            return engine
+    raise ImportError("writing xlsx needs xlsxwriter or openpyxl; install one of them or write csv")
+
+
+def check_format(fmt, pack='files'):
+    """Fail early on an unknown or unavailable format/layout combination."""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}, got {fmt!r}")
+    if pack not in PACK_MODES:
+        raise ValueError(f"pack must be one of {PACK_MODES}, got {pack!r}")
+    if pack == 'sheets' and fmt != 'xlsx':
+        raise ValueError("pack='sheets' needs the xlsx format")
+    if fmt == 'xlsx':
+        xlsx_engine()
+    elif fmt == 'parquet' and importlib.util.find_spec('pyarrow') is None \
+            and importlib.util.find_spec('fastparquet') is None:
+        raise ImportError("writing Parquet needs pyarrow or fastparquet; install one of them or write csv")
+
+
+def list_curves(directory):
+    """Names of the ``.npy`` files in ``directory``, sorted."""
+    return sorted(name for name in os.listdir(directory)
+                  if name.endswith('.npy') and os.path.isfile(os.path.join(directory, name)))
+
+
+def signature(path, staleness='mtime'):
+    """What identifies the content of ``path``: ``[size, mtime_ns]`` or a SHA-1 hex digest."""
+    if staleness == 'mtime':
+        status = os.stat(path)
+        return [status.st_size, status.st_mtime_ns]
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def plan_jobs(names, fmt='xlsx', pack='files'):
+    """One ``{'output', 'inputs'}`` job per output file.
+
+    Packed layouts get one output per run timestamp; files whose names do not
+    follow the LMSIMData pattern are packed together under ``other``.
+    """
+    if pack == 'files':
+        return [{'output': f"{os.path.splitext(name)[0]}.{fmt}", 'inputs': [name]} for name in names]
+    runs = {}
+    for name in names:
+        parsed = parse_filename(name)
+        runs.setdefault('other' if parsed is None else parsed[0], []).append(name)
+    return [{'output': f"{run}-{pack}.{fmt}", 'inputs': inputs} for run, inputs in runs.items()]
+
+
+def _sheet_name(name, used):
+    # The Te, kind and sweep row identify a curve within its run; Excel allows 31 characters
+    parsed = parse_filename(name)
+    if parsed is None:
+        base = os.path.splitext(name)[0]
+    else:
+        _, row, Te, kind = parsed
+        base = f"eV{Te:g}_{kind}" if row is None else f"{row:06d}_eV{Te:g}_{kind}"
+    base = ''.join('_' if char in '[]:*?/\\' else char for char in base)[:SHEET_NAME_LENGTH]
+    sheet = base
+    for number in itertools.count(2):
+        if sheet.lower() not in used:
+            break
+        suffix = f"~{number}"
+        sheet = base[:SHEET_NAME_LENGTH - len(suffix)] + suffix
+    used.add(sheet.lower())
+    return sheet
+
+
+def _cells(values):
+    # Python floats for the writers; text columns (the Index sheet) are lists already
+    return np.asarray(values, dtype=float).tolist() if isinstance(values, np.ndarray) else list(values)
+
+
+def _rows(columns):
+    return itertools.zip_longest(*[_cells(column) for column in columns])
+
+
+def _is_finite(columns):
+    return all(np.isfinite(column).all() for column in columns if isinstance(column, np.ndarray))
+
+
+def _write_workbook(path, sheets):
+    # sheets: (name, header, columns) each, written row by row; NaN and inf become #NUM! errors
+    if xlsx_engine() == 'xlsxwriter':
+        import xlsxwriter
+        workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'nan_inf_to_errors': True})
+        for name, header, columns in sheets:
+            worksheet = workbook.add_worksheet(name)
+            worksheet.write_row(0, 0, header)
+            for number, row in enumerate(_rows(columns), 1):
+                worksheet.write_row(number, 0, row)
+        workbook.close()
+        return
+    import openpyxl
+    workbook = openpyxl.Workbook(write_only=True)
+    for name, header, columns in sheets:
+        worksheet = workbook.create_sheet(name)
+        worksheet.append(header)
+        if _is_finite(columns):
+            for row in _rows(columns):
+                worksheet.append(row)
+        else:
+            for row in _rows(columns):
+                worksheet.append([cell if not isinstance(cell, float) or np.isfinite(cell) else '#NUM!'
+                                  for cell in row])
+    workbook.save(path)
+
+
+def _write_table(path, fmt, header, columns):
+    if fmt == 'xlsx':
+        _write_workbook(path, [('Sheet1', header, columns)])
+    elif fmt == 'csv':
+        with open(path, 'w', newline='') as file:
+            file.write(','.join(header) + '\n')
+            for row in _rows(columns):
+                file.write(','.join('' if cell is None else repr(cell) for cell in row) + '\n')
+    else:
+        import pandas as pd
+        length = max(len(column) for column in columns)
+        padded = {name: np.pad(np.asarray(column, dtype=float), (0, length - len(column)), constant_values=np.nan)
+                  for name, column in zip(header, columns)}
+        pd.DataFrame(padded).to_parquet(path, index=False)
+
+
+def _load_curve(path):
+    data = np.load(path)
+    if data.ndim != 2 or data.shape[0] != 2:
+        raise ValueError(f"expected 2 rows (voltage, current), got shape {data.shape}")
+    return data[0], data[1]
+
+
+def _write_job(job, directory, path, fmt, pack):
+    """Write one output; returns ``(input name, reason)`` for the inputs that were left out."""
+    curves = []
+    errors = []
+    for name in job['inputs']:
+        try:
+            curves.append((name, *_load_curve(os.path.join(directory, name))))
+        except (OSError, ValueError) as error:
+            errors.append((name, str(error)))
+    if not curves:
+        return errors
+
+    if pack == 'files':
+        _, voltage, current = curves[0]
+        _write_table(path, fmt, COLUMNS, [voltage, current])
+    elif pack == 'sheets':
+        used = {'index'}
+        sheets = [(_sheet_name(name, used), COLUMNS, [voltage, current]) for name, voltage, current in curves]
+        index = ('Index', ('Sheet', 'File'), [[sheet[0] for sheet in sheets], [name for name, *_ in curves]])
+        _write_workbook(path, [index] + sheets)
+    else:
+        labels = [os.path.splitext(name)[0] for name, *_ in curves]
+        first = curves[0][1]
+        if all(voltage.shape == first.shape and np.array_equal(voltage, first) for _, voltage, _ in curves):
+            header = [COLUMNS[0]] + [f"{label} (A)" for label in labels]
+            columns = [first] + [current for *_, current in curves]
+        else:
+            header = [f"{label} {unit}" for label in labels for unit in ('V (V)', 'I (A)')]
+            columns = [array for _, voltage, current in curves for array in (voltage, current)]
+        if fmt == 'xlsx' and len(columns) > MAX_XLSX_COLUMNS:
+            raise ValueError(f"{len(columns)} columns do not fit on one Excel sheet; use pack='sheets' or csv")
+        _write_table(path, fmt, header, columns)
+    return errors
+
+
+def _is_current(job, directory, path, signatures, known):
+    if not os.path.exists(path):
+        return False
+    if known is not None:
+        return known == signatures
+    # No manifest entry: an output of the old script, current if newer than its inputs
+    newest = max(os.stat(os.path.join(directory, name)).st_mtime_ns for name in job['inputs'])
+    return os.stat(path).st_mtime_ns >= newest
+
+
+def convert_task(jobs, directory, output_dir, fmt='xlsx', pack='files', staleness='mtime', known=None,
+                 force=False):
+    """Convert the jobs of one task whose output is missing or stale.
+
+    ``known`` maps output names to the input signatures recorded in the
+    manifest. Returns one result dict per job with its ``status``
+    (``'written'``, ``'current'`` or ``'failed'``), the input ``signatures``,
+    the ``errors`` of inputs that could not be converted and the time taken.
+    """
+    known = known or {}
+    results = []
+    for job in jobs:
+        start = time.perf_counter()
+        path = os.path.join(output_dir, job['output'])
+        result = {'output': job['output'], 'status': 'current', 'errors': [], 'time': 0.0}
+        try:
+            signatures = {name: signature(os.path.join(directory, name), staleness) for name in job['inputs']}
+            result['signatures'] = signatures
+            if not force and _is_current(job, directory, path, signatures, known.get(job['output'])):
+                results.append(result)
+                continue
+            # Under a temporary name first, so an interrupted conversion never leaves a partial output
+            temporary = f"{path}.{os.getpid()}.tmp"
+            errors = _write_job(job, directory, temporary, fmt, pack)
+            result['errors'] = errors
+            if len(errors) == len(job['inputs']):
+                result['status'] = 'failed'
+            else:
+                os.replace(temporary, path)
+                result['status'] = 'written'
+        except (OSError, ValueError) as error:
+            result.update(status='failed', errors=[(job['output'], str(error))])
+        finally:
+            if os.path.exists(f"{path}.{os.getpid()}.tmp"):
+                os.remove(f"{path}.{os.getpid()}.tmp")
+        result['time'] = time.perf_counter() - start
+        results.append(result)
+    return results
+
+
+@dataclass
+class ConvertReport:
+    written: int
+    current: int
+    failed: int
+    workers: int
+    elapsed: float  # Wall time in s
+    errors: list = field(default_factory=list)  # (input or output name, reason)
+    times: list = field(default_factory=list)  # s per written output
+
+    def summary(self):
+        text = (f"{self.written} written, {self.current} up to date, {self.failed} failed "
+                f"with {self.workers} workers in {self.elapsed:.2f} s")
+        if self.times:
+            text += f" ({np.mean(self.times) * 1e3:.1f} ms per output)"
+        for name, reason in self.errors:
+            text += f"\n{name}: {reason}"
+        return text
+
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST)
+    try:
+        with open(path) as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    return manifest.get('outputs', {}) if manifest.get('version') == MANIFEST_VERSION else {}
+
+
+def _save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST)
+    with open(path + '.tmp', 'w') as file:
+        json.dump({'version': MANIFEST_VERSION, 'outputs': manifest}, file, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def convert(directory='LMSIMData', output_dir=None, fmt='xlsx', pack='files', staleness='mtime', workers=None,
+            chunk_size=32, force=False, progress=None):
+    """Convert the ``.npy`` curves of ``directory`` into ``output_dir``.
+
+    ``output_dir`` defaults to ``<directory>/output``. ``chunk_size`` outputs
+    of the ``files`` layout go to a worker at a time; packed outputs go one
+    by one. The manifest is updated after every task, so an interrupted
+    conversion resumes. Returns a ``ConvertReport``.
+    """
+    check_format(fmt, pack)
+    if staleness not in STALENESS:
+        raise ValueError(f"staleness must be one of {STALENESS}, got {staleness!r}")
+    output_dir = os.path.join(directory, 'output') if output_dir is None else output_dir
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = plan_jobs(list_curves(directory), fmt, pack)
+    chunk_size = chunk_size if pack == 'files' else 1
+    tasks = [jobs[start:start + chunk_size] for start in range(0, len(jobs), chunk_size)]
+    manifest = load_manifest(output_dir)
+    # Entries recorded with the other staleness mode are ignored: those outputs are judged by their
+    # modification time once and recorded again
+    known = {name: entry['inputs'] for name, entry in manifest.items() if entry.get('staleness') == staleness}
+    workers = workers or os.cpu_count() or 1
+
+    counts = {'written': 0, 'current': 0, 'failed': 0}
+    errors = []
+    times = []
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(convert_task, task, directory, output_dir, fmt, pack, staleness,
+                                   {job['output']: known[job['output']] for job in task if job['output'] in known},
+                                   force)
+                   for task in tasks]
+        for done, future in enumerate(as_completed(futures), 1):
+            results = future.result()
+            changed = False
+            for result in results:
+                counts[result['status']] += 1
+                errors.extend(result['errors'])
+                if result['status'] == 'written' or (result['status'] == 'current'
+                                                    and result['output'] not in known):
+                    manifest[result['output']] = {'inputs': result['signatures'], 'staleness': staleness}
+                    changed = True
+                if result['status'] == 'written':
+                    times.append(result['time'])
+            if changed:
+                _save_manifest(output_dir, manifest)
+            if progress is not None:
+                progress(done, len(tasks))
+    return ConvertReport(counts['written'], counts['current'], counts['failed'], workers,
+                         time.perf_counter() - start_time, errors, times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert the .npy curves of an LMSIMData directory to xlsx, "
+                                                 "CSV or Parquet, rewriting only missing or stale outputs.")
+    parser.add_argument('directory', nargs='?', default='LMSIMData')
+    parser.add_argument('-o', '--output-dir', default=None, help="default: <directory>/output")
+    parser.add_argument('--format', choices=FORMATS, default='xlsx')
+    parser.add_argument('--pack', choices=PACK_MODES, default='files',
+                        help="one output per curve, a workbook per run with a sheet per curve, "
+                             "or a table per run with a column per curve")
+    parser.add_argument('--staleness', choices=STALENESS, default='mtime',
+                        help="detect changed inputs by size and modification time, or by content hash")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--chunk-size', type=int, default=32, help="outputs per task (files layout)")
+    parser.add_argument('--force', action='store_true', help="rewrite every output")
+    args = parser.parse_args(argv)
+
+    def progress(done, total):
+        print(f"\r{done}/{total} tasks", end='', flush=True)
+
+    report = convert(args.directory, args.output_dir, args.format, args.pack, args.staleness, args.workers,
+                     args.chunk_size, args.force, progress)
+    print()
+    print(report.summary())
+
+
+if __name__ == '__main__':
+    main()
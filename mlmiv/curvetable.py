@@ -0,0 +1,48 @@
+"""Precomputed theoretical curves for interactive plots, packed as base64 float32.
+
+``curve_table`` evaluates the electron and ion currents for every step of a
+Te slider in one batch (through a ``mlmiv.cache.CurveCache``) and packs each
+matrix as little-endian float32 bytes in a base64 string. The browser decodes
+a table once (``Float32Array`` over the decoded bytes) and switches between
+slider steps without a server round-trip; the total current is ``Ie + Ip``.
+float32 keeps about 7 significant digits, plenty for plotting.
+"""
+import base64
+
+import numpy as np
+
+from . import cache
+
+FLOAT_DTYPE = '<f4'
+
+
+def slider_steps(start, stop, step):
+    """The values of a slider from ``start`` to ``stop`` (inclusive) in steps of ``step``."""
+    count = int(round((stop - start) / step)) + 1
+    return np.round(start + step * np.arange(count), 10)
+
+
+def encode(array):
+    """Base64 string of ``array`` as little-endian float32, row-major."""
+    return base64.b64encode(np.ascontiguousarray(array, dtype=FLOAT_DTYPE).tobytes()).decode('ascii')
+
+
+def decode(text, shape=None):
+    """Inverse of ``encode`` (as float32)."""
+    array = np.frombuffer(base64.b64decode(text), dtype=FLOAT_DTYPE)
+    return array if shape is None else array.reshape(shape)
+
+
+def curve_table(Te_values, V_range, curve_cache=None, **params):
+    """Packed ``Ie`` and ``Ip`` of every ``Te_values`` step on ``V_range``.
+
+    ``params`` are passed on to ``CurveCache.components`` (``ne``, ``Tp``,
+    ``ProbeDia``, ...). Returns a JSON-ready dict with the steps (``Te``),
+    the voltage row (``V``), ``n_points`` and the ``(len(Te), n_points)``
+    current matrices ``Ie`` and ``Ip``.
+    """
+    curve_cache = cache.default_cache if curve_cache is None else curve_cache
+    Te_values = np.asarray(Te_values, dtype=float)
+    components = curve_cache.components(Te_values, V_range=V_range, **params)
+    return {'Te': Te_values.tolist(), 'n_points': len(components.V_range),
+            'V': encode(components.V_range), 'Ie': encode(components.Ie), 'Ip': encode(components.Ip)}
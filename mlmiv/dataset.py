@@ -0,0 +1,189 @@
+"""Appendable single-file container for simulated IV curves (HDF5, via h5py).
+
+Instead of one 2-row ``.npy`` per curve, a dataset file holds
+
+``/V_range``
+    the shared voltage row, stored once;
+``/currents/<kind>``
+    one ``(n_curves, V_points)`` chunked array per curve kind, e.g.
+    ``theory`` and ``averaged_noisy``, all with the same rows;
+``/params/<name>``
+    one ``(n_curves,)`` array per metadata field (Te, ne, ni, Vp, noise
+    settings, seed, ...).
+
+Rows are appended in blocks and read back by slice or index list without
+loading the rest of the file.
+"""
+import numpy as np
+
+try:
+    import h5py
+except ImportError:  # h5py is listed in requirements.txt but optional for the rest of mlmiv
+    h5py = None
+
+FORMAT_VERSION = 1
+DEFAULT_CHUNK_ROWS = 256
+
+
+def _require_h5py():
+    if h5py is None:
+        raise ImportError("mlmiv.dataset needs h5py (pip install h5py)")
+
+
+class DatasetWriter:
+    """Create (or extend) a dataset file and append blocks of curves to it.
+
+    ``kinds`` names the current arrays stored per row and ``dtype`` their
+    storage type for a new file (float32 halves its size; appended blocks are
+    rounded on write). An existing file keeps its type, see ``self.dtype``.
+    Use as a context manager::
+
+        with DatasetWriter('sweep.h5', V_range) as writer:
+            writer.append({'Te': Te, 'Vp': Vp}, theory=theory, averaged_noisy=noisy)
+    """
+
+    def __init__(self, path, V_range=None, kinds=('theory', 'averaged_noisy'), dtype=np.float64,
+                 chunk_rows=DEFAULT_CHUNK_ROWS, compression=None):
+        _require_h5py()
+        self.path = path
+        self.file = h5py.File(path, 'a')
+        if 'V_range' in self.file:
+            self.V_range = self.file['V_range'][()]
+            if V_range is not None and not np.array_equal(self.V_range, V_range):
+                self.file.close()
+                raise ValueError(f"{path} already holds curves on a different voltage grid")
+        else:
+            if V_range is None:
+                self.file.close()
+                raise ValueError("V_range is required when creating a new dataset")
+            self.V_range = np.asarray(V_range, dtype=float)
+            self.file.attrs['format_version'] = FORMAT_VERSION
+            self.file.create_dataset('V_range', data=self.V_range)
+            currents = self.file.create_group('currents')
+            for kind in kinds:
+                currents.create_dataset(kind, shape=(0, len(self.V_range)), maxshape=(None, len(self.V_range)),
+                                        dtype=dtype, chunks=(chunk_rows, len(self.V_range)),
+                                        compression=compression)
+            self.file.create_group('params')
+        self.kinds = tuple(self.file['currents'])
+        self.dtype = self.file['currents'][self.kinds[0]].dtype
+
+    def __len__(self):
+        return self.file['currents'][self.kinds[0]].shape[0]
+
+    @property
+    def attrs(self):
+        # File-level metadata, e.g. the root seed of the run that produced the rows
+        return self.file.attrs
+
+    def append(self, params, **currents):
+        """Append one block of rows.
+
+        ``params`` maps metadata names to scalars or ``(n_rows,)`` arrays;
+        ``currents`` gives one ``(n_rows, V_points)`` array per kind.
+        """
+        if set(currents) != set(self.kinds):
+            raise ValueError(f"expected currents for {self.kinds}, got {tuple(currents)}")
+        n_rows = len(np.atleast_2d(next(iter(currents.values()))))
+        start = len(self)
+        for kind, values in currents.items():
+            values = np.atleast_2d(values)
+            if values.shape != (n_rows, len(self.V_range)):
+                raise ValueError(f"{kind} has shape {values.shape}, expected {(n_rows, len(self.V_range))}")
+            target = self.file['currents'][kind]
+            target.resize(start + n_rows, axis=0)
+            target[start:] = values
+        group = self.file['params']
+        for name, values in params.items():
+            values = np.broadcast_to(np.asarray(values), (n_rows,))
+            if name not in group:
+                # A field that first appears now is padded for earlier rows
+                fill = np.zeros(start, dtype=values.dtype) if values.dtype.kind in 'iu' else np.full(start, np.nan)
+                group.create_dataset(name, data=fill, maxshape=(None,), chunks=True,
+                                     dtype=values.dtype if values.dtype.kind in 'iu' else float)
+            target = group[name]
+            target.resize(start + n_rows, axis=0)
+            target[start:] = values
+        for name in set(group) - set(params):
+            target = group[name]
+            target.resize(start + n_rows, axis=0)
+            target[start:] = 0 if target.dtype.kind in 'iu' else np.nan
+        return start
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DatasetReader:
+    """Read-only view of a dataset file. Rows are only read when sliced."""
+
+    def __init__(self, path):
+        _require_h5py()
+        self.path = path
+        self.file = h5py.File(path, 'r')
+        self.V_range = self.file['V_range'][()]
+        self.kinds = tuple(self.file['currents'])
+        self.dtype = self.file['currents'][self.kinds[0]].dtype
+
+    def __len__(self):
+        return self.file['currents'][self.kinds[0]].shape[0]
+
+    @property
+    def attrs(self):
+        return dict(self.file.attrs)
+
+    @property
+    def param_names(self):
+        return tuple(self.file['params'])
+
+    def params(self, rows=slice(None), names=None):
+        # Metadata columns for the selected rows, as a dict of arrays
+        names = self.param_names if names is None else names
+        return {name: _read(self.file['params'][name], rows) for name in names}
+
+    def read(self, kind, rows=slice(None)):
+        """Return the ``kind`` currents of ``rows`` (a slice, an index, or a list/array of indices).
+
+        Negative indices count from the end, as in NumPy.
+        """
+        return _read(self.file['currents'][kind], rows)
+
+    def iter_chunks(self, kind, chunk_rows=DEFAULT_CHUNK_ROWS):
+        # Yield (start, currents) blocks so whole files can be processed in bounded memory
+        for start in range(0, len(self), chunk_rows):
+            yield start, self.read(kind, slice(start, start + chunk_rows))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _read(dataset, rows):
+    # h5py fancy indexing needs increasing, unique indices: read those, then restore the requested order
+    if isinstance(rows, (slice, int, np.integer)):
+        return dataset[rows]
+    rows = np.asarray(rows)
+    if rows.dtype == bool:
+        return dataset[np.flatnonzero(rows)]
+    n_rows = len(dataset)
+    if np.any((rows < -n_rows) | (rows >= n_rows)):
+        raise IndexError(f"row indices must be in [-{n_rows}, {n_rows}) for {n_rows} rows")
+    unique, inverse = np.unique(rows % n_rows if n_rows else rows, return_inverse=True)
+    return dataset[unique][inverse]
+
+
+def read_rows(path, kind, rows=slice(None)):
+    """Convenience wrapper: open ``path``, read ``kind`` for ``rows`` and close."""
+    with DatasetReader(path) as reader:
+        return reader.read(kind, rows)
@@ -0,0 +1,137 @@
+"""Point reduction for dense plots of noisy IV samples.
+
+Plotting every noisy sample as its own trace makes the figure grow with
+``num_samples * V_points``. These helpers reduce what is sent to the browser:
+
+- ``minmax_decimate`` keeps the lowest and highest point of each horizontal
+  pixel bin over all samples, so the envelope and outliers stay visible at
+  ``2 * n_bins`` points however many samples there are;
+- ``lttb`` (Largest-Triangle-Three-Buckets) keeps ``n_out`` points of one
+  series that preserve its visual shape;
+- ``sample_band`` gives per-voltage quantiles of the samples, for drawing
+  the noise as a shaded band.
+
+``render_stats`` reports trace and point counts, the serialized figure size
+and the time to build and serialize a Plotly figure.
+"""
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+DECIMATIONS = ('minmax', 'lttb')
+default_bins = 800  # Horizontal pixel columns of a typical plot
+
+
+def _bin_index(x, n_bins):
+    span = x[-1] - x[0]
+    if span == 0:
+        return np.zeros(len(x), dtype=int)
+    return np.minimum(((x - x[0]) / span * n_bins).astype(int), n_bins - 1)
+
+
+def minmax_decimate(x, samples, n_bins=default_bins):
+    """Min and max of ``samples`` (``(n_samples, n_points)`` or one row) per bin of ``x``.
+
+    ``x`` must be ascending. Returns ``(x_out, y_out)`` in ascending ``x``,
+    with at most ``2 * n_bins`` points placed where the extremes occur.
+    """
+    x = np.asarray(x, dtype=float)
+    samples = np.atleast_2d(np.asarray(samples, dtype=float))
+    if len(x) <= 2 * n_bins and len(samples) == 1:
+        return x, samples[0]
+    # Extremes over the samples at each voltage, then over the voltages of each bin
+    low_rows = np.argmin(samples, axis=0)
+    high_rows = np.argmax(samples, axis=0)
+    columns = np.arange(len(x))
+    low, high = samples[low_rows, columns], samples[high_rows, columns]
+    bins = _bin_index(x, n_bins)
+    starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+    # Sorting by (bin, value) puts each bin's extreme at the bin's first position
+    low_index = np.lexsort((low, bins))[starts]
+    high_index = np.lexsort((-high, bins))[starts]
+    # Keep each bin's two extremes in voltage order
+    first = np.minimum(low_index, high_index)
+    second = np.maximum(low_index, high_index)
+    first_is_low = low_index <= high_index
+    x_out = np.column_stack([x[first], x[second]]).ravel()
+    y_out = np.column_stack([np.where(first_is_low, low[first], high[first]),
+                             np.where(first_is_low, high[second], low[second])]).ravel()
+    return x_out, y_out
+
+
+def lttb(x, y, n_out=default_bins):
+    """Largest-Triangle-Three-Buckets downsampling to ``n_out`` points.
+
+    ``y`` is one series or ``(n_series, n_points)`` on the shared ``x``; all
+    series are reduced together, bucket by bucket. Returns ``(x_out, y_out)``
+    shaped like ``y`` with ``n_out`` points per series.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.broadcast_to(x, y.shape).copy(), y
+    rows = np.atleast_2d(y)
+    series = np.arange(len(rows))
+    # First and last points are kept; the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty((len(rows), n_out), dtype=int)
+    selected[:, 0], selected[:, -1] = 0, n - 1
+    previous = np.zeros(len(rows), dtype=int)
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # Average of the next bucket (the last point for the final bucket)
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = x[end:next_end].mean()
+        next_y = rows[:, end:next_end].mean(axis=1)
+        x_previous = x[previous][:, None]
+        y_previous = rows[series, previous][:, None]
+        area = np.abs((x_previous - next_x) * (rows[:, start:end] - y_previous)
+                      - (x_previous - x[start:end]) * (next_y[:, None] - y_previous))
+        previous = start + np.argmax(area, axis=1)
+        selected[:, bucket + 1] = previous
+    x_out, y_out = x[selected], np.take_along_axis(rows, selected, axis=1)
+    return (x_out[0], y_out[0]) if y.ndim == 1 else (x_out, y_out)
+
+
+def decimate_samples(x, samples, method='minmax', n_bins=default_bins):
+    """All ``samples`` merged into one ``(x, y)`` series for a single trace.
+
+    ``'minmax'`` keeps the extremes per bin over all samples; ``'lttb'``
+    downsamples each sample to ``n_bins`` points and concatenates them.
+    """
+    if method not in DECIMATIONS:
+        raise ValueError(f"method must be one of {DECIMATIONS}, got {method!r}")
+    samples = np.atleast_2d(samples)
+    if method == 'minmax':
+        return minmax_decimate(x, samples, n_bins)
+    x_out, y_out = lttb(x, samples, n_bins)
+    return x_out.ravel(), y_out.ravel()
+
+
+def sample_band(samples, quantiles=(0.0, 0.1, 0.9, 1.0)):
+    """Per-voltage ``quantiles`` of ``samples``, one row per quantile."""
+    return np.quantile(np.atleast_2d(samples), quantiles, axis=0)
+
+
+@dataclass
+class RenderStats:
+    n_traces: int
+    n_points: int  # Points over all traces
+    figure_bytes: int  # Size of the figure JSON
+    build_time: float  # s spent adding traces
+    serialize_time: float  # s to serialize the figure
+
+    def summary(self):
+        return (f"{self.n_traces} traces, {self.n_points} points, {self.figure_bytes / 1e6:.2f} MB figure; "
+                f"built in {self.build_time * 1e3:.0f} ms, serialized in {self.serialize_time * 1e3:.0f} ms")
+
+
+def render_stats(fig, build_time=0.0):
+    """``RenderStats`` of a Plotly figure (serializes it once to measure)."""
+    start = time.perf_counter()
+    size = len(fig.to_json())
+    serialize_time = time.perf_counter() - start
+    n_points = sum(len(trace.x) for trace in fig.data if trace.x is not None)
+    return RenderStats(len(fig.data), n_points, size, build_time, serialize_time)
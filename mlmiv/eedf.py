@@ -0,0 +1,246 @@
+"""Druyvesteyn EEDF analysis, as in MLM-IV-EEDF-Analysis.py, over a curve matrix.
+
+The current is smoothed, a ``tanh`` step is fitted to the -15..15 V region,
+the leakage outside that region is modelled with straight lines and partly
+removed, the ``tanh`` step is refitted to the corrected current and the EEDF
+is taken from its second derivative above Vp. Density and temperature are
+the first moments of the EEDF. The two ``tanh`` fits use ``mlmiv.tanhfit``
+(analytic Jacobian, data-driven or warm starts) unless ``fit='legacy'``.
+
+With ``E = V - Vp`` the EEDF is ``C * sqrt(E) * |I''|``, so the density
+integrand is ``C * |I''|`` and the temperature integrand ``C * E**2 * |I''|``.
+For a fixed voltage grid the integration range only depends on the first
+grid point above Vp; ``EEDFGrid`` caches the Simpson and trapezoid weights of
+each such range (with the ``1, V, V**2`` moments folded in), so the moments of
+all curves sharing a range are one matrix product.
+"""
+import numpy as np
+
+from . import grid as voltage_grid
+from . import tanhfit
+from .fitting import fit_line
+
+# Constants for EEDF calculation (as in MLM-IV-EEDF-Analysis.py)
+q_e = 1.602e-19  # Elementary charge in C
+m_e = 9.109e-31  # Electron mass in kg
+A_probe = 1.41372e-5  # Probe area in m^2
+scaling_factor = 5.5e19  # EEDF magnitude scaling
+
+# Analysis settings
+smoothing_window = 5  # Moving-average window for the current (odd)
+middle_range = (-15, 15)  # V, region of the tanh fit
+analysis_max = 20  # V, upper end of the EEDF range
+FIT_MODES = ('analytic', 'legacy')
+
+RESULT_FIELDS = ('n_e_simpson', 'n_e_trapz', 'T_e_simpson', 'T_e_trapz')
+RESULT_DTYPE = np.dtype([(name, float) for name in RESULT_FIELDS])
+
+# EEDF = eedf_constant * sqrt(E) * |d2I/dV2| with E in eV
+eedf_constant = scaling_factor * (2 / (A_probe * q_e)) * np.sqrt(2 * m_e * q_e)
+
+
+def moving_average(currents, window=smoothing_window, voltage=None):
+    # np.convolve(current, np.ones(window) / window, mode='same') of every row; on a non-uniform
+    # voltage grid the straight line through the window around each sample instead
+    if voltage is not None and not voltage_grid.is_uniform(voltage):
+        return voltage_grid.savgol_filter(voltage, currents, window, 1)
+    from scipy.ndimage import convolve1d
+    return convolve1d(np.asarray(currents, dtype=float), np.ones(window) / window, axis=-1, mode='constant')
+
+
+def trapezoid_weights(x):
+    # w such that w @ y == scipy.integrate.trapezoid(y, x=x)
+    dx = np.diff(x)
+    weights = np.zeros(len(x))
+    weights[:-1] += dx / 2
+    weights[1:] += dx / 2
+    return weights
+
+
+def simpson_weights(x):
+    # w such that w @ y == scipy.integrate.simpson(y, x=x); simpson is linear in y
+    from scipy.integrate import simpson
+    return simpson(np.eye(len(x)), x=x, axis=-1)
+
+
+class EEDFGrid:
+    """Masks and cached integration weights for one voltage grid."""
+
+    def __init__(self, voltage):
+        self.voltage = np.asarray(voltage, dtype=float)
+        V = self.voltage
+        self.middle = (V >= middle_range[0]) & (V <= middle_range[1])
+        self.low = V < middle_range[0]
+        self.high = V > middle_range[1]
+        # Points the EEDF may use: middle region up to analysis_max (the lower end follows Vp)
+        usable = np.flatnonzero(self.middle & (V <= analysis_max))
+        self.usable_start = usable[0] if len(usable) else 0
+        self.usable_end = usable[-1] + 1 if len(usable) else 0
+        self._weights = {}
+
+    def segment_start(self, Vp):
+        """Index of the first usable grid point with ``E = V - Vp > 0``."""
+        return np.maximum(np.searchsorted(self.voltage, Vp, side='right'), self.usable_start)
+
+    def weights(self, start):
+        """``(n_points, 6)`` weights of the range starting at ``start``.
+
+        Columns are the Simpson then the trapezoid weights times ``1, V, V**2``.
+        """
+        table = self._weights.get(start)
+        if table is None:
+            V = self.voltage[start:self.usable_end]
+            columns = []
+            for rule in (simpson_weights, trapezoid_weights):
+                w = rule(V)
+                columns += [w, w * V, w * V ** 2]
+            table = self._weights[start] = np.column_stack(columns)
+        return table
+
+    def moments(self, second_derivative, Vp):
+        """EEDF density and temperature of every row, as a ``RESULT_DTYPE`` array.
+
+        Rows with fewer than two points above Vp get ``nan``.
+        """
+        second_derivative = np.atleast_2d(second_derivative)
+        Vp = np.broadcast_to(np.asarray(Vp, dtype=float), len(second_derivative))
+        starts = self.segment_start(Vp)
+        sums = np.full((len(second_derivative), 6), np.nan)
+        for start in np.unique(starts):
+            if self.usable_end - start < 2:
+                continue
+            rows = np.flatnonzero(starts == start)
+            sums[rows] = np.abs(second_derivative[rows, start:self.usable_end]) @ self.weights(start)
+
+        result = np.empty(len(second_derivative), dtype=RESULT_DTYPE)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for offset, rule in ((0, 'simpson'), (3, 'trapz')):
+                m0, m1, m2 = sums[:, offset], sums[:, offset + 1], sums[:, offset + 2]
+                n_e = eedf_constant * m0
+                # Integral of E**2 |I''| with E = V - Vp, from the V moments
+                energy_moment = eedf_constant * (m2 - 2 * Vp * m1 + Vp ** 2 * m0)
+                result[f'n_e_{rule}'] = n_e
+                result[f'T_e_{rule}'] = (2 / (3 * n_e)) * energy_moment
+        return result
+
+    def eedf(self, second_derivative, Vp):
+        """Energies (eV) and EEDF of one curve, as plotted by the script."""
+        start = self.segment_start(Vp)
+        energies_eV = self.voltage[start:self.usable_end] - Vp
+        return energies_eV, eedf_constant * np.sqrt(energies_eV) * np.abs(second_derivative[start:self.usable_end])
+
+
+def tanh_curves(voltage, params):
+    # tanhfit.tanh_model of every parameter row on the voltage row
+    a, b, c, d = (params[:, i, None] for i in range(4))
+    return a * np.tanh(b * (voltage - c)) + d
+
+
+def leakage_correction(grid, currents, smoothed_currents, improved_fit, Vp):
+    """Leakage model and corrected currents of every row.
+
+    The leakage is a straight line below and above the tanh region and zero
+    in between. Half the current is removed left of the first point from 0 V
+    where the fit exceeds the leakage, and half the fit/leakage difference is
+    added from the first point above Vp where it falls below it.
+    """
+    V = grid.voltage
+    low = fit_line(V, smoothed_currents, grid.low)
+    high = fit_line(V, smoothed_currents, grid.high)
+    leakage_model = np.where(grid.low, low.slope[:, None] * V + low.intercept[:, None],
+                             np.where(grid.high, high.slope[:, None] * V + high.intercept[:, None], 0))
+    difference = improved_fit - leakage_model
+    # argmax gives 0 when there is no crossing, as in the script
+    crossing_left = np.argmax((V >= 0) & (difference > 0), axis=1)
+    crossing_right = np.argmax((V > Vp[:, None]) & (difference < 0), axis=1)
+    index = np.arange(len(V))
+    adjusted_currents = np.where(index < crossing_left[:, None], currents - 0.5 * currents, currents)
+    adjusted_currents = np.where(index >= crossing_right[:, None], adjusted_currents + 0.5 * difference,
+                                 adjusted_currents)
+    return leakage_model, adjusted_currents
+
+
+def analyze_eedf_batch(voltage, currents, Vp, grid=None, fit='analytic', warm_start=False,
+                       return_errors=False, return_curves=False, return_reports=False):
+    """EEDF density and temperature of every row of ``currents`` with plasma potentials ``Vp``.
+
+    ``currents`` is ``(n_curves, n_points)`` on the shared ``voltage`` row and
+    ``Vp`` one value per curve (V). ``fit`` is ``'analytic'`` (``mlmiv.tanhfit``
+    with data-driven starts; ``warm_start=True`` starts each row from the
+    previous one, for ordered sweeps) or ``'legacy'`` (the script's fits).
+    Returns a ``RESULT_DTYPE`` array (n_e in m^-3, T_e in eV); rows whose fits
+    fail are ``nan``. ``return_errors`` adds a list with the reason per row
+    ('' if none), ``return_curves`` a dict of the intermediate curve matrices
+    and ``return_reports`` the ``FitReport`` of both fits as a dict.
+    """
+    if fit not in FIT_MODES:
+        raise ValueError(f"fit must be one of {FIT_MODES}, got {fit!r}")
+    voltage = np.asarray(voltage, dtype=float)
+    currents = np.atleast_2d(np.asarray(currents, dtype=float))
+    Vp = np.broadcast_to(np.asarray(Vp, dtype=float), len(currents))
+    grid = EEDFGrid(voltage) if grid is None else grid
+    middle_voltage = voltage[grid.middle]
+    # On non-uniform grids each point of the tanh fits counts with its share of the voltage range
+    weights = None if voltage_grid.is_uniform(voltage) else np.gradient(middle_voltage)
+
+    smoothed_currents = moving_average(currents, voltage=voltage)
+    if fit == 'legacy':
+        popt_improved, improved_report = tanhfit.fit_tanh_legacy(middle_voltage, smoothed_currents[:, grid.middle])
+    else:
+        popt_improved, improved_report = tanhfit.fit_tanh(middle_voltage, smoothed_currents[:, grid.middle],
+                                                          'warm' if warm_start else 'data', weights=weights)
+    improved_fit = tanh_curves(voltage, popt_improved)
+    leakage_model, adjusted_currents = leakage_correction(grid, currents, smoothed_currents, improved_fit, Vp)
+
+    if fit == 'legacy':
+        popt_adjusted, adjusted_report = tanhfit.fit_tanh_legacy(middle_voltage, adjusted_currents[:, grid.middle],
+                                                                 'least_squares')
+    else:
+        # The correction only changes the tails, so the first fit is a close start
+        popt_adjusted, adjusted_report = tanhfit.fit_tanh(middle_voltage, adjusted_currents[:, grid.middle],
+                                                          'fixed', popt_improved, weights=weights)
+    adjusted_improved_fit = tanh_curves(voltage, popt_adjusted)
+    first_derivative = np.gradient(adjusted_improved_fit, voltage, axis=1)
+    second_derivative = np.gradient(first_derivative, voltage, axis=1)
+    result = grid.moments(second_derivative, Vp)
+
+    errors = [error or refit_error for error, refit_error in zip(improved_report.errors, adjusted_report.errors)]
+    for row in np.flatnonzero(np.isnan(result['n_e_simpson'])):
+        if errors[row]:
+            continue
+        if np.isnan(Vp[row]):
+            errors[row] = 'no Vp'
+        else:
+            errors[row] = f"no EEDF points between Vp = {Vp[row]:g} V and {analysis_max} V"
+    if not (return_errors or return_curves or return_reports):
+        return result
+    output = (result,)
+    if return_errors:
+        output += (errors,)
+    if return_curves:
+        output += ({'smoothed_current': smoothed_currents, 'improved_fit': improved_fit,
+                    'leakage_model': leakage_model, 'adjusted_current': adjusted_currents,
+                    'adjusted_improved_fit': adjusted_improved_fit, 'first_derivative': first_derivative,
+                    'second_derivative': second_derivative},)
+    if return_reports:
+        output += ({'improved': improved_report, 'adjusted': adjusted_report},)
+    return output
+
+
+def analyze_eedf(voltage, current, Vp, fit='analytic', return_curves=False):
+    """EEDF density and temperature of one curve with plasma potential ``Vp`` (V).
+
+    Returns a dict with ``RESULT_FIELDS`` and raises ``ValueError`` if the
+    EEDF cannot be computed. With ``return_curves=True`` the intermediate
+    curves, energies and EEDF are included as well.
+    """
+    grid = EEDFGrid(voltage)
+    result, errors, curves = analyze_eedf_batch(voltage, current, Vp, grid, fit, return_errors=True,
+                                                return_curves=True)
+    if errors[0]:
+        raise ValueError(errors[0])
+    output = {name: result[name][0] for name in RESULT_FIELDS}
+    if return_curves:
+        output.update({name: curve[0] for name, curve in curves.items()})
+        output['energies_eV'], output['eedf'] = grid.eedf(curves['second_derivative'][0], Vp)
+    return output
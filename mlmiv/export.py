@@ -0,0 +1,265 @@
+"""Headless figure export: the analysis and EEDF panels of every curve in an archive.
+
+Sources are the same as for ``mlmiv.reprocess`` (LMSIMData-style
+directories of ``.npy`` files and ``mlmiv.dataset`` HDF5 files). Each task
+of ``chunk_size`` curves is analysed as a batch and its figures
+(``mlmiv.figures``) are written as HTML, PNG or SVG by a process pool. Static
+images go through kaleido; every worker starts its renderer once and keeps it
+for all of its figures.
+
+A ``manifest.json`` in the output directory records, per figure, a hash of
+its input (voltage and current values, figure kind, format, analysis
+settings and ``FIGURE_VERSION``) and the time spent building and writing it.
+Figures whose hash is unchanged and whose file exists are skipped, so a
+report build only redraws new or changed curves.
+
+Example, from the repository root:
+
+    python -m mlmiv.export LMSIMData -o reports/figures --format png --workers 4
+    python -m mlmiv.export LMSIMData -o reports/html --figures analysis --kind averaged_noisy
+"""
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from . import analysis, eedf, reprocess
+
+FIGURES = ('analysis', 'eedf')
+FORMATS = ('html', 'png', 'svg')
+FIGURE_VERSION = 1  # Bump when mlmiv.figures changes, so existing exports are redrawn
+MANIFEST = 'manifest.json'
+default_image_width = 1200  # px, for static images of figures without a layout width
+
+
+def check_format(fmt):
+    """Fail early if ``fmt`` is unknown or static images cannot be rendered."""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}, got {fmt!r}")
+    if fmt != 'html' and importlib.util.find_spec('kaleido') is None:
+        raise ImportError(f"writing {fmt.upper()} figures needs kaleido; install it or export html")
+
+
+def figure_name(label, figure, fmt):
+    """File name of one curve's figure, after the curve's file (or dataset row).
+
+    The name carries a short hash of the absolute path of the curve's
+    directory (or dataset file), so equal file names from different sources
+    do not overwrite each other.
+    """
+    source = os.path.abspath(label['source'])
+    base = os.path.splitext(os.path.basename(source))[0]
+    if source.endswith('.h5'):
+        base = f"{base}-{label['kind']}-{label['row']:06d}"
+    else:
+        source = os.path.dirname(source)
+    tag = hashlib.sha1(source.encode()).hexdigest()[:8]
+    return f"{base}-{tag}-{figure}.{fmt}"
+
+
+def input_hash(voltage, current, figure, fmt, settings):
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(voltage, dtype=float).tobytes())
+    digest.update(np.ascontiguousarray(current, dtype=float).tobytes())
+    digest.update(json.dumps([figure, fmt, FIGURE_VERSION, settings], sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def _start_renderer(fmt):
+    # Pool initializer: kaleido keeps one renderer per process, started by its first image
+    if fmt != 'html':
+        import plotly.graph_objects as go
+        import plotly.io as pio
+        pio.to_image(go.Figure(), format=fmt)
+
+
+def _write(fig, path, fmt, include_plotlyjs):
+    # The figures are plain dicts built from validated parts, so Plotly's validation is skipped.
+    # Under a temporary name first, so an interrupted export never leaves a partial figure
+    import plotly.io as pio
+    temporary = f"{path}.{os.getpid()}.tmp"
+    if fmt == 'html':
+        pio.write_html(fig, temporary, include_plotlyjs=include_plotlyjs, validate=False)
+    else:
+        width = fig['layout'].get('width', default_image_width)
+        pio.write_image(fig, temporary, format=fmt, width=width, validate=False)
+    os.replace(temporary, path)
+
+
+def export_task(task, output_dir, figures=FIGURES, fmt='html', eedf_vp='intersection', fit='analytic',
+                known=None, include_plotlyjs='cdn'):
+    """Write the figures of one ``reprocess.plan_tasks`` task that are missing or changed.
+
+    ``known`` maps figure names to the input hash they were written with.
+    Returns ``(entries, skipped)``: a manifest entry per written figure and
+    the number of figures that were up to date.
+    """
+    from . import figures as builders  # Plotly is only needed in the workers
+
+    known = known or {}
+    settings = {'eedf_vp': eedf_vp, 'fit': fit}
+    groups, labels = reprocess._load_task(task)
+    entries = []
+    skipped = 0
+    for voltage, currents, positions in groups:
+        todo = []  # (offset in the group, figure, name, hash)
+        for offset, position in enumerate(positions):
+            for figure in figures:
+                name = figure_name(labels[position], figure, fmt)
+                digest = input_hash(voltage, currents[offset], figure, fmt, settings)
+                if known.get(name) == digest and os.path.exists(os.path.join(output_dir, name)):
+                    skipped += 1
+                else:
+                    todo.append((offset, figure, name, digest))
+        if not todo:
+            continue
+
+        # Analyse only the curves with a figure to draw, as one batch
+        offsets = sorted({offset for offset, *_ in todo})
+        row_of = {offset: row for row, offset in enumerate(offsets)}
+        subset = currents[offsets]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result, fits = analysis.analyze_batch(voltage, subset, return_fits=True)
+        if 'eedf' in figures:
+            grid = eedf.EEDFGrid(voltage)
+            Vp = result[reprocess.EEDF_VP_FIELDS[eedf_vp]]
+            _, curves = eedf.analyze_eedf_batch(voltage, subset, Vp, grid, fit, return_curves=True)
+
+        for offset, figure, name, digest in todo:
+            row = row_of[offset]
+            label = labels[positions[offset]]
+            start = time.perf_counter()
+            if figure == 'analysis':
+                fig = builders.analysis_figure(voltage, subset[row], result[row], builders.fits_row(fits, row),
+                                               title=f"{builders.ANALYSIS_TITLE} ({name.rsplit('-', 1)[0]})",
+                                               as_dict=True)
+            else:
+                fig = builders.eedf_figure(voltage, subset[row], Vp[row],
+                                           {key: curve[row] for key, curve in curves.items()}, grid,
+                                           title=f"{builders.EEDF_TITLE} ({name.rsplit('-', 1)[0]})", as_dict=True)
+            built = time.perf_counter()
+            _write(fig, os.path.join(output_dir, name), fmt, include_plotlyjs)
+            entries.append({'name': name, 'hash': digest, 'source': label['source'], 'row': label['row'],
+                            'figure': figure, 'build_time': built - start,
+                            'write_time': time.perf_counter() - built})
+    return entries, skipped
+
+
+@dataclass
+class ExportReport:
+    written: int
+    skipped: int
+    tasks: int
+    workers: int
+    elapsed: float  # Wall time in s
+    timings: list = field(default_factory=list)  # Manifest entries of the figures written in this run
+
+    def summary(self):
+        text = (f"{self.written} figures written, {self.skipped} up to date, from {self.tasks} tasks "
+                f"with {self.workers} workers in {self.elapsed:.2f} s")
+        if self.timings:
+            build = np.array([entry['build_time'] for entry in self.timings])
+            write = np.array([entry['write_time'] for entry in self.timings])
+            slowest = max(self.timings, key=lambda entry: entry['build_time'] + entry['write_time'])
+            text += (f"\nper figure: build {build.mean() * 1e3:.1f} ms, write {write.mean() * 1e3:.1f} ms "
+                     f"(mean); slowest {slowest['name']} at "
+                     f"{(slowest['build_time'] + slowest['write_time']) * 1e3:.0f} ms")
+        return text
+
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file).get('figures', {})
+
+
+def _save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST)
+    with open(path + '.tmp', 'w') as file:
+        json.dump({'version': FIGURE_VERSION, 'figures': manifest}, file, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def export_figures(sources, output_dir, figures=FIGURES, fmt='html', kind=None, timestamp=None, workers=None,
+                   chunk_size=16, eedf_vp='intersection', fit='analytic', force=False, include_plotlyjs='cdn',
+                   progress=None):
+    """Write the ``figures`` of every curve in ``sources`` to ``output_dir``.
+
+    Unchanged figures are skipped unless ``force``. The manifest is updated
+    after every task, so an interrupted export resumes. ``include_plotlyjs``
+    is passed to ``write_html`` (``'cdn'``, ``True`` to embed, or
+    ``'directory'``). Returns an ``ExportReport``.
+    """
+    check_format(fmt)
+    unknown = set(figures) - set(FIGURES)
+    if unknown:
+        raise ValueError(f"figures must be among {FIGURES}, got {sorted(unknown)}")
+    if eedf_vp not in reprocess.EEDF_VP_FIELDS:
+        raise ValueError(f"eedf_vp must be one of {tuple(reprocess.EEDF_VP_FIELDS)}, got {eedf_vp!r}")
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = reprocess.plan_tasks(sources, kind, timestamp, chunk_size)
+    manifest = load_manifest(output_dir)
+    known = {} if force else {name: entry['hash'] for name, entry in manifest.items()}
+    workers = workers or os.cpu_count() or 1
+
+    timings = []
+    skipped = 0
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_start_renderer, initargs=(fmt,)) as executor:
+        futures = [executor.submit(export_task, task, output_dir, tuple(figures), fmt, eedf_vp, fit, known,
+                                   include_plotlyjs)
+                   for task in tasks]
+        for done, future in enumerate(as_completed(futures), 1):
+            entries, task_skipped = future.result()
+            skipped += task_skipped
+            timings.extend(entries)
+            if entries:
+                manifest.update({entry['name']: entry for entry in entries})
+                _save_manifest(output_dir, manifest)
+            if progress is not None:
+                progress(done, len(tasks), len(entries))
+    return ExportReport(len(timings), skipped, len(tasks), workers, time.perf_counter() - start_time, timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write the analysis and EEDF figures of every curve in "
+                                                 "LMSIMData directories and HDF5 datasets.")
+    parser.add_argument('sources', nargs='+', help="LMSIMData-style directories and/or .h5 dataset files")
+    parser.add_argument('-o', '--output-dir', required=True, help="directory for the figures and manifest")
+    parser.add_argument('--format', choices=FORMATS, default='html')
+    parser.add_argument('--figures', choices=FIGURES, nargs='+', default=list(FIGURES))
+    parser.add_argument('--kind', choices=('theory', 'averaged_noisy'), default=None,
+                        help="export only this kind of curve (default: all)")
+    parser.add_argument('--timestamp', default=None, help="only files whose run timestamp starts with this")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--chunk-size', type=int, default=16, help="curves per task")
+    parser.add_argument('--eedf-vp', choices=tuple(reprocess.EEDF_VP_FIELDS), default='intersection',
+                        help="which Vp of the Langmuir analysis the EEDF uses")
+    parser.add_argument('--fit', choices=eedf.FIT_MODES, default='analytic', help="EEDF tanh fits")
+    parser.add_argument('--plotlyjs', choices=('cdn', 'inline', 'directory'), default='cdn',
+                        help="HTML only: load plotly.js from the CDN, embed it, or share one copy in the directory")
+    parser.add_argument('--force', action='store_true', help="redraw every figure, changed or not")
+    args = parser.parse_args(argv)
+
+    def progress(done, total, n_written):
+        print(f"\r{done}/{total} tasks", end='', flush=True)
+
+    include_plotlyjs = True if args.plotlyjs == 'inline' else args.plotlyjs
+    report = export_figures(args.sources, args.output_dir, args.figures, args.format, args.kind, args.timestamp,
+                            args.workers, args.chunk_size, args.eedf_vp, args.fit, args.force, include_plotlyjs,
+                            progress)
+    if report.tasks:
+        print()
+    print(report.summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""Plotly figures of the analysis scripts, for one curve at a time.
+
+``analysis_figure`` is the 2x2 panel of MLM-IV-Analysis.py (I-V curve,
+smoothed derivative with Vp, ion saturation fit, ln(I) with the retardation
+and saturation fits and their intersection) and ``eedf_figure`` the panel of
+MLM-IV-EEDF-Analysis.py (leakage correction, first and second derivative of
+the tanh fit, EEDF). Both take precomputed batch results for the row, so a
+batch can be analysed once and plotted curve by curve, or compute them when
+they are not given.
+
+The figures are assembled as plain dicts on a cached ``make_subplots``
+layout: Plotly's per-call validation (``add_trace``, ``add_vline``, ...)
+costs far more than drawing these panels. They are returned as
+``go.Figure``, or with ``as_dict=True`` as the dict itself for
+``plotly.io.write_html``/``write_image`` with ``validate=False``.
+"""
+import copy
+from functools import lru_cache
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.subplots as sp
+
+from . import analysis, eedf
+
+ANALYSIS_TITLE = "Langmuir Probe Analysis with Fits and Intersection"
+EEDF_TITLE = "Langmuir Probe Analysis"
+ANALYSIS_PANELS = ("I-V Curve", "Derivative of I-V Curve", "Ion Saturation Fit",
+                   "Ln(I) After Subtraction with Fits and Intersection")
+EEDF_PANELS = ("Current with Refined Leakage Correction (Adjusted)", "First Derivative of Adjusted Improved Fit",
+               "Second Derivative of Adjusted Improved Fit", "Electron Energy Distribution Function (EEDF)")
+
+
+@lru_cache(maxsize=None)
+def _subplot_layout(titles):
+    return sp.make_subplots(rows=2, cols=2, subplot_titles=titles).layout.to_plotly_json()
+
+
+def _axis_suffix(row, col):
+    index = (row - 1) * 2 + col
+    return '' if index == 1 else str(index)
+
+
+def _trace(row, col, x, y, **properties):
+    axis = _axis_suffix(row, col)
+    return dict(type='scatter', x=x, y=y, xaxis=f'x{axis}', yaxis=f'y{axis}', **properties)
+
+
+def _reference_line(layout, vertical, position, row, col, line, text):
+    # What add_vline/add_hline draw: a line across the panel and a label at its end
+    axis = _axis_suffix(row, col)
+    if vertical:
+        layout['shapes'].append(dict(type='line', x0=position, x1=position, xref=f'x{axis}', y0=0, y1=1,
+                                     yref=f'y{axis} domain', line=line))
+        layout['annotations'].append(dict(x=position, xref=f'x{axis}', y=1, yref=f'y{axis} domain', text=text,
+                                          showarrow=False, xanchor='left', yanchor='top'))
+    else:
+        layout['shapes'].append(dict(type='line', y0=position, y1=position, yref=f'y{axis}', x0=0, x1=1,
+                                     xref=f'x{axis} domain', line=line))
+        layout['annotations'].append(dict(y=position, yref=f'y{axis}', x=1, xref=f'x{axis} domain', text=text,
+                                          showarrow=False, xanchor='right', yanchor='bottom'))
+
+
+def _figure(panels, traces, title, **layout_properties):
+    layout = copy.deepcopy(_subplot_layout(panels))
+    layout.setdefault('shapes', [])
+    layout.setdefault('annotations', [])
+    layout['title'] = {'text': title}
+    layout.update(layout_properties)
+    return {'data': traces, 'layout': layout}
+
+
+def fits_row(fits, row):
+    """One row of the ``fits`` dict of ``analysis.analyze_batch(..., return_fits=True)``."""
+    return {name: value[row] if name == 'derivative' else (value[0][row], value[1][row])
+            for name, value in fits.items()}
+
+
+def analysis_figure(voltage, current, result=None, fits=None, title=ANALYSIS_TITLE, as_dict=False):
+    """The MLM-IV-Analysis.py figure of one curve.
+
+    ``result`` is the curve's ``analysis.RESULT_DTYPE`` record and ``fits``
+    its ``fits_row``; both are computed when ``result`` is None.
+    """
+    voltage = np.asarray(voltage, dtype=float)
+    current = np.asarray(current, dtype=float)
+    if result is None:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            results, batch_fits = analysis.analyze_batch(voltage, current, return_fits=True)
+        result, fits = results[0], fits_row(batch_fits, 0)
+    Vp = result['Vp_derivative']
+    Ii_sat = result['Ii_sat']
+    ion_a, ion_b = fits['ion']
+    retardation_a, retardation_b = fits['retardation']
+    saturation_a, saturation_b = fits['saturation']
+    intersection_voltage = result['Vp_intersection']
+    intersection_current = saturation_a * intersection_voltage + saturation_b
+
+    ion_saturation_mask = (voltage >= analysis.ion_saturation_range[0]) & (voltage <= analysis.ion_saturation_range[1])
+    ion_saturation_fit = ion_a * voltage + ion_b
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ln_subtracted_current = np.log(np.clip(current - ion_saturation_fit, 1e-15, None))
+    shown = voltage >= -5  # Part of the ln(I) panel that is plotted, as in the script
+    retardation_line = retardation_a * voltage + retardation_b
+    saturation_line = saturation_a * voltage + saturation_b
+
+    traces = [
+        _trace(1, 1, voltage, current, mode='lines', name="I-V Curve"),
+        _trace(1, 2, voltage, fits['derivative'], mode='lines', name="dI/dV", line=dict(color="red")),
+        _trace(2, 1, voltage, current, mode='lines', name="I-V Curve"),
+        _trace(2, 1, voltage[ion_saturation_mask], current[ion_saturation_mask], mode='markers',
+               name="Ion Saturation Region"),
+        _trace(2, 1, voltage, ion_saturation_fit, mode='lines', line=dict(color="green"),
+               name="Ion Saturation Fit (Full Range)"),
+        _trace(2, 2, voltage[shown], ln_subtracted_current[shown], mode='markers', name="Ln(I) After Subtraction"),
+        _trace(2, 2, voltage[shown], retardation_line[shown], mode='lines', line=dict(color="cyan"),
+               name="Retardation Fit"),
+        _trace(2, 2, voltage[shown], saturation_line[shown], mode='lines', line=dict(color="magenta", dash="dash"),
+               name="Saturation Fit"),
+    ]
+    figure = _figure(ANALYSIS_PANELS, traces, title, height=800, showlegend=True)
+    layout = figure['layout']
+    if np.isfinite(Vp):
+        _reference_line(layout, True, Vp, 1, 2, dict(color="purple", dash="dash"), f"Vp={Vp:.2f} V")
+    if np.isfinite(Ii_sat):
+        _reference_line(layout, False, Ii_sat, 2, 1, dict(color="blue", dash="dot"), f"Ii_sat={Ii_sat:.2e} A")
+    if np.isfinite(intersection_current) and np.isfinite(intersection_voltage):
+        _reference_line(layout, False, intersection_current, 2, 2, dict(color="purple", dash="dot"),
+                        f"Ie_sat={np.exp(intersection_current):.2e} A")
+        _reference_line(layout, True, intersection_voltage, 2, 2, dict(color="purple", dash="dot"),
+                        f"Vp={intersection_voltage:.2f} V")
+    return figure if as_dict else go.Figure(figure)
+
+
+def eedf_figure(voltage, current, Vp, curves=None, grid=None, title=EEDF_TITLE, fit='analytic', as_dict=False):
+    """The MLM-IV-EEDF-Analysis.py figure of one curve with plasma potential ``Vp`` (V).
+
+    ``curves`` is the curve's row of the ``return_curves`` dict of
+    ``eedf.analyze_eedf_batch``; it is computed (with ``fit``) when None.
+    """
+    voltage = np.asarray(voltage, dtype=float)
+    grid = eedf.EEDFGrid(voltage) if grid is None else grid
+    if curves is None:
+        _, batch_curves = eedf.analyze_eedf_batch(voltage, current, Vp, grid, fit, return_curves=True)
+        curves = {name: curve[0] for name, curve in batch_curves.items()}
+    energies_eV, eedf_values = grid.eedf(curves['second_derivative'], Vp)
+
+    traces = [
+        _trace(1, 1, voltage, current, mode='lines', name='Original Current', line=dict(dash='dash', color='blue')),
+        _trace(1, 1, voltage, curves['leakage_model'], mode='lines', name='Leakage Model',
+               line=dict(dash='dot', color='red')),
+        _trace(1, 1, voltage, curves['adjusted_current'], mode='lines', name='Adjusted Current',
+               line=dict(color='green')),
+        _trace(1, 1, voltage, curves['adjusted_improved_fit'], mode='lines', name='Adjusted Improved Fit',
+               line=dict(color='orange')),
+        _trace(1, 2, voltage, curves['first_derivative'], mode='lines', name='First Derivative',
+               line=dict(color='purple')),
+        _trace(2, 1, voltage, curves['second_derivative'], mode='lines', name='Second Derivative',
+               line=dict(color='brown')),
+        _trace(2, 2, energies_eV, eedf_values, mode='lines', name='EEDF', line=dict(color='black')),
+    ]
+    figure = _figure(EEDF_PANELS, traces, title, height=800, width=1200)
+    layout = figure['layout']
+    for (row, col), (x_title, y_title) in {(1, 1): ('Voltage (V)', 'Current (I)'), (1, 2): ('Voltage (V)', 'dI/dV'),
+                                           (2, 1): ('Voltage (V)', 'd^2I/dV^2'), (2, 2): ('Energy (eV)', 'EEDF')}.items():
+        axis = _axis_suffix(row, col)
+        layout[f'xaxis{axis}']['title'] = {'text': x_title}
+        layout[f'yaxis{axis}']['title'] = {'text': y_title}
+    return figure if as_dict else go.Figure(figure)
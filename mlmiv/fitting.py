@@ -0,0 +1,87 @@
+"""Closed-form straight-line fits over batches of masked segments.
+
+The analysis scripts fit ``a * x + b`` with ``scipy.optimize.curve_fit``; for a
+straight line the (weighted) least-squares solution is exact and O(n), so here
+it is computed directly for every row of a curve matrix at once, each row with
+its own mask and optional weights.
+
+Standard errors follow ``curve_fit``'s default (``absolute_sigma=False``): the
+parameter covariance is scaled by the reduced chi-square of the residuals.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+
+def linear_func(x, a, b):
+    return a * x + b
+
+
+class LineFit(namedtuple('LineFit', ['slope', 'intercept', 'slope_se', 'intercept_se', 'r2', 'n'])):
+    """Result of ``fit_line``; every field is a scalar or one value per row."""
+    __slots__ = ()
+
+    @property
+    def params(self):
+        # (a, b) in the order curve_fit returns them for linear_func
+        return np.array([self.slope, self.intercept])
+
+
+def fit_line(x, y, mask=None, weights=None):
+    """Weighted least-squares fit of ``y ~ a * x + b`` for every row of ``y``.
+
+    ``x`` is a shared ``(n_points,)`` row or an ``(n_curves, n_points)``
+    matrix, ``y`` is ``(n_curves, n_points)`` or a single curve. ``mask``
+    selects the points used (shared row or per row; default: all) and
+    ``weights`` are ``1 / sigma**2`` of each point (default: 1). Points where
+    ``y`` is not finite are left out. Rows with fewer than two usable points
+    give ``nan``; standard errors need at least three.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    single = y.ndim == 1
+    y = np.atleast_2d(y)
+    use = np.isfinite(y)
+    if mask is not None:
+        use &= np.asarray(mask, dtype=bool)
+    x = np.broadcast_to(x, y.shape)
+    w = use.astype(float)
+    if weights is not None:
+        w *= np.broadcast_to(np.asarray(weights, dtype=float), y.shape)
+    y = np.where(use, y, 0)
+    n = use.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Centre on the weighted means first (two-pass form, no cancellation in Sxx)
+        sw = w.sum(axis=1)
+        x_mean = np.einsum('ij,ij->i', w, x) / sw
+        y_mean = np.einsum('ij,ij->i', w, y) / sw
+        dx = np.where(use, x - x_mean[:, None], 0)
+        dy = y - y_mean[:, None]
+        wdx = w * dx
+        sxx = np.einsum('ij,ij->i', wdx, dx)
+        slope = np.einsum('ij,ij->i', wdx, dy) / sxx
+        intercept = y_mean - slope * x_mean
+
+        residual = dy - slope[:, None] * dx
+        ss_res = np.einsum('ij,ij,ij->i', w, residual, residual)
+        ss_tot = np.einsum('ij,ij,ij->i', w, dy, dy)
+        r2 = 1 - ss_res / ss_tot
+        reduced_chi2 = ss_res / (n - 2)
+        slope_se = np.sqrt(reduced_chi2 / sxx)
+        intercept_se = np.sqrt(reduced_chi2 * (1 / sw + x_mean ** 2 / sxx))
+
+    enough = n >= 2
+    slope = np.where(enough, slope, np.nan)
+    intercept = np.where(enough, intercept, np.nan)
+    r2 = np.where(enough, r2, np.nan)
+    slope_se = np.where(n >= 3, slope_se, np.nan)
+    intercept_se = np.where(n >= 3, intercept_se, np.nan)
+    if single:
+        return LineFit(slope[0], intercept[0], slope_se[0], intercept_se[0], r2[0], n[0])
+    return LineFit(slope, intercept, slope_se, intercept_se, r2, n)
+
+
+def masked_linear_fit(x, y, mask=None, weights=None):
+    """Just the ``(slope, intercept)`` of ``fit_line``."""
+    fit = fit_line(x, y, mask, weights)
+    return fit.slope, fit.intercept
@@ -0,0 +1,160 @@
+"""Voltage grids: the scripts' uniform sweep, adaptive grids dense around the knee, and filters for both.
+
+The scripts sweep ``np.linspace(V_min, V_max, V_points)``, which spends most
+points on the straight saturation regions while the knee around Vp, where
+the smoothing, the derivatives and the fits change fastest, gets the same
+0.04 V spacing; at Te = 0.1 eV that is less than a point per e-fold of the
+retardation current. ``adaptive_voltage_range`` instead places ``V_points``
+by the curvature of the model (``simulate.simulate_batch``) over a set of
+temperatures: the density follows ``sqrt(|I''| / max|I|)`` of each curve,
+averaged over the temperatures, plus a uniform share (``uniform_fraction``)
+that keeps the saturation regions sampled for the line fits.
+
+The package takes the voltage row as an array everywhere, so a non-uniform
+grid passes through simulation, storage (``.npy`` rows and HDF5 ``V_range``),
+the derivatives (``np.gradient``) and the EEDF integrals unchanged. Only the
+steps that count samples need the grid:
+
+- the knee smoothing is defined in samples of a uniform grid. On other grids
+  it is evaluated on the uniform grid of the same span with
+  ``physics.V_points`` samples (``smoothing_reference``) and interpolated,
+  so the knee has the same width in volts as the scripts';
+- ``savgol_filter`` fits the local polynomials in voltage rather than in
+  sample index. On uniform grids it is ``scipy.signal.savgol_filter``;
+- the straight-line fits of ``analysis.analyze_batch`` and the ``tanh`` fits
+  of ``eedf.analyze_eedf_batch`` weight every point by its spacing
+  (``np.gradient(voltage)``), so the dense knee does not outweigh the
+  saturation regions and the fits agree with those on the uniform sweep.
+
+Grids whose steps differ from their mean by less than ``uniform_rtol`` count
+as uniform, so measured sweeps with a little jitter keep the scripts'
+filters.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from . import physics
+
+uniform_rtol = 0.01  # Relative step deviation up to which a grid counts as uniform
+uniform_fraction = 0.25  # Share of the adaptive grid's points spread uniformly
+adaptive_points = 250  # Default size of an adaptive grid
+density_points = 8001  # Uniform samples on which the model curvature is evaluated
+adaptive_Te = tuple(np.geomspace(0.1, 2.0, 16))  # eV, temperatures an adaptive grid resolves by default
+
+
+def is_uniform(voltage, rtol=uniform_rtol):
+    voltage = np.asarray(voltage, dtype=float)
+    if len(voltage) < 3:
+        return True
+    steps = np.diff(voltage)
+    mean_step = (voltage[-1] - voltage[0]) / (len(voltage) - 1)
+    return bool(np.all(np.abs(steps - mean_step) <= rtol * abs(mean_step)))
+
+
+def smoothing_reference(V_range, smoothing_points=None):
+    """Uniform grid the knee smoothing on ``V_range`` is defined on, or ``None`` for ``V_range`` itself.
+
+    ``smoothing_points`` defaults to ``len(V_range)`` for uniform grids (the
+    scripts' behaviour) and to ``physics.V_points`` for other grids.
+    """
+    V_range = np.asarray(V_range, dtype=float)
+    uniform = is_uniform(V_range)
+    if smoothing_points is None:
+        smoothing_points = len(V_range) if uniform else physics.V_points
+    if uniform and smoothing_points == len(V_range):
+        return None
+    return np.linspace(V_range[0], V_range[-1], smoothing_points)
+
+
+def linear_interpolation(source, target):
+    """``(index, fraction)`` with ``value(target) = (1 - fraction) * value[index] + fraction * value[index + 1]``.
+
+    ``source`` is increasing; targets outside it take the end values, as
+    with ``np.interp``.
+    """
+    source = np.asarray(source, dtype=float)
+    index = np.clip(np.searchsorted(source, target, side='right') - 1, 0, len(source) - 2)
+    fraction = np.clip((target - source[index]) / (source[index + 1] - source[index]), 0, 1)
+    return index, fraction
+
+
+def resample(source, values, target):
+    """Every row of ``values`` on the ``source`` voltages, linearly interpolated to ``target``."""
+    source = np.asarray(source, dtype=float)
+    target = np.asarray(target, dtype=float)
+    if len(source) == len(target) and np.array_equal(source, target):
+        return values
+    index, fraction = linear_interpolation(source, target)
+    return values[..., index] * (1 - fraction) + values[..., index + 1] * fraction
+
+
+@lru_cache(maxsize=32)
+def _savgol_weights(voltage_bytes, window, order, deriv):
+    # First sample and (n_points, window) weights of the local polynomial fit around every sample
+    voltage = np.frombuffer(voltage_bytes)
+    n_points = len(voltage)
+    first = np.clip(np.arange(n_points) - window // 2, 0, n_points - window)
+    offsets = voltage[first[:, None] + np.arange(window)] - voltage[:, None]
+    scale = np.max(np.abs(offsets), axis=1, keepdims=True)  # Keeps the Vandermonde matrices well conditioned
+    vandermonde = (offsets / scale)[..., None] ** np.arange(order + 1)
+    # Row deriv of the pseudo-inverse gives coefficient deriv of the fit, i.e. the deriv-th derivative / deriv!
+    weights = np.linalg.pinv(vandermonde)[:, deriv, :] * (np.prod(np.arange(1, deriv + 1)) / scale ** deriv)
+    return first, weights
+
+
+def savgol_filter(voltage, values, window, order, deriv=0):
+    """Savitzky-Golay filter of every row of ``values`` (last axis) on the ``voltage`` grid.
+
+    On a uniform grid this is ``scipy.signal.savgol_filter`` (``mode='interp'``).
+    Otherwise every sample is replaced by the value (or ``deriv``-th
+    derivative) at its voltage of a degree-``order`` least-squares
+    polynomial in V through the ``window`` samples around it; near the ends
+    the first or last full window is used, as ``mode='interp'`` does.
+    """
+    voltage = np.asarray(voltage, dtype=float)
+    if is_uniform(voltage):
+        from scipy.signal import savgol_filter as uniform_savgol_filter
+        delta = (voltage[-1] - voltage[0]) / (len(voltage) - 1) if len(voltage) > 1 else 1.0
+        if deriv:
+            return uniform_savgol_filter(values, window, order, deriv=deriv, delta=delta, axis=-1)
+        return uniform_savgol_filter(values, window, order, axis=-1)
+    first, weights = _savgol_weights(np.ascontiguousarray(voltage).tobytes(), window, order, deriv)
+    values = np.asarray(values, dtype=float)
+    filtered = np.zeros(values.shape)
+    for k in range(window):
+        filtered += weights[:, k] * values[..., first + k]
+    return filtered
+
+
+def _cumulative(x, y):
+    # Cumulative trapezoid integral of every row of y over x, starting at 0
+    steps = (y[..., 1:] + y[..., :-1]) / 2 * np.diff(x)
+    return np.concatenate([np.zeros(steps.shape[:-1] + (1,)), np.cumsum(steps, axis=-1)], axis=-1)
+
+
+def adaptive_voltage_range(Te=adaptive_Te, V_points=adaptive_points, V_min=physics.V_min, V_max=physics.V_max,
+                           uniform_fraction=uniform_fraction, **model):
+    """``V_points`` increasing voltages from ``V_min`` to ``V_max``, dense where the model curves bend.
+
+    ``Te`` are the temperatures (eV) the grid should resolve, e.g. the Te
+    values of a sweep; ``model`` holds further ``simulate_batch`` options
+    (``ne``, ``ni``, the smoothing and leakage modifiers) of the curves whose
+    curvature is used.
+    """
+    from . import simulate
+    if not 0 < uniform_fraction <= 1:
+        raise ValueError(f"uniform_fraction must be in (0, 1], got {uniform_fraction!r}")
+    fine = np.linspace(V_min, V_max, density_points)
+    model.setdefault('smoothing_mode', 'fast')
+    curves = simulate.simulate_batch(np.unique(np.atleast_1d(np.asarray(Te, dtype=float))), V_range=fine,
+                                     smoothing_points=physics.V_points, **model).total
+    curvature = np.abs(np.gradient(np.gradient(curves, fine, axis=1), fine, axis=1))
+    curvature /= np.max(np.abs(curves), axis=1, keepdims=True)
+    density = np.sqrt(curvature)
+    density /= _cumulative(fine, density)[:, -1:]  # Each temperature gets the same share
+    density = uniform_fraction / (V_max - V_min) + (1 - uniform_fraction) * density.mean(axis=0)
+    cumulative = _cumulative(fine, density)
+    voltages = np.interp(np.linspace(0, cumulative[-1], V_points), cumulative, fine)
+    voltages[[0, -1]] = V_min, V_max
+    return voltages
@@ -0,0 +1,354 @@
+"""Inverse fits: the simulator's forward model fitted to measured IV curves, a batch at a time.
+
+MLM-IV-Analysis.py estimates the plasma parameters graphically, from straight
+lines on ln(I). ``fit_curves`` instead fits the model of MLM-IV-SimPlot.py
+(``simulate.model_currents``: Ie with the smoothed knee, Ip, and the ion and
+electron leakage) to every row of a current matrix by least squares.
+
+- Te, ne, ni, Vp, slope_ion, slope_electron and height_modifier are fitted
+  with Levenberg-Marquardt iterations run for the whole batch together. One
+  model call per iteration evaluates every curve at all of its
+  forward-difference steps, which gives the Jacobians of all curves at once;
+  the damped normal equations are then solved as one stacked
+  ``np.linalg.solve``. A rejected step is retried with more damping on the
+  same Jacobian, and a curve leaves the batch when it has converged.
+- stretch_modifier only sets the integer window sizes of the knee smoothing,
+  so it has no useful derivative. After a first fit at the starting value,
+  the cost of every curve is evaluated for each of ``stretch_candidates``,
+  and the curves with a better candidate are fitted again from there.
+
+The model calls are many and small, so the knee is smoothed with the
+``'filter'`` mode of ``mlmiv.smoothing`` (``smoothing_mode``), which has no
+Python loop over the samples. Chunks of ``chunk_size`` curves are fitted
+independently, in a process pool when ``workers`` is more than one.
+
+Te, ne and ni are fitted as logarithms, so they stay positive and share one
+scale. ne and height_modifier only enter the model as their product, so by
+default height_modifier is held at the simulator's value (``default_fixed``);
+hold ne instead to fit the height. Starting values come from
+``analysis.analyze_batch`` (the graphical method) and a straight-line fit of
+the electron saturation region.
+"""
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+from . import analysis, physics, simulate
+from .fitting import masked_linear_fit
+
+FIT_PARAMETERS = ('Te', 'ne', 'ni', 'Vp', 'slope_ion', 'slope_electron', 'height_modifier', 'stretch_modifier')
+LOG_PARAMETERS = ('Te', 'ne', 'ni')
+INVERSE_DTYPE = np.dtype([(name, float) for name in FIT_PARAMETERS] + [
+    ('rms', float),  # Root mean square of the weighted residuals (A without sigma)
+    ('iterations', int),  # Levenberg-Marquardt iterations, both passes
+    ('success', bool),  # Converged within the iteration limit, to a finite cost
+])
+
+# Fit settings
+default_fixed = {'height_modifier': simulate.height_modifier}  # ne and height only appear as ne * height
+stretch_candidates = tuple(np.arange(1, 20.5, 0.5))  # Smoothing spreads tried for every curve
+max_iterations = 50
+coarse_iterations = 8  # Iterations before the first stretch_modifier search
+stretch_rounds = 4  # Searches of stretch_modifier, each followed by a fit of the curves that changed
+neighbours = 2  # Candidates on either side of the current spread tried after the first search
+ftol = 1e-6  # Converged when a step lowers the cost by less than this fraction
+xtol = 1e-8  # or changes no parameter by more than this (relative)
+initial_damping = 1e-3
+max_damping = 1e4  # A curve whose steps all fail up to this damping has converged
+fd_step = 1e-7  # Relative forward-difference step, of max(|parameter|, its scale)
+parameter_scale = {'Te': 1, 'ne': 1, 'ni': 1, 'Vp': 1, 'slope_ion': 1e-5, 'slope_electron': 1e-5,
+                   'height_modifier': 1}  # Typical size of each fitted value (logarithms for Te, ne, ni)
+smoothing_mode = 'filter'  # Knee smoothing of the model; see mlmiv.smoothing
+chunk_size = 256  # Curves fitted together; bounds the Jacobian to chunk_size * V_points * 7 values
+
+
+@dataclass
+class InverseReport:
+    n_fits: int
+    elapsed: float  # Wall time in s
+    iterations: np.ndarray  # Levenberg-Marquardt iterations per curve
+    model_rows: int  # Curves evaluated by the forward model, steps and candidates included
+    success: np.ndarray  # Per curve
+    free: tuple  # Parameters that were fitted (stretch_modifier by the candidate search)
+
+    @property
+    def failures(self):
+        return int(self.n_fits - np.count_nonzero(self.success))
+
+    @property
+    def curves_per_second(self):
+        return self.n_fits / self.elapsed if self.elapsed > 0 else float('inf')
+
+    def summary(self):
+        mean_iterations = float(np.mean(self.iterations)) if self.n_fits else 0.0
+        return (f"{self.n_fits} inverse fits of {', '.join(self.free)} in "
+                f"{self.elapsed:.2f} s ({self.curves_per_second:.0f} curves/s), {mean_iterations:.1f} iterations "
+                f"per curve, {self.model_rows / max(self.n_fits, 1):.0f} model curves per fit, "
+                f"{self.failures} failed")
+
+
+def initial_guess(voltage, currents, Aprobe=physics.Aprobe, height_modifier=simulate.height_modifier):
+    """Starting values (name -> one value per curve) from the graphical analysis of ``currents``."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result, fits = analysis.analyze_batch(voltage, currents, Aprobe, return_fits=True)
+        Vp = np.where(np.isfinite(result['Vp_intersection']), result['Vp_intersection'], result['Vp_derivative'])
+        Vp = np.where((Vp > voltage[0]) & (Vp < voltage[-1]), Vp, voltage[np.argmax(fits['derivative'], axis=1)])
+        Te = result['Te']
+        Te = np.where(np.isfinite(Te) & (Te > 0), Te, 1.0)
+        # Model saturation currents: h * Ie_sat is reached at Vp, the ion fit extended to Vp is -Ii_sat
+        ne = result['Ie_sat'] / (height_modifier * physics.calculate_Ie_sat(Te, 1.0, Aprobe))
+        ni = -result['Ii_sat'] / physics.calculate_Ii_sat(Te, 1.0, Aprobe)
+        slope_electron, _ = masked_linear_fit(voltage, currents, voltage >= Vp[:, None] + analysis.saturation_offset)
+    slope_ion = fits['ion'][0]
+
+    def valid(value, default, positive=True):
+        ok = np.isfinite(value) & (value > 0) if positive else np.isfinite(value)
+        return np.where(ok, value, default)
+
+    return {'Te': Te, 'ne': valid(ne, physics.ne), 'ni': valid(ni, physics.ni), 'Vp': Vp,
+            'slope_ion': valid(slope_ion, simulate.slope_ion, False),
+            'slope_electron': valid(slope_electron, simulate.slope_electron, False),
+            'height_modifier': np.broadcast_to(np.asarray(height_modifier, dtype=float), Te.shape).copy(),
+            'stretch_modifier': np.full(len(Te), simulate.stretch_modifier)}
+
+
+class _Problem:
+    # One chunk of curves: the model, residuals and Jacobians of any subset of its rows
+
+    def __init__(self, voltage, currents, weights, values, free, Tp, Aprobe):
+        self.voltage = voltage
+        self.currents = currents
+        self.weights = weights
+        self.values = values  # name -> (n,) values; the free ones are replaced by each theta
+        self.free = free
+        self.Tp = Tp
+        self.Aprobe = Aprobe
+        self.scale = np.array([parameter_scale[name] for name in free])
+        self.model_rows = 0
+        self._buffers = None
+
+    def theta(self):
+        return np.column_stack([np.log(self.values[name]) if name in LOG_PARAMETERS else self.values[name]
+                                for name in self.free])
+
+    def parameters(self, theta, rows):
+        # Model inputs of the curves rows (repeated as needed) for the (len(rows), n_free) theta
+        values = {name: value[rows] for name, value in self.values.items()}
+        for column, name in enumerate(self.free):
+            values[name] = np.exp(theta[:, column]) if name in LOG_PARAMETERS else theta[:, column]
+        return values
+
+    def model(self, theta, rows):
+        """``(len(rows), V_points)`` model currents of ``rows`` at ``theta``, in a reused buffer."""
+        values = self.parameters(theta, rows)
+        n_rows, n_points = len(rows), len(self.voltage)
+        if self._buffers is None or len(self._buffers[0]) < n_rows:
+            self._buffers = tuple(np.empty((n_rows, n_points)) for _ in range(2))
+        self.model_rows += n_rows
+        with np.errstate(over='ignore', invalid='ignore'):  # Trial steps may overflow; they are then rejected
+            _, total = simulate.model_currents(
+                self.voltage, values['Te'], values['Vp'],
+                physics.calculate_Ie_sat(values['Te'], values['ne'], self.Aprobe),
+                physics.calculate_Ii_sat(values['Te'], values['ni'], self.Aprobe), self.Tp, values['height_modifier'],
+                values['stretch_modifier'], values['slope_ion'], values['slope_electron'],
+                smoothing_mode=smoothing_mode, out=tuple(buffer[:n_rows] for buffer in self._buffers))
+        return total
+
+    def residuals(self, theta, rows):
+        return (self.model(theta, rows) - self.currents[rows]) * self.weights[rows]
+
+    def jacobian(self, theta, rows, residuals):
+        # Forward differences of all rows and parameters from one model call
+        n_rows, n_free = theta.shape
+        steps = fd_step * np.maximum(np.abs(theta), self.scale)
+        shifted = np.repeat(theta, n_free, axis=0)
+        shifted[np.arange(len(shifted)), np.tile(np.arange(n_free), n_rows)] += steps.ravel()
+        stepped = self.residuals(shifted, np.repeat(rows, n_free)).reshape(n_rows, n_free, -1)
+        stepped -= residuals[:, None, :]
+        stepped /= steps[:, :, None]
+        return stepped  # (n_rows, n_free, V_points), i.e. the transposed Jacobian
+
+
+def _levenberg_marquardt(problem, theta, rows, iteration_limit=max_iterations):
+    # Fit the curves rows from theta. Returns theta, the sum of squared residuals, the iterations
+    # and whether each row converged
+    n_rows, n_free = theta.shape
+    theta = theta.copy()
+    residuals = problem.residuals(theta, rows)
+    cost = np.einsum('ij,ij->i', residuals, residuals)
+    damping = np.full(n_rows, initial_damping)
+    iterations = np.zeros(n_rows, dtype=int)
+    normal = np.empty((n_rows, n_free, n_free))
+    gradient = np.empty((n_rows, n_free))
+    active = np.isfinite(cost)
+    converged = ~active  # A non-finite start is final
+    stale = active.copy()  # Rows whose Jacobian must be (re)computed
+    for _ in range(iteration_limit):
+        if not active.any():
+            break
+        update = np.flatnonzero(stale & active)
+        if len(update):
+            jacobian_t = problem.jacobian(theta[update], rows[update], residuals[update])
+            normal[update] = np.einsum('nik,njk->nij', jacobian_t, jacobian_t)
+            gradient[update] = np.einsum('nik,nk->ni', jacobian_t, residuals[update])
+        current = np.flatnonzero(active)
+        diagonal = np.diagonal(normal[current], axis1=1, axis2=2)
+        diagonal = np.maximum(diagonal, 1e-12 * diagonal.max(axis=1, keepdims=True) + np.finfo(float).tiny)
+        damped = normal[current] + (damping[current, None] * diagonal)[:, :, None] * np.eye(n_free)
+        step = -np.linalg.solve(damped, gradient[current][:, :, None])[:, :, 0]
+        trial = theta[current] + step
+        trial_residuals = problem.residuals(trial, rows[current])
+        trial_cost = np.einsum('ij,ij->i', trial_residuals, trial_residuals)
+        iterations[current] += 1
+
+        better = trial_cost < cost[current]
+        accepted = current[better]
+        small_step = np.all(np.abs(step[better]) <= xtol * (np.abs(trial[better]) + xtol), axis=1)
+        small_gain = cost[accepted] - trial_cost[better] <= ftol * cost[accepted]
+        theta[accepted] = trial[better]
+        residuals[accepted] = trial_residuals[better]
+        cost[accepted] = trial_cost[better]
+        damping[accepted] = np.maximum(damping[accepted] / 10, 1e-12)
+        rejected = current[~better]
+        damping[rejected] *= 10
+        stale[:] = False
+        stale[accepted] = True
+        done = np.concatenate([accepted[small_step | small_gain], rejected[damping[rejected] > max_damping]])
+        active[done] = False
+        converged[done] = True
+    return theta, cost, iterations, converged
+
+
+def _fit_chunk(voltage, currents, weights, start, fixed, Tp, Aprobe, candidates):
+    height = fixed.get('height_modifier', simulate.height_modifier)
+    values = initial_guess(voltage, currents, Aprobe, np.broadcast_to(height, (len(currents),)))
+    for name, value in start.items():
+        value = np.broadcast_to(np.asarray(value, dtype=float), (len(currents),))
+        values[name] = np.where(np.isfinite(value), value, values[name])
+    for name, value in fixed.items():
+        values[name] = np.broadcast_to(np.asarray(value, dtype=float), (len(currents),)).copy()
+    free = tuple(name for name in FIT_PARAMETERS[:-1] if name not in fixed)
+    problem = _Problem(voltage, currents, weights, values, free, Tp, Aprobe)
+    rows = np.arange(len(currents))
+
+    if 'stretch_modifier' in fixed or not len(candidates):
+        theta, cost, iterations, converged = _levenberg_marquardt(problem, problem.theta(), rows)
+    else:
+        # A short fit at the starting spread, then alternate between trying every candidate spread
+        # at the current parameters and fitting the curves that moved (or had not converged)
+        theta, cost, iterations, converged = _levenberg_marquardt(problem, problem.theta(), rows,
+                                                                  coarse_iterations)
+        candidates = np.sort(np.asarray(candidates, dtype=float))
+        searched = rows
+        for _ in range(stretch_rounds):
+            problem.values.update(problem.parameters(theta, rows))
+            stretch = problem.values['stretch_modifier']
+            if searched is rows:
+                tried = np.broadcast_to(candidates[:, None], (len(candidates), len(rows)))
+            else:
+                # After the first search only the neighbouring candidates of each curve's spread
+                position = np.searchsorted(candidates, stretch)
+                tried = candidates[np.clip(position + np.arange(-neighbours, neighbours + 1)[:, None],
+                                           0, len(candidates) - 1)]
+            candidate_cost = np.full(tried.shape, np.inf)
+            for k in range(len(tried)):
+                problem.values['stretch_modifier'] = np.where(np.isin(rows, searched), tried[k], stretch)
+                residuals = problem.residuals(theta[searched], searched)
+                candidate_cost[k, searched] = np.einsum('ij,ij->i', residuals, residuals)
+            candidate_cost[~np.isfinite(candidate_cost)] = np.inf
+            best = np.argmin(candidate_cost, axis=0)
+            improved = candidate_cost[best, rows] < cost
+            problem.values['stretch_modifier'] = np.where(improved, tried[best, rows], stretch)
+            cost = np.where(improved, candidate_cost[best, rows], cost)
+            refit = rows[improved | ~converged]
+            if not len(refit):
+                break
+            theta[refit], cost[refit], more, converged[refit] = _levenberg_marquardt(problem, theta[refit], refit)
+            iterations[refit] += more
+            searched = refit
+
+    fitted = problem.parameters(theta, rows)
+    result = np.empty(len(rows), dtype=INVERSE_DTYPE)
+    for name in FIT_PARAMETERS:
+        result[name] = fitted[name]
+    n_points = np.count_nonzero(weights, axis=1)
+    result['rms'] = np.sqrt(cost / np.maximum(n_points, 1))
+    result['iterations'] = iterations
+    result['success'] = converged & np.isfinite(cost) & np.all(np.isfinite(theta), axis=1)
+    return result, problem.model_rows
+
+
+def fit_curves(voltage, currents, sigma=None, start=None, fixed=None, Tp=physics.Tp, Aprobe=physics.Aprobe,
+               candidates=stretch_candidates, chunk_size=chunk_size, workers=None):
+    """Fit the forward model to every row of ``currents`` on the shared ``voltage`` row.
+
+    ``sigma`` is the current uncertainty (scalar, per point or per curve and
+    point; default: unweighted). ``start`` overrides the starting value of
+    any of ``FIT_PARAMETERS`` (non-finite values keep the graphical start)
+    and ``fixed`` holds parameters at a value instead of fitting them
+    (scalars or one value per curve; default ``default_fixed``, pass ``{}``
+    to fit all). ``candidates`` are the
+    stretch_modifier values tried for every curve. Non-finite current
+    samples are left out. The chunks are fitted by ``workers`` processes
+    (default: all cores; ``1`` fits in this process), and are made smaller
+    when there are fewer than one per worker. Returns ``(result, report)``: a structured array
+    with the fields of ``INVERSE_DTYPE`` and an ``InverseReport``.
+    """
+    voltage = np.asarray(voltage, dtype=float)
+    currents = np.atleast_2d(np.asarray(currents, dtype=float))
+    fixed = dict(default_fixed if fixed is None else fixed)
+    start = dict(start or {})
+    unknown = (set(fixed) | set(start)) - set(FIT_PARAMETERS)
+    if unknown:
+        raise ValueError(f"unknown fit parameters: {sorted(unknown)}; expected names from {FIT_PARAMETERS}")
+    weights = np.broadcast_to(1.0 if sigma is None else 1 / np.asarray(sigma, dtype=float), currents.shape)
+    finite = np.isfinite(currents)
+    weights = np.where(finite, weights, 0.0)
+    currents = np.where(finite, currents, 0.0)
+
+    def rows_of(value, rows):
+        value = np.asarray(value, dtype=float)
+        return np.broadcast_to(value, (len(currents),))[rows] if value.ndim else value
+
+    n_fits = len(currents)
+    workers = workers or os.cpu_count() or 1
+    chunk_size = max(1, min(chunk_size, -(-n_fits // workers)))
+    result = np.empty(n_fits, dtype=INVERSE_DTYPE)
+    model_rows = 0
+    start_time = time.perf_counter()
+
+    def chunk_arguments(rows):
+        return (voltage, currents[rows], weights[rows],
+                {name: rows_of(value, rows) for name, value in start.items()},
+                {name: rows_of(value, rows) for name, value in fixed.items()}, Tp, Aprobe, candidates)
+
+    chunks = [slice(first, first + chunk_size) for first in range(0, n_fits, chunk_size)]
+    if workers == 1 or len(chunks) < 2:
+        for rows in chunks:
+            result[rows], chunk_rows = _fit_chunk(*chunk_arguments(rows))
+            model_rows += chunk_rows
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            remaining = iter(chunks)
+            while True:
+                # Keep a bounded number of chunks in flight, as in runner.run_sweep
+                for rows in remaining:
+                    pending.append((rows, executor.submit(_fit_chunk, *chunk_arguments(rows))))
+                    if len(pending) >= 2 * workers:
+                        break
+                if not pending:
+                    break
+                rows, future = pending.popleft()
+                result[rows], chunk_rows = future.result()
+                model_rows += chunk_rows
+    free = tuple(name for name in FIT_PARAMETERS if name not in fixed)
+    if not len(candidates):
+        free = free[:-1] if free[-1:] == ('stretch_modifier',) else free
+    report = InverseReport(n_fits, time.perf_counter() - start_time, result['iterations'], model_rows,
+                           result['success'], free)
+    return result, report
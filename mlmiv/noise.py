@@ -0,0 +1,120 @@
+"""Gaussian measurement noise for simulated IV curves, with reproducible seeding.
+
+The noise model is the one of MLM-IV-SimPlot.py: zero-mean Gaussian noise of
+standard deviation ``noise_amplitude``, weighted by ``1 - |V - Vp| / max|V - Vp|``
+so it is largest around the plasma potential.
+
+Each curve draws from its own ``numpy.random.Generator``. Give ``seed`` as an
+int, a ``SeedSequence`` or a ``Generator``; ``spawn_seeds`` derives independent
+per-curve seeds from one root seed, so a curve's noise does not depend on how a
+sweep is split into batches or workers.
+
+``add_gaussian_noise`` fills a pre-allocated ``(num_samples, V_points)`` buffer
+(needed when every sample is plotted). ``noise_statistics`` only keeps the
+running mean and variance, so memory stays at ``chunk_size * V_points``
+regardless of ``num_samples``.
+"""
+import numpy as np
+
+# Default noise parameters (as in MLM-IV-SimPlot.py)
+num_samples = 10  # Number of noisy samples to generate
+noise_amplitude = 0.00008  # Amplitude of Gaussian noise
+
+
+def curve_rng(seed=None):
+    # Generator for one curve; a Generator passed in is used as is
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.default_rng(seed)
+
+
+def spawn_seeds(root_seed, n_curves):
+    """Return ``n_curves`` independent child ``SeedSequence`` objects of ``root_seed``."""
+    if not isinstance(root_seed, np.random.SeedSequence):
+        root_seed = np.random.SeedSequence(root_seed)
+    return root_seed.spawn(n_curves)
+
+
+def noise_factor(V_range, Vp):
+    # Weight 1 at Vp falling linearly to 0 at the sweep end furthest from Vp
+    distance_from_Vp = np.abs(V_range - Vp)
+    max_distance = np.max(distance_from_Vp, axis=-1, keepdims=True)
+    return 1 - (distance_from_Vp / max_distance)
+
+
+def add_gaussian_noise(It_values, V_range, Vp, num_samples=num_samples,
+                       noise_amplitude=noise_amplitude, seed=None, out=None):
+    """Return ``num_samples`` noisy copies of ``It_values`` as a ``(num_samples, V_points)`` array.
+
+    The samples are drawn straight into ``out`` when given (shape
+    ``(num_samples, V_points)``, float64), otherwise into a new buffer.
+    """
+    rng = curve_rng(seed)
+    if out is None:
+        out = np.empty((num_samples, len(It_values)))
+    rng.standard_normal(out=out)
+    out *= noise_amplitude * noise_factor(V_range, Vp)
+    out += It_values
+    return out
+
+
+def noise_statistics(It_values, V_range, Vp, num_samples=num_samples,
+                     noise_amplitude=noise_amplitude, seed=None, chunk_size=256, ddof=0):
+    """Return the mean and variance over ``num_samples`` noisy copies of ``It_values``.
+
+    Samples are generated ``chunk_size`` at a time into one reused buffer and
+    folded into a running mean and sum of squared deviations (Welford's update,
+    merged per chunk with Chan et al.'s pairwise formula). Nothing of size
+    ``num_samples`` is ever held in memory.
+    """
+    rng = curve_rng(seed)
+    weight = noise_amplitude * noise_factor(V_range, Vp)
+    buffer = np.empty((min(chunk_size, num_samples), len(It_values)))
+    mean = np.zeros(len(It_values))
+    m2 = np.zeros(len(It_values))
+    count = 0
+    while count < num_samples:
+        chunk = buffer[:min(len(buffer), num_samples - count)]
+        rng.standard_normal(out=chunk)
+        chunk *= weight
+        chunk += It_values
+        chunk_count = len(chunk)
+        chunk_mean = chunk.mean(axis=0)
+        chunk -= chunk_mean
+        chunk_m2 = np.einsum('ij,ij->j', chunk, chunk)
+        total = count + chunk_count
+        delta = chunk_mean - mean
+        mean += delta * (chunk_count / total)
+        m2 += chunk_m2 + delta ** 2 * (count * chunk_count / total)
+        count = total
+    variance = m2 / max(count - ddof, 1)
+    return mean, variance
+
+
+def averaged_noisy_batch(It_values, V_range, Vp, num_samples=num_samples,
+                         noise_amplitude=noise_amplitude, seeds=None, chunk_size=256, dtype=float, out=None):
+    """Averaged noisy curve for every row of an ``(n_curves, V_points)`` matrix.
+
+    ``seeds`` holds one seed per row (see ``spawn_seeds``); when it is an int,
+    ``SeedSequence`` or ``None`` it is used as the root for per-row seeds.
+    ``noise_amplitude`` is a scalar or one value per row.
+    Returns ``(mean, variance)``, both ``(n_curves, V_points)`` of ``dtype``
+    or written into the pair of arrays ``out``; the mean may go straight
+    over ``It_values``, as each row is read before it is overwritten. The
+    statistics are always accumulated in float64; only the stored rows are
+    rounded to ``dtype``.
+    """
+    It_values = np.atleast_2d(It_values)
+    Vp = np.broadcast_to(np.asarray(Vp, dtype=float), (len(It_values),))
+    amplitude = np.broadcast_to(np.asarray(noise_amplitude, dtype=float), (len(It_values),))
+    if seeds is None or isinstance(seeds, (int, np.integer, np.random.SeedSequence)):
+        seeds = spawn_seeds(seeds, len(It_values))
+    if out is None:
+        mean = np.empty_like(It_values, dtype=dtype)
+        variance = np.empty_like(It_values, dtype=dtype)
+    else:
+        mean, variance = out
+    for row, (curve, curve_Vp, curve_amplitude, seed) in enumerate(zip(It_values, Vp, amplitude, seeds)):
+        mean[row], variance[row] = noise_statistics(curve, V_range, curve_Vp, num_samples,
+                                                    curve_amplitude, seed, chunk_size)
+    return mean, variance
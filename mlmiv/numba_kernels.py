@@ -0,0 +1,74 @@
+"""Numba-compiled fused kernel for ``simulate.simulate_batch(..., backend='numba')``.
+
+Importing this module needs numba; ``mlmiv.simulate`` only imports it when
+the numba backend is selected. ``fused_rows`` computes the theoretical and
+the total current of every curve in one parallel loop over the curves,
+writing straight into the two output matrices: no ``(n_curves, V_points)``
+temporaries are allocated for the clipped exponents, ``np.where`` branches,
+smoothing or leakage terms, only two float64 rows per curve for the
+electron current and the knee smoothing. The outputs may be float64 or
+float32; either way every value is computed in float64 and rounded once when
+stored. The arithmetic follows ``mlmiv.physics`` and
+``mlmiv.smoothing`` operation by operation; only the summation order of the
+knee smoothing windows differs from ``np.mean`` (rounding level).
+"""
+import math
+
+import numpy as np
+from numba import njit, prange
+
+exponent_limit = 700.0  # As the np.clip in mlmiv.physics.Ie and Ip
+
+
+@njit(parallel=True, cache=True)
+def fused_rows(V, Te, Tp, Vp, Ie_sat, Ii_sat, height_modifier, start, end, window_size, slope_electron,
+               slope_ion, theory, total):
+    """Fill ``theory`` (Ie + Ip) and ``total`` (smoothed Ie + leakage + Ip) row by row.
+
+    Every parameter is one value per row (float, except the int smoothing
+    bounds ``start``, ``end`` and ``window_size`` of
+    ``smoothing.transition_bounds``). ``theory`` and ``total`` are
+    ``(n_curves, len(V))`` float64 or float32 arrays and are overwritten.
+    """
+    n_curves, n_points = total.shape
+    for row in prange(n_curves):
+        vp = Vp[row]
+        ie_row = np.empty(n_points)
+        total_row = np.empty(n_points)
+        # Electron current, and the height-scaled copy to be smoothed
+        for j in range(n_points):
+            if V[j] < vp:
+                exponent = min(max((V[j] - vp) / Te[row], -exponent_limit), exponent_limit)
+                ie = Ie_sat[row] * math.exp(exponent)
+            else:
+                ie = Ie_sat[row]
+            ie_row[j] = ie
+            total_row[j] = height_modifier[row] * ie
+
+        # Knee smoothing in place: each window sees the values already smoothed on its left
+        w = window_size[row]
+        for i in range(start[row], end[row]):
+            if w == 0:
+                total_row[i] = math.nan  # np.mean of an empty window
+                continue
+            window_sum = 0.0
+            for k in range(i - w, i + w):
+                window_sum += total_row[k]
+            total_row[i] = window_sum / (2 * w)
+
+        # Ion current and both leakage terms
+        for j in range(n_points):
+            v = V[j]
+            electron_leakage = 0.0
+            ion_leakage = 0.0
+            if v < vp:
+                ip = -Ii_sat[row]
+                ion_leakage = (v - vp) * slope_ion[row]
+            elif v > vp:
+                exponent = min(max((vp - v) / Tp[row], -exponent_limit), exponent_limit)
+                ip = -Ii_sat[row] * math.exp(exponent)
+                electron_leakage = (v - vp) * slope_electron[row]
+            else:
+                ip = -Ii_sat[row]
+            theory[row, j] = ie_row[j] + ip
+            total[row, j] = total_row[j] + electron_leakage + ip + ion_leakage
@@ -0,0 +1,102 @@
+"""Merlino (2007) Langmuir probe model, written to broadcast over parameter arrays.
+
+Every function accepts scalars or NumPy arrays. Passing a column of parameters,
+e.g. ``Te[:, None]``, together with a voltage row ``V_range[None, :]`` evaluates
+a whole family of IV curves in a single NumPy expression.
+
+The parameter-independent parts of the plasma potential and saturation
+currents are evaluated once at import (``Vp_factor``, ``Ie_sat_factor``,
+``Ii_sat_factor``), so each of them costs one product per curve. The results
+agree with the scripts' formulas to floating point rounding.
+
+The current kernels take an optional ``out`` array of the broadcast shape
+and then evaluate in place, without the temporaries of the clipped exponent
+and the ``np.where`` branches; the values are the same either way.
+"""
+import numpy as np
+
+# Physical constants
+e = 1.602e-19  # Elementary charge in C
+kb = 1.38e-23  # Boltzmann constant in J/K
+me = 9.11e-31  # Electron mass in kg
+mi = 1.67e-27  # Ion mass (assumed proton) in kg
+
+# Default experimental parameters (as in MLM-IV-SimPlot.py)
+ProbeDia = 2.5e-3  # Probe diameter in m
+ProbeLength = 0.000275  # Probe length in m
+ne = 1e16  # Electron density in m^-3
+ni = 1e16  # Ion density in m^-3
+Tp = 0.03  # Ion temperature in eV
+
+# Default Langmuir IV curve voltage parameters
+V_min = -20  # Minimum voltage in V
+V_max = 20  # Maximum voltage in V
+V_points = 1000  # Number of points in voltage range
+
+
+def probe_area(ProbeDia=ProbeDia, ProbeLength=ProbeLength):
+    # Probe area including cylindrical surface and end area in m^2
+    return (2 * np.pi * (ProbeDia / 2) * ProbeLength) + (np.pi * (ProbeDia / 2) ** 2)
+
+
+Aprobe = probe_area()
+
+# Invariants of the formulas below
+eV_to_K = 11600  # Temperature of 1 eV in K, as used by the scripts
+Vp_factor = np.log(np.sqrt(mi / (2 * np.pi * me)))  # Vp = Vp_factor * Te
+Ie_sat_factor = 0.25 * e * np.sqrt((8 * kb * eV_to_K) / (np.pi * me))  # Ie_sat = factor * ne * sqrt(Te) * Aprobe
+Ii_sat_factor = 0.61 * e * np.sqrt((kb * eV_to_K) / mi)  # Ii_sat = factor * ni * sqrt(Te) * Aprobe
+
+
+def calculate_Vp(Te):
+    return Te * Vp_factor
+
+
+# Electron saturation current, with Te in eV (converted to K inside Ie_sat_factor)
+def calculate_Ie_sat(Te, ne=ne, Aprobe=Aprobe):
+    return Ie_sat_factor * ne * np.sqrt(Te) * Aprobe
+
+
+# Ion saturation current, with Te in eV (converted to K inside Ii_sat_factor)
+def calculate_Ii_sat(Te, ni=ni, Aprobe=Aprobe):
+    return Ii_sat_factor * ni * np.sqrt(Te) * Aprobe
+
+
+# Electron current
+def Ie(V, Vp, Ie_sat, Te, out=None):
+    exponent = np.divide(np.subtract(V, Vp, out=out), Te, out=out)
+    exponent = np.clip(exponent, -700, 700, out=out)  # Limit exponent to prevent overflow
+    if out is None:
+        return np.where(V < Vp, Ie_sat * np.exp(exponent), Ie_sat)
+    np.multiply(Ie_sat, np.exp(exponent, out=out), out=out)
+    np.copyto(out, Ie_sat, where=V >= Vp)
+    return out
+
+
+# Ion current
+def Ip(V, Vp, Ii_sat, Tp=Tp, out=None):
+    exponent = np.divide(np.subtract(Vp, V, out=out), Tp, out=out)
+    exponent = np.clip(exponent, -700, 700, out=out)  # Limit exponent to prevent overflow
+    if out is None:
+        return np.where(V < Vp, -Ii_sat, np.where(V > Vp, -Ii_sat * np.exp(exponent), -Ii_sat))
+    np.multiply(-Ii_sat, np.exp(exponent, out=out), out=out)
+    np.copyto(out, -Ii_sat, where=V <= Vp)
+    return out
+
+
+# Electron leakage current above Vp (linear in V - Vp)
+def Ie_leakage(V, Vp, slope_electron, out=None):
+    if out is None:
+        return np.where(V > Vp, (V - Vp) * slope_electron, 0)
+    np.multiply(np.subtract(V, Vp, out=out), slope_electron, out=out)
+    np.copyto(out, 0, where=V <= Vp)
+    return out
+
+
+# Ion leakage current below Vp (linear in V - Vp)
+def Ip_leakage(V, Vp, slope_ion, out=None):
+    if out is None:
+        return np.where(V < Vp, (V - Vp) * slope_ion, 0)
+    np.multiply(np.subtract(V, Vp, out=out), slope_ion, out=out)
+    np.copyto(out, 0, where=V >= Vp)
+    return out
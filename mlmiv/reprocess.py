@@ -0,0 +1,325 @@
+"""Headless reprocessing: run the Langmuir and EEDF analyses over whole archives.
+
+Sources are LMSIMData-style directories of 2-row ``.npy`` files and/or
+``mlmiv.dataset`` HDF5 files. The curves are split into tasks of
+``chunk_size`` curves; a process pool runs ``analysis.analyze_batch`` and
+then ``eedf.analyze_eedf_batch`` (with the Vp found by the analysis) on each
+task. Every finished task is written to its own part file in
+``<output>.parts/``, so an interrupted run picks up where it stopped when it
+is started again with the same arguments. The part directory's manifest
+records the analysis options and the size and modification time of every
+source file; a run whose options or sources differ refuses to resume from
+it. When all tasks are done the parts are merged, in source order, into one
+CSV or Parquet table (chosen by the output extension) and the part
+directory is removed. A task that raises is reported and left out of the
+table, and the part directory is kept so the next run retries only the
+failed tasks.
+
+Example, from the repository root:
+
+    python -m mlmiv.reprocess LMSIMData -o LMSIMData-results.csv --kind theory --workers 8
+    python -m mlmiv.reprocess LMSIMData/20241126-120000-LangmuirSIM_sweep.h5 -o sweep.parquet
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from . import analysis, dataset, eedf
+from .archive import ArchiveIndex
+
+# Columns of the results table after the source columns
+RESULT_COLUMNS = list(analysis.RESULT_DTYPE.names) + [
+    'eedf_n_e',  # Electron density in m^-3 from the EEDF (Simpson)
+    'eedf_T_e',  # Electron temperature in eV from the EEDF (Simpson)
+    'eedf_n_e_trapz',
+    'eedf_T_e_trapz',
+    'eedf_error',  # Why the EEDF is missing for this curve, empty if it is not
+]
+SOURCE_COLUMNS = ['source', 'row', 'timestamp', 'Te_label', 'kind']
+EEDF_VP_FIELDS = {'intersection': 'Vp_intersection', 'derivative': 'Vp_derivative'}
+MANIFEST_NAME = 'manifest.json'
+
+
+def _pandas():
+    import pandas as pd
+    return pd
+
+
+def check_output_format(output):
+    """Return ``'csv'`` or ``'parquet'`` for ``output``; fail early if Parquet cannot be written."""
+    extension = os.path.splitext(output)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension not in ('.parquet', '.pq'):
+        raise ValueError(f"output must end in .csv or .parquet, got {output!r}")
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        try:
+            import fastparquet  # noqa: F401
+        except ImportError:
+            raise ImportError("writing Parquet needs pyarrow or fastparquet; "
+                              "install one of them or write a .csv file") from None
+    return 'parquet'
+
+
+def plan_tasks(sources, kind=None, timestamp=None, chunk_size=64):
+    """List the tasks for ``sources`` as JSON-serialisable dicts, in source order.
+
+    A directory task names up to ``chunk_size`` files of the archive index
+    (filtered by ``kind`` and ``timestamp`` prefix), a dataset task a row
+    range of one current kind (``kind``, or every kind in the file).
+    """
+    tasks = []
+    for source in sources:
+        if os.path.isdir(source):
+            entries = ArchiveIndex(source).select(timestamp=timestamp, kind=kind)
+            names = [entry.name for entry in entries]
+            for start in range(0, len(names), chunk_size):
+                tasks.append({'type': 'npy', 'source': source, 'names': names[start:start + chunk_size]})
+        else:
+            with dataset.DatasetReader(source) as reader:
+                kinds = reader.kinds if kind is None else (kind,)
+                n_rows = len(reader)
+            for current_kind in kinds:
+                for start in range(0, n_rows, chunk_size):
+                    tasks.append({'type': 'h5', 'source': source, 'kind': current_kind,
+                                  'start': start, 'stop': min(start + chunk_size, n_rows)})
+    for task in tasks:
+        task['id'] = hashlib.sha1(json.dumps(task, sort_keys=True).encode()).hexdigest()[:16]
+    return tasks
+
+
+def _load_task(task):
+    """Return ``(groups, labels)``: ``(voltage, currents, curve_indices)`` per voltage grid, and row labels."""
+    if task['type'] == 'h5':
+        with dataset.DatasetReader(task['source']) as reader:
+            rows = slice(task['start'], task['stop'])
+            currents = reader.read(task['kind'], rows)
+            params = reader.params(rows, [name for name in ('Te',) if name in reader.param_names])
+            voltage = reader.V_range
+        Te = params.get('Te', np.full(len(currents), np.nan))
+        labels = [{'source': task['source'], 'row': task['start'] + offset, 'timestamp': '',
+                   'Te_label': float(Te[offset]), 'kind': task['kind']} for offset in range(len(currents))]
+        return [(voltage, currents, np.arange(len(currents)))], labels
+
+    index = ArchiveIndex(task['source'])
+    by_name = {entry.name: entry for entry in index}
+    grids = {}
+    labels = []
+    for position, name in enumerate(task['names']):
+        entry = by_name[name]
+        data = np.load(index.path(entry))
+        # Files are grouped by voltage grid so each group is one analyze_batch call
+        grid = grids.setdefault(data[0].tobytes(), (data[0], [], []))
+        grid[1].append(data[1])
+        grid[2].append(position)
+        labels.append({'source': os.path.join(task['source'], name),
+                       'row': -1 if entry.row is None else entry.row,
+                       'timestamp': entry.timestamp, 'Te_label': entry.Te, 'kind': entry.kind})
+    groups = [(voltage, np.array(currents), np.array(positions)) for voltage, currents, positions in grids.values()]
+    return groups, labels
+
+
+def analyze_task(task, run_eedf=True, eedf_vp='intersection', fit='analytic', warm_start=False):
+    """Analyse every curve of one task.
+
+    Returns a list of row dicts (source and result columns) and the
+    ``tanhfit.FitReport`` of every EEDF fit batch that was run.
+    """
+    groups, labels = _load_task(task)
+    records = [dict(label) for label in labels]
+    reports = []
+    for voltage, currents, positions in groups:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = analysis.analyze_batch(voltage, currents)
+        if run_eedf:
+            Vp = result[EEDF_VP_FIELDS[eedf_vp]]
+            moments, errors, fit_reports = eedf.analyze_eedf_batch(voltage, currents, Vp, fit=fit,
+                                                                   warm_start=warm_start, return_errors=True,
+                                                                   return_reports=True)
+            reports.extend(fit_reports.values())
+        for offset, position in enumerate(positions):
+            record = records[position]
+            record.update({name: float(result[name][offset]) for name in analysis.RESULT_DTYPE.names})
+            if not run_eedf:
+                record.update(eedf_n_e=np.nan, eedf_T_e=np.nan, eedf_n_e_trapz=np.nan, eedf_T_e_trapz=np.nan,
+                              eedf_error='skipped')
+                continue
+            record.update(eedf_n_e=float(moments['n_e_simpson'][offset]),
+                          eedf_T_e=float(moments['T_e_simpson'][offset]),
+                          eedf_n_e_trapz=float(moments['n_e_trapz'][offset]),
+                          eedf_T_e_trapz=float(moments['T_e_trapz'][offset]),
+                          eedf_error=errors[offset])
+    return records, reports
+
+
+def _part_path(parts_dir, task):
+    return os.path.join(parts_dir, f"part-{task['id']}.csv")
+
+
+def source_signatures(tasks):
+    """Per source of ``tasks``, a digest of the size and modification time of every file the tasks read."""
+    files = {}
+    for task in tasks:
+        if task['type'] == 'h5':
+            paths = [task['source']]
+        else:
+            paths = [os.path.join(task['source'], name) for name in task['names']]
+        files.setdefault(task['source'], set()).update(paths)
+    signatures = {}
+    for source, paths in files.items():
+        digest = hashlib.sha1()
+        for path in sorted(paths):
+            stat = os.stat(path)
+            digest.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+        signatures[source] = digest.hexdigest()
+    return signatures
+
+
+def _check_manifest(parts_dir, manifest):
+    # Write the manifest of a new part directory, or refuse to resume one written by a different run
+    path = os.path.join(parts_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path) as file:
+            previous = json.load(file)
+        if previous != manifest:
+            changed = sorted(key for key in set(previous) | set(manifest) if previous.get(key) != manifest.get(key))
+            raise ValueError(f"{parts_dir} holds the parts of a run with different {', '.join(changed)}; "
+                             f"remove it to start over")
+        return
+    if any(name.startswith('part-') for name in os.listdir(parts_dir)):
+        raise ValueError(f"{parts_dir} holds parts without a {MANIFEST_NAME}; remove it to start over")
+    with open(path + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def _run_task(task, parts_dir, run_eedf, eedf_vp, fit, warm_start):
+    pd = _pandas()
+    task_start = time.perf_counter()
+    records, reports = analyze_task(task, run_eedf, eedf_vp, fit, warm_start)
+    frame = pd.DataFrame(records, columns=SOURCE_COLUMNS + RESULT_COLUMNS)
+    # Write under a temporary name and rename, so a killed worker never leaves a partial part
+    path = _part_path(parts_dir, task)
+    frame.to_csv(path + '.tmp', index=False)
+    os.replace(path + '.tmp', path)
+    fit_stats = np.array([[report.n_fits, report.elapsed, np.sum(report.nfev), report.failures]
+                          for report in reports]).reshape(-1, 4).sum(axis=0)
+    return len(frame), time.perf_counter() - task_start, fit_stats
+
+
+def reprocess(sources, output, kind=None, timestamp=None, workers=None, chunk_size=64, run_eedf=True,
+              eedf_vp='intersection', fit='analytic', warm_start=False, keep_parts=False, progress=None):
+    """Analyse every curve in ``sources`` and write the results table to ``output``.
+
+    Tasks whose part file already exists in ``<output>.parts/`` are not run
+    again; a ``ValueError`` is raised if those parts were written with other
+    analysis options or before a source file changed. ``fit`` and
+    ``warm_start`` select the EEDF tanh fits (see
+    ``eedf.analyze_eedf_batch``); warm starts follow the file or row order of
+    each task. Returns a dict with the number of curves, tasks run and
+    resumed, EEDF failures, ``task_errors`` (``(source, message)`` of every
+    task that raised; their curves are missing from the table), the wall
+    time and ``tanh_fits``: the number of fits, their total time, function
+    evaluations and failures in this run.
+    """
+    if eedf_vp not in EEDF_VP_FIELDS:
+        raise ValueError(f"eedf_vp must be one of {tuple(EEDF_VP_FIELDS)}, got {eedf_vp!r}")
+    output_format = check_output_format(output)
+    pd = _pandas()
+    tasks = plan_tasks(sources, kind, timestamp, chunk_size)
+    parts_dir = output + '.parts'
+    os.makedirs(parts_dir, exist_ok=True)
+    options = {'run_eedf': bool(run_eedf), 'eedf_vp': eedf_vp, 'fit': fit, 'warm_start': bool(warm_start)}
+    _check_manifest(parts_dir, {'options': options, 'sources': source_signatures(tasks)})
+    pending = [task for task in tasks if not os.path.exists(_part_path(parts_dir, task))]
+    workers = workers or os.cpu_count() or 1
+
+    fit_stats = np.zeros(4)
+    task_errors = []
+    start_time = time.perf_counter()
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_run_task, task, parts_dir, run_eedf, eedf_vp, fit, warm_start): task
+                       for task in pending}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    n_curves, _, task_fit_stats = future.result()
+                except Exception as error:
+                    task_errors.append((futures[future]['source'], f"{type(error).__name__}: {error}"))
+                    n_curves = 0
+                else:
+                    fit_stats += task_fit_stats
+                if progress is not None:
+                    progress(done, len(pending), n_curves)
+
+    frames = [pd.read_csv(_part_path(parts_dir, task), keep_default_na=False,
+                          na_values={name: ['', 'nan'] for name in RESULT_COLUMNS if name != 'eedf_error'})
+              for task in tasks if os.path.exists(_part_path(parts_dir, task))]
+    table = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=SOURCE_COLUMNS + RESULT_COLUMNS)
+    output_dir = os.path.dirname(output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    if output_format == 'parquet':
+        table.to_parquet(output, index=False)
+    else:
+        table.to_csv(output, index=False)
+    failed = int((~table['eedf_error'].isin(['', 'skipped'])).sum())
+    if not (keep_parts or task_errors):
+        shutil.rmtree(parts_dir)
+    return {'curves': len(table), 'tasks': len(tasks), 'resumed': len(tasks) - len(pending),
+            'eedf_failed': failed, 'task_errors': task_errors, 'elapsed': time.perf_counter() - start_time,
+            'tanh_fits': dict(zip(('n_fits', 'elapsed', 'nfev', 'failures'), fit_stats.tolist()))}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Langmuir and EEDF analyses over LMSIMData "
+                                                 "directories and HDF5 datasets.")
+    parser.add_argument('sources', nargs='+', help="LMSIMData-style directories and/or .h5 dataset files")
+    parser.add_argument('-o', '--output', required=True, help="results table, .csv or .parquet")
+    parser.add_argument('--kind', choices=('theory', 'averaged_noisy'), default=None,
+                        help="analyse only this kind of curve (default: all)")
+    parser.add_argument('--timestamp', default=None, help="only files whose run timestamp starts with this")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--chunk-size', type=int, default=64, help="curves per task")
+    parser.add_argument('--no-eedf', action='store_true', help="skip the EEDF analysis")
+    parser.add_argument('--eedf-vp', choices=tuple(EEDF_VP_FIELDS), default='intersection',
+                        help="which Vp of the Langmuir analysis the EEDF uses")
+    parser.add_argument('--fit', choices=eedf.FIT_MODES, default='analytic',
+                        help="EEDF tanh fits: analytic Jacobian and data-driven starts, or the script's fits")
+    parser.add_argument('--warm-start', action='store_true',
+                        help="start each EEDF fit from the previous curve's (ordered sweeps)")
+    parser.add_argument('--keep-parts', action='store_true', help="keep the per-task part files")
+    args = parser.parse_args(argv)
+
+    def progress(done, total, n_curves):
+        print(f"\r{done}/{total} tasks", end='', flush=True)
+
+    summary = reprocess(args.sources, args.output, args.kind, args.timestamp, args.workers, args.chunk_size,
+                        not args.no_eedf, args.eedf_vp, args.fit, args.warm_start, args.keep_parts, progress)
+    if summary['tasks'] > summary['resumed']:
+        print()
+    print(f"{summary['curves']} curves from {summary['tasks']} tasks ({summary['resumed']} resumed) "
+          f"in {summary['elapsed']:.2f} s; EEDF failed for {summary['eedf_failed']} curves. "
+          f"Results written to {args.output}")
+    for source, message in summary['task_errors']:
+        print(f"task failed for {source}: {message}")
+    if summary['task_errors']:
+        print(f"{len(summary['task_errors'])} tasks failed and are missing from the table; "
+              f"run again to retry them")
+    fits = summary['tanh_fits']
+    if fits['n_fits']:
+        print(f"{fits['n_fits']:.0f} tanh fits in {fits['elapsed']:.2f} s, "
+              f"{fits['nfev'] / fits['n_fits']:.1f} evaluations per fit, "
+              f"failure rate {fits['failures'] / fits['n_fits']:.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""Parallel simulation runner: split a parameter sweep across a process pool.
+
+Every combination of the swept values is one curve. Rows are numbered in a
+fixed order and each row's noise is seeded from ``SeedSequence(root_seed)``
+with ``spawn_key=(row,)``, i.e. the row-th child of the root sequence. A
+curve's data therefore only depends on the root seed and the sweep, never on
+the number of workers or the chunk size.
+
+Example, from the repository root:
+
+    python -m mlmiv.runner --te 0.1 0.25 0.5 1 2 --ne 1e15 1e16 1e17 --workers 8 --seed 1
+    python -m mlmiv.runner --te 0.1 0.25 0.5 1 2 --format h5
+    python -m mlmiv.runner --te 0.1 0.25 0.5 1 2 --format h5 --dtype float32
+    python -m mlmiv.runner --te 0.1 0.25 0.5 1 2 --format h5 --grid adaptive
+"""
+import argparse
+import itertools
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+
+from . import cache, dataset, grid, noise, physics, simulate
+
+# Swept quantities and their defaults, in row order (the last one varies fastest)
+SWEEP_DEFAULTS = {
+    'Te': (0.1, 0.25, 0.5, 1, 2),
+    'ne': (physics.ne,),
+    'ni': (physics.ni,),
+    'Tp': (physics.Tp,),
+    'ProbeDia': (physics.ProbeDia,),
+    'ProbeLength': (physics.ProbeLength,),
+    'noise_amplitude': (noise.noise_amplitude,),
+    'slope_ion': (simulate.slope_ion,),
+    'slope_electron': (simulate.slope_electron,),
+    'height_modifier': (simulate.height_modifier,),
+    'stretch_modifier': (simulate.stretch_modifier,),
+}
+
+
+@dataclass
+class RunReport:
+    n_curves: int
+    n_tasks: int
+    workers: int
+    elapsed: float  # Wall time in s
+    compute_time: float  # Sum of the time spent inside tasks in s
+    root_entropy: int  # Pass as seed to reproduce the run
+    files: list
+    backend: str = 'numpy'  # simulate_batch backend the workers used
+    dtype: str = 'float64'  # Storage type of the curves
+
+    @property
+    def curves_per_second(self):
+        return self.n_curves / self.elapsed if self.elapsed > 0 else float('inf')
+
+    def summary(self):
+        return (f"{self.n_curves} curves in {self.elapsed:.2f} s with {self.workers} workers "
+                f"({self.curves_per_second:.0f} curves/s, {self.n_tasks} tasks, "
+                f"parallel efficiency {self.compute_time / (self.elapsed * self.workers):.0%}, "
+                f"{self.backend} backend, {self.dtype}); seed={self.root_entropy}")
+
+
+def sweep_rows(sweep):
+    """Expand a sweep (name -> values, missing names use defaults) into per-row arrays."""
+    unknown = set(sweep) - set(SWEEP_DEFAULTS)
+    if unknown:
+        raise ValueError(f"unknown sweep parameters: {sorted(unknown)}")
+    axes = [np.atleast_1d(np.asarray(sweep.get(name, default), dtype=float))
+            for name, default in SWEEP_DEFAULTS.items()]
+    rows = np.array(list(itertools.product(*axes)), dtype=float).reshape(-1, len(axes))
+    return {name: rows[:, k] for k, name in enumerate(SWEEP_DEFAULTS)}
+
+
+def curve_filename(stamp, row, Te, kind):
+    # Same naming as MLM-IV-SimPlot.py plus the row number, so sweeps with repeated Te do not collide
+    return f"{stamp}-{row:06d}-LangmuirSIM_eV{Te:g}_{kind}.npy"
+
+
+def simulate_rows(chunk, first_row, root_entropy, num_samples=noise.num_samples, V_range=None,
+                  smoothing_mode='fast', curve_cache=None, backend='numpy', dtype=np.float64, out=None):
+    """Simulate a slice of ``sweep_rows`` whose first row is ``first_row``.
+
+    With a ``mlmiv.cache.CurveCache`` the noise-free curves are taken from
+    (and added to) the cache, which keeps the NumPy components in float64;
+    otherwise they come from ``simulate.simulate_batch`` with ``backend``
+    and ``dtype``. ``out`` is an optional ``(theory, total, variance)``
+    triple of ``(len(chunk), V_points)`` buffers to fill instead of new
+    arrays. Returns ``(batch, averaged_noisy)``; the averaged noisy curves
+    are written over ``batch.total``, which they are computed from, so
+    ``averaged_noisy is batch.total``.
+    """
+    options = {'smoothing_mode': smoothing_mode}
+    if curve_cache is None:
+        simulate_batch = simulate.simulate_batch
+        options.update(backend=backend, dtype=dtype, out=None if out is None else out[:2])
+    else:
+        simulate_batch = curve_cache.batch
+    batch = simulate_batch(
+        chunk['Te'], chunk['ne'], chunk['ni'], chunk['Tp'], chunk['ProbeDia'], chunk['ProbeLength'],
+        V_range=V_range, height_modifier=chunk['height_modifier'],
+        stretch_modifier=chunk['stretch_modifier'], slope_ion=chunk['slope_ion'],
+        slope_electron=chunk['slope_electron'], **options)
+    seeds = [np.random.SeedSequence(root_entropy, spawn_key=(row,))
+             for row in range(first_row, first_row + len(batch))]
+    variance = np.empty_like(batch.total) if out is None or out[2].dtype != batch.total.dtype else out[2]
+    averaged_noisy, _ = noise.averaged_noisy_batch(batch.total, batch.V_range, batch.Vp, num_samples,
+                                                   chunk['noise_amplitude'], seeds, out=(batch.total, variance))
+    return batch, averaged_noisy
+
+
+_worker_caches = {}  # cache directory -> CurveCache of this worker process
+_worker_buffers = {}  # (V_points, dtype) -> (theory, total, variance) rows reused by this worker's tasks
+
+
+def _task_buffers(n_rows, n_points, dtype):
+    # The leading n_rows of this worker's buffers, grown when a task has more rows
+    key = (n_points, np.dtype(dtype).str)
+    buffers = _worker_buffers.get(key)
+    if buffers is None or len(buffers[0]) < n_rows:
+        buffers = _worker_buffers[key] = tuple(np.empty((n_rows, n_points), dtype=dtype) for _ in range(3))
+    return tuple(buffer[:n_rows] for buffer in buffers)
+
+
+def _run_task(chunk, first_row, root_entropy, num_samples, V_range, output_dir, stamp, output, cache_dir=None,
+              backend='numpy', dtype=np.float64):
+    task_start = time.perf_counter()
+    curve_cache = None
+    if cache_dir is not None:
+        curve_cache = _worker_caches.get(cache_dir)
+        if curve_cache is None:
+            curve_cache = _worker_caches[cache_dir] = cache.CurveCache(directory=cache_dir)
+    # Curves handed back to the parent get fresh arrays; the others reuse this worker's buffers
+    out = None if output == 'h5' else _task_buffers(len(chunk['Te']), len(V_range), dtype)
+    batch, averaged_noisy = simulate_rows(chunk, first_row, root_entropy, num_samples, V_range,
+                                          curve_cache=curve_cache, backend=backend, dtype=dtype, out=out)
+    files = []
+    if output == 'h5':
+        # The parent process owns the dataset file; hand the block back to it
+        params = dict(chunk, Vp=batch.Vp, Ie_sat=batch.Ie_sat, Ii_sat=batch.Ii_sat,
+                      num_samples=np.full(len(batch), num_samples),
+                      seed_row=np.arange(first_row, first_row + len(batch)))
+        block = (params, {'theory': batch.theory, 'averaged_noisy': averaged_noisy})
+        return len(batch), time.perf_counter() - task_start, block
+    if output == 'npy':
+        # Same 2-row format as MLM-IV-SimPlot.py: voltage row, current row
+        for offset, Te in enumerate(batch.params['Te']):
+            row = first_row + offset
+            for kind, curve in (('averaged_noisy', averaged_noisy[offset]), ('theory', batch.theory[offset])):
+                filepath = os.path.join(output_dir, curve_filename(stamp, row, Te, kind))
+                np.save(filepath, np.array([batch.V_range, curve], dtype=dtype))
+                files.append(filepath)
+    return len(batch), time.perf_counter() - task_start, files
+
+
+def run_sweep(sweep, workers=None, chunk_size=64, seed=None, num_samples=noise.num_samples,
+              V_range=None, output_dir="LMSIMData", save=True, output_format='npy', cache_dir=None,
+              backend='auto', dtype=np.float64):
+    """Simulate every combination in ``sweep`` across ``workers`` processes.
+
+    With ``output_format='npy'`` the workers write 2-row ``.npy`` files into
+    ``output_dir``. With ``'h5'`` all rows go into one ``mlmiv.dataset`` file
+    there, in row order, with the sweep values, Vp, saturation currents and
+    seed row as per-row metadata. With ``cache_dir`` the noise-free curves are
+    memoized there (``mlmiv.cache``), so rows that only differ in the noise
+    amplitude, and later runs over the same parameters, reuse them. Without
+    it the curves come from the ``simulate.simulate_batch`` ``backend``
+    (``'auto'``: numba if installed). ``dtype='float32'`` halves the memory
+    of every task and the size of the files; the curves are still computed
+    in float64 and rounded when stored. Returns a ``RunReport``.
+    """
+    if output_format not in ('npy', 'h5'):
+        raise ValueError(f"output_format must be 'npy' or 'h5', got {output_format!r}")
+    backend = 'numpy' if cache_dir is not None else simulate.resolve_backend(backend)
+    dtype = simulate.check_dtype(dtype)
+    rows = sweep_rows(sweep)
+    n_curves = len(rows['Te'])
+    workers = workers or os.cpu_count() or 1
+    root_entropy = np.random.SeedSequence(seed).entropy
+    if V_range is None:
+        V_range = simulate.voltage_range()
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    writer = None
+    if save:
+        os.makedirs(output_dir, exist_ok=True)
+        if output_format == 'h5':
+            dataset_path = os.path.join(output_dir, f"{stamp}-LangmuirSIM_sweep.h5")
+            writer = dataset.DatasetWriter(dataset_path, V_range, dtype=dtype)
+            writer.attrs['root_entropy'] = str(root_entropy)
+    output = output_format if save else None
+
+    starts = range(0, n_curves, chunk_size)
+    files = []
+    compute_time = 0.0
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        remaining = iter(starts)
+        try:
+            while True:
+                # Keep a bounded number of tasks in flight and release each result once it is written
+                for start in remaining:
+                    chunk = {name: values[start:start + chunk_size] for name, values in rows.items()}
+                    pending.append(executor.submit(_run_task, chunk, start, root_entropy, num_samples, V_range,
+                                                   output_dir, stamp, output, cache_dir, backend, dtype))
+                    if len(pending) >= 2 * workers:
+                        break
+                if not pending:
+                    break
+                _, task_time, task_output = pending.popleft().result()
+                compute_time += task_time
+                if writer is not None:
+                    writer.append(task_output[0], **task_output[1])
+                else:
+                    files.extend(task_output)
+        finally:
+            if writer is not None:
+                writer.close()
+                files.append(writer.path)
+    elapsed = time.perf_counter() - start_time
+    return RunReport(n_curves, len(starts), workers, elapsed, compute_time, root_entropy, files, backend,
+                     dtype.name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate a Langmuir IV parameter sweep in parallel.")
+    for name, default in SWEEP_DEFAULTS.items():
+        option = '--' + re.sub(r'(?<=[a-z])(?=[A-Z])', '-', name).replace('_', '-').lower()
+        parser.add_argument(option, dest=name, type=float, nargs='+', default=list(default),
+                            help=f"values of {name} (default: {' '.join(f'{v:g}' for v in default)})")
+    parser.add_argument('--num-samples', type=int, default=noise.num_samples,
+                        help="noisy samples averaged per curve")
+    parser.add_argument('--v-min', type=float, default=physics.V_min)
+    parser.add_argument('--v-max', type=float, default=physics.V_max)
+    parser.add_argument('--v-points', type=int, default=None,
+                        help=f"voltage points (default: {physics.V_points}, or {grid.adaptive_points} "
+                             f"with --grid adaptive)")
+    parser.add_argument('--grid', choices=('uniform', 'adaptive'), default='uniform',
+                        help="evenly spaced voltages, or grid.adaptive_voltage_range for the swept Te")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--chunk-size', type=int, default=64, help="curves per task")
+    parser.add_argument('--seed', type=int, default=None, help="root seed (default: fresh entropy)")
+    parser.add_argument('--output-dir', default="LMSIMData")
+    parser.add_argument('--format', choices=('npy', 'h5'), default='npy',
+                        help="one 2-row .npy per curve, or a single HDF5 dataset file")
+    parser.add_argument('--no-save', action='store_true', help="simulate only, e.g. for timing")
+    parser.add_argument('--cache-dir', default=None,
+                        help="directory memoizing the noise-free curves between rows and runs")
+    parser.add_argument('--backend', choices=simulate.BACKENDS, default='auto',
+                        help="simulation kernels: NumPy, the fused numba loop, or numba if installed (default)")
+    parser.add_argument('--dtype', choices=simulate.DTYPES, default='float64',
+                        help="storage type of the curves; float32 halves memory and file size")
+    args = parser.parse_args(argv)
+
+    sweep = {name: getattr(args, name) for name in SWEEP_DEFAULTS}
+    if args.grid == 'adaptive':
+        V_range = grid.adaptive_voltage_range(args.Te, args.v_points or grid.adaptive_points, args.v_min, args.v_max)
+    else:
+        V_range = simulate.voltage_range(args.v_min, args.v_max, args.v_points or physics.V_points)
+    report = run_sweep(sweep, args.workers, args.chunk_size, args.seed, args.num_samples, V_range,
+                       args.output_dir, not args.no_save, args.format, args.cache_dir, args.backend, args.dtype)
+    print(report.summary())
+    if report.files:
+        print(f"{len(report.files)} files written to {args.output_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+"""Batch IV-curve generator over a (Te, ne, ni, Tp, probe geometry) parameter grid.
+
+``simulate_batch`` evaluates the same model as the per-curve loop in
+MLM-IV-SimPlot.py, but for every parameter combination at once: the plasma
+parameters are broadcast as a column against the voltage row, so ``Vp``,
+``Ie_sat``, ``Ii_sat``, ``Ie`` and ``Ip`` are each a single NumPy call that
+returns an ``(n_params, V_points)`` matrix.
+
+``backend`` selects how ``simulate_batch`` evaluates the curves:
+
+``'numpy'``
+    The broadcast NumPy expressions of ``mlmiv.physics`` and
+    ``mlmiv.smoothing``, evaluated in place block by block (see below).
+``'numba'``
+    ``mlmiv.numba_kernels.fused_rows``: one compiled loop over the curves,
+    in parallel, that writes the theoretical and total currents straight
+    into the two outputs. Needs numba; the first call compiles the kernel
+    (cached on disk afterwards). Agrees with ``'numpy'`` to rounding.
+``'auto'``
+    ``'numba'`` if numba is installed, otherwise ``'numpy'``.
+
+The NumPy backend works through ``block_rows`` curves at a time with the
+in-place kernels of ``mlmiv.physics``, so its float64 temporaries stay at a
+few ``(block_rows, V_points)`` buffers however large the batch. The curves are stored as ``dtype`` (``'float64'`` or
+``'float32'``), or written into caller-owned ``out=(theory, total)``
+buffers that can be reused from batch to batch. With float32 both backends
+still compute in float64 and only round the stored curves, which halves the
+memory of the outputs at the cost of float32 resolution (~6e-8 relative).
+
+``V_range`` may be any increasing grid, e.g. ``grid.adaptive_voltage_range``.
+The knee smoothing counts samples, so on a non-uniform grid (or with
+``smoothing_points`` other than ``len(V_range)``) it is evaluated on the
+uniform grid of ``grid.smoothing_reference`` and its correction to
+``height_modifier * Ie`` is interpolated onto ``V_range``; such grids always
+take the NumPy path.
+"""
+import importlib.util
+from dataclasses import dataclass
+
+import numpy as np
+
+from . import grid, physics
+from .smoothing import smooth_transition_curve, transition_bounds
+
+# Default ion and electron current smoothing and leakage parameters (as in MLM-IV-SimPlot.py)
+height_modifier = 0.9   # Electron current simulated max of theoretical max
+stretch_modifier = 10.5 # Electron current simulation horizontal spread
+slope_ion = 0.5e-5      # Slope for ion current leakage below Vp
+slope_electron = 0.2e-4 # Slope for electron current leakage above Vp
+
+PARAMETER_NAMES = ('Te', 'ne', 'ni', 'Tp', 'ProbeDia', 'ProbeLength')
+BACKENDS = ('numpy', 'numba', 'auto')
+DTYPES = ('float64', 'float32')
+block_rows = 2048  # Curves per block of the NumPy backend of simulate_batch
+
+
+@dataclass
+class SimulationBatch:
+    """Curves for ``n_params`` parameter sets sampled on a shared voltage row."""
+    V_range: np.ndarray  # (V_points,)
+    params: dict  # name -> (n_params,) array, see PARAMETER_NAMES
+    Vp: np.ndarray  # (n_params,)
+    Ie_sat: np.ndarray  # (n_params,)
+    Ii_sat: np.ndarray  # (n_params,)
+    theory: np.ndarray  # (n_params, V_points) Ie + Ip without smoothing or leakage
+    total: np.ndarray  # (n_params, V_points) smoothed Ie + leakage + Ip
+
+    def __len__(self):
+        return len(self.Vp)
+
+
+@dataclass
+class CurveComponents:
+    """The separate current components behind a ``SimulationBatch``, each ``(n_params, V_points)``."""
+    V_range: np.ndarray
+    params: dict
+    Vp: np.ndarray
+    Ie_sat: np.ndarray
+    Ii_sat: np.ndarray
+    Ie: np.ndarray  # Electron current
+    smooth_Ie: np.ndarray  # Electron current with the rounded knee
+    Ie_leakage: np.ndarray  # Electron leakage above Vp
+    Ip: np.ndarray  # Ion current
+    Ip_leakage: np.ndarray  # Ion leakage below Vp
+
+    def __len__(self):
+        return len(self.Vp)
+
+    @property
+    def theory(self):
+        return self.Ie + self.Ip
+
+    @property
+    def total(self):
+        return self.smooth_Ie + self.Ie_leakage + self.Ip + self.Ip_leakage
+
+    def batch(self):
+        return SimulationBatch(V_range=self.V_range, params=self.params, Vp=self.Vp, Ie_sat=self.Ie_sat,
+                               Ii_sat=self.Ii_sat, theory=self.theory, total=self.total)
+
+
+def voltage_range(V_min=physics.V_min, V_max=physics.V_max, V_points=physics.V_points):
+    return np.linspace(V_min, V_max, V_points)
+
+
+def parameter_grid(Te, ne=physics.ne, ni=physics.ni, Tp=physics.Tp,
+                   ProbeDia=physics.ProbeDia, ProbeLength=physics.ProbeLength):
+    """Return the full Cartesian product of the given values as flat arrays.
+
+    Rows are ordered with ``Te`` varying slowest, matching ``PARAMETER_NAMES``.
+    """
+    axes = [np.atleast_1d(np.asarray(v, dtype=float)) for v in (Te, ne, ni, Tp, ProbeDia, ProbeLength)]
+    mesh = np.meshgrid(*axes, indexing='ij')
+    return {name: m.ravel() for name, m in zip(PARAMETER_NAMES, mesh)}
+
+
+def _column(value):
+    # Per-parameter-set values become a column so they broadcast against the voltage row
+    value = np.asarray(value, dtype=float)
+    return value[:, None] if value.ndim else value
+
+
+def resolve_backend(backend='auto'):
+    """``'numpy'`` or ``'numba'`` for ``backend``; asking for numba without it installed fails early."""
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}, got {backend!r}")
+    numba_installed = importlib.util.find_spec('numba') is not None
+    if backend == 'auto':
+        return 'numba' if numba_installed else 'numpy'
+    if backend == 'numba' and not numba_installed:
+        raise ImportError("the numba backend needs numba (pip install numba); use backend='numpy'")
+    return backend
+
+
+def _plasma_parameters(Te, ne, ni, Tp, ProbeDia, ProbeLength, V_range):
+    # Broadcast parameter sets with their Vp, Ie_sat and Ii_sat
+    if V_range is None:
+        V_range = voltage_range()
+    V_range = np.asarray(V_range, dtype=float)
+    arrays = np.broadcast_arrays(*[np.atleast_1d(np.asarray(v, dtype=float))
+                                   for v in (Te, ne, ni, Tp, ProbeDia, ProbeLength)])
+    params = {name: np.ascontiguousarray(a) for name, a in zip(PARAMETER_NAMES, arrays)}
+
+    Aprobe = physics.probe_area(params['ProbeDia'], params['ProbeLength'])
+    Vp = physics.calculate_Vp(params['Te'])
+    Ie_sat = physics.calculate_Ie_sat(params['Te'], params['ne'], Aprobe)
+    Ii_sat = physics.calculate_Ii_sat(params['Te'], params['ni'], Aprobe)
+    return V_range, params, Vp, Ie_sat, Ii_sat
+
+
+def simulate_components(Te, ne=physics.ne, ni=physics.ni, Tp=physics.Tp,
+                        ProbeDia=physics.ProbeDia, ProbeLength=physics.ProbeLength,
+                        V_range=None, height_modifier=height_modifier,
+                        stretch_modifier=stretch_modifier, slope_ion=slope_ion,
+                        slope_electron=slope_electron, smoothing_mode='legacy', smoothing_points=None):
+    """Like ``simulate_batch``, but return every current component as a ``CurveComponents``."""
+    V_range, params, Vp, Ie_sat, Ii_sat = _plasma_parameters(Te, ne, ni, Tp, ProbeDia, ProbeLength, V_range)
+    reference = grid.smoothing_reference(V_range, smoothing_points)
+
+    # Parameters as columns, voltage as a row: every kernel returns (n_params, V_points)
+    V = V_range[None, :]
+    Vp_col = Vp[:, None]
+    Ie_values = physics.Ie(V, Vp_col, Ie_sat[:, None], params['Te'][:, None])
+    Ip_values = physics.Ip(V, Vp_col, Ii_sat[:, None], params['Tp'][:, None])
+
+    smooth_Ie_values = _smooth_knee(V_range, reference, Ie_values, Vp, Ie_sat, params['Te'], height_modifier,
+                                    stretch_modifier, smoothing_mode)
+    shape = Ie_values.shape
+    return CurveComponents(V_range=V_range, params=params, Vp=Vp, Ie_sat=Ie_sat, Ii_sat=Ii_sat,
+                           Ie=Ie_values, smooth_Ie=smooth_Ie_values,
+                           Ie_leakage=np.broadcast_to(physics.Ie_leakage(V, Vp_col, _column(slope_electron)), shape),
+                           Ip=Ip_values,
+                           Ip_leakage=np.broadcast_to(physics.Ip_leakage(V, Vp_col, _column(slope_ion)), shape))
+
+
+def _smooth_knee(V_range, reference, Ie_values, Vp, Ie_sat, Te, height_modifier, stretch_modifier,
+                 smoothing_mode, out=None):
+    # smooth_transition_curve of Ie_values, directly or through the uniform reference grid
+    if reference is None:
+        return smooth_transition_curve(Ie_values, np.searchsorted(V_range, Vp), height_modifier, stretch_modifier,
+                                       mode=smoothing_mode, out=out)
+    # The smoothing only rewrites (and reads) samples within 13 * stretch_modifier of Vp, so the
+    # reference is evaluated on that stretch of it around each curve's Vp
+    stretch = float(np.max(stretch_modifier))
+    width = min(len(reference), 2 * (int(10 * stretch) + int(3 * stretch) + 1))
+    Vp_index = np.searchsorted(reference, Vp)
+    offset = np.clip(Vp_index - width // 2, 0, len(reference) - width)
+    local = reference[offset[:, None] + np.arange(width)]
+    Ie_local = physics.Ie(local, Vp[:, None], Ie_sat[:, None], Te[:, None])
+    height = _column(height_modifier)
+    correction = smooth_transition_curve(Ie_local, Vp_index - offset, height_modifier, stretch_modifier,
+                                         mode=smoothing_mode)
+    correction -= height * Ie_local
+    # Linear interpolation of the correction onto V_range, zero outside each curve's stretch
+    index, fraction = grid.linear_interpolation(reference, V_range)
+    index = index - offset[:, None]
+    inside = (index >= 0) & (index < width - 1)
+    index = np.clip(index, 0, width - 2)
+    smoothed = np.multiply(height, Ie_values, out=out)
+    smoothed += np.where(inside, np.take_along_axis(correction, index, axis=1) * (1 - fraction)
+                         + np.take_along_axis(correction, index + 1, axis=1) * fraction, 0)
+    return smoothed
+
+
+def check_dtype(dtype):
+    """``dtype`` as a NumPy dtype; only float64 and float32 curves are supported."""
+    dtype = np.dtype(dtype)
+    if dtype.name not in DTYPES:
+        raise ValueError(f"dtype must be one of {DTYPES}, got {dtype.name!r}")
+    return dtype
+
+
+def _output_buffers(shape, dtype, out):
+    # (theory, total) to write the curves into: new arrays of dtype, or the checked pair out
+    if out is None:
+        dtype = check_dtype(dtype)
+        return np.empty(shape, dtype=dtype), np.empty(shape, dtype=dtype)
+    theory, total = out
+    check_dtype(theory.dtype)
+    for name, buffer in (('theory', theory), ('total', total)):
+        if buffer.shape != shape or buffer.dtype != theory.dtype:
+            raise ValueError(f"out {name} must be a {shape} array of {theory.dtype}, "
+                             f"got {buffer.shape} of {buffer.dtype}")
+    return theory, total
+
+
+def _block_values(value, n_params, rows):
+    # A scalar setting stays a scalar; one value per parameter set is cut to the block
+    value = np.asarray(value, dtype=float)
+    return np.broadcast_to(value, (n_params,))[rows] if value.ndim else value
+
+
+def _simulate_blocked(V_range, params, Vp, Ie_sat, Ii_sat, height_modifier, stretch_modifier, slope_ion,
+                      slope_electron, smoothing_mode, theory, total, reference=None):
+    # The simulate_components arithmetic in place, block by block; float64 results are identical
+    n_params, n_points = theory.shape
+    V = V_range[None, :]
+    block_size = max(1, min(block_rows, n_params))
+    work = np.empty((block_size, n_points))
+    staging = None if theory.dtype == np.float64 else np.empty((2, block_size, n_points))
+    for first in range(0, n_params, block_size):
+        rows = slice(first, first + block_size)
+        n_rows = len(Vp[rows])
+        if staging is None:
+            block_theory, block_total = theory[rows], total[rows]
+        else:
+            block_theory, block_total = staging[0, :n_rows], staging[1, :n_rows]
+        block_work = work[:n_rows]
+        Vp_col = Vp[rows, None]
+
+        physics.Ie(V, Vp_col, Ie_sat[rows, None], params['Te'][rows, None], out=block_theory)
+        _smooth_knee(V_range, reference, block_theory, Vp[rows], Ie_sat[rows], params['Te'][rows],
+                     _block_values(height_modifier, n_params, rows), _block_values(stretch_modifier, n_params, rows),
+                     smoothing_mode, out=block_total)
+        # Summed in the order of CurveComponents.total: smooth_Ie + Ie_leakage + Ip + Ip_leakage
+        block_total += physics.Ie_leakage(V, Vp_col, _column(_block_values(slope_electron, n_params, rows)),
+                                          out=block_work)
+        physics.Ip(V, Vp_col, Ii_sat[rows, None], params['Tp'][rows, None], out=block_work)
+        block_theory += block_work
+        block_total += block_work
+        block_total += physics.Ip_leakage(V, Vp_col, _column(_block_values(slope_ion, n_params, rows)),
+                                          out=block_work)
+        if staging is not None:
+            theory[rows] = block_theory
+            total[rows] = block_total
+
+
+def _simulate_fused(V_range, params, Vp, Ie_sat, Ii_sat, height_modifier, stretch_modifier, slope_ion,
+                    slope_electron, theory, total):
+    from .numba_kernels import fused_rows
+
+    n_params, n_points = theory.shape
+
+    def per_row(value, dtype=float):
+        return np.ascontiguousarray(np.broadcast_to(np.asarray(value, dtype=dtype), (n_params,)))
+
+    # Smoothing bounds per row, as smooth_transition_curve derives them for each stretch_modifier
+    Vp_index = np.searchsorted(V_range, Vp)
+    stretch = per_row(stretch_modifier)
+    start, end, window_size = (np.empty(n_params, dtype=np.int64) for _ in range(3))
+    for stretch_value in np.unique(stretch):
+        rows = stretch == stretch_value
+        start[rows], end[rows], window_size[rows] = transition_bounds(Vp_index[rows], n_points, stretch_value)
+
+    fused_rows(V_range, params['Te'], params['Tp'], Vp, Ie_sat, Ii_sat, per_row(height_modifier), start, end,
+               window_size, per_row(slope_electron), per_row(slope_ion), theory, total)
+
+
+def model_currents(V_range, Te, Vp, Ie_sat, Ii_sat, Tp=physics.Tp, height_modifier=height_modifier,
+                   stretch_modifier=stretch_modifier, slope_ion=slope_ion, slope_electron=slope_electron,
+                   smoothing_mode='fast', smoothing_points=None, out=None):
+    """The ``simulate_batch`` model with ``Vp``, ``Ie_sat`` and ``Ii_sat`` given instead of derived.
+
+    Every argument after ``V_range`` is a scalar or one value per curve. This
+    is the forward model of the inverse fits in ``mlmiv.inverse``, where Vp
+    and the saturation currents are free. Returns ``(theory, total)`` as new
+    float64 arrays or in ``out``, on the NumPy backend.
+    """
+    V_range = np.asarray(V_range, dtype=float)
+    Te, Vp, Ie_sat, Ii_sat, Tp = (np.ascontiguousarray(a) for a in np.broadcast_arrays(
+        *[np.atleast_1d(np.asarray(v, dtype=float)) for v in (Te, Vp, Ie_sat, Ii_sat, Tp)]))
+    theory, total = _output_buffers((len(Vp), len(V_range)), np.float64, out)
+    _simulate_blocked(V_range, {'Te': Te, 'Tp': Tp}, Vp, Ie_sat, Ii_sat, height_modifier, stretch_modifier,
+                      slope_ion, slope_electron, smoothing_mode, theory, total,
+                      grid.smoothing_reference(V_range, smoothing_points))
+    return theory, total
+
+
+def simulate_batch(Te, ne=physics.ne, ni=physics.ni, Tp=physics.Tp,
+                   ProbeDia=physics.ProbeDia, ProbeLength=physics.ProbeLength,
+                   V_range=None, height_modifier=height_modifier,
+                   stretch_modifier=stretch_modifier, slope_ion=slope_ion,
+                   slope_electron=slope_electron, smoothing_mode='legacy', smoothing_points=None, backend='numpy',
+                   dtype=np.float64, out=None):
+    """Simulate one IV curve per parameter set.
+
+    ``Te``, ``ne``, ``ni``, ``Tp``, ``ProbeDia`` and ``ProbeLength`` are
+    broadcast against each other (use ``parameter_grid`` for a Cartesian
+    product). ``V_range`` defaults to the 1000-point -20..20 V sweep.
+    ``height_modifier``, ``stretch_modifier``, ``slope_ion`` and
+    ``slope_electron`` are scalars or one value per parameter set.
+    ``smoothing_mode`` selects the knee smoothing kernel of the NumPy
+    backend, see ``mlmiv.smoothing``; the numba ``backend`` always sums each
+    window afresh, like ``'legacy'``. ``smoothing_points`` sets the uniform
+    grid the knee smoothing is defined on (see the module docstring).
+
+    ``theory`` and ``total`` are new ``dtype`` arrays, or the two
+    ``(n_params, V_points)`` arrays of ``out=(theory, total)`` (float64 or
+    float32, which then sets the dtype).
+    """
+    backend = resolve_backend(backend)
+    V_range, params, Vp, Ie_sat, Ii_sat = _plasma_parameters(Te, ne, ni, Tp, ProbeDia, ProbeLength, V_range)
+    reference = grid.smoothing_reference(V_range, smoothing_points)
+    theory, total = _output_buffers((len(Vp), len(V_range)), dtype, out)
+    if backend == 'numba' and reference is None:
+        _simulate_fused(V_range, params, Vp, Ie_sat, Ii_sat, height_modifier, stretch_modifier, slope_ion,
+                        slope_electron, theory, total)
+    else:
+        _simulate_blocked(V_range, params, Vp, Ie_sat, Ii_sat, height_modifier, stretch_modifier, slope_ion,
+                          slope_electron, smoothing_mode, theory, total, reference)
+    return SimulationBatch(V_range=V_range, params=params, Vp=Vp, Ie_sat=Ie_sat, Ii_sat=Ii_sat,
+                           theory=theory, total=total)
@@ -0,0 +1,410 @@
+"""Streaming analysis of live probe sweeps.
+
+An MLM instrument sends ``voltage,current`` text lines, one sample per line,
+sweep after sweep. ``StreamAnalyzer`` reads them from a TCP socket, a pipe
+(stdin) or a device/FIFO path, keeps the samples of the running sweep in a
+fixed-size ring buffer and, whenever the voltage drops back by more than
+``reset_threshold`` (the start of the next sweep), hands the completed sweep
+to ``analysis.analyze_batch`` in a worker thread. Latest and exponentially
+averaged Te, Vp, Ie_sat (and the smoothed derivative) are updated after every
+sweep. A sweep whose analysis (or ``on_result`` callback) raises is counted
+in ``failed`` with its reason in ``errors``, and the stream goes on.
+
+Memory is bounded by the ring buffer, the queue of sweeps waiting for
+analysis (``max_pending``; the oldest waiting sweep is dropped when it is
+full, so results never lag more than that many sweeps) and the result
+history. ``FakeInstrument`` replays LMSIMData files at a given sample rate
+for testing without hardware. From the repository root:
+
+    python -m mlmiv.stream serve --port 5025 --rate 50000
+    python -m mlmiv.stream listen tcp://127.0.0.1:5025
+    python -m mlmiv.stream demo --rate 100000
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import numpy as np
+
+from . import analysis
+from .archive import ArchiveIndex
+
+DEFAULT_PORT = 5025
+reset_threshold = 1.0  # V drop between samples that starts a new sweep
+ring_capacity = 8192  # Samples; longer sweeps are discarded
+min_sweep_points = 100  # Shorter sweeps (e.g. joining mid-sweep) are not analysed
+average_weight = 0.2  # Weight of the newest sweep in the running averages
+read_size = 1 << 16  # Bytes per read from the source
+
+
+class RingBuffer:
+    """Fixed-capacity buffer of ``(voltage, current)`` samples."""
+
+    def __init__(self, capacity=ring_capacity):
+        self.capacity = capacity
+        self.samples = np.empty((capacity, 2))
+        self.total = 0  # Samples ever written
+
+    def extend(self, samples):
+        if len(samples) > self.capacity:
+            # Only the newest samples fit
+            self.total += len(samples) - self.capacity
+            samples = samples[-self.capacity:]
+        start = self.total % self.capacity
+        first = min(len(samples), self.capacity - start)
+        self.samples[start:start + first] = samples[:first]
+        self.samples[:len(samples) - first] = samples[first:]
+        self.total += len(samples)
+
+    def last(self, n):
+        """Copy of the last ``n`` samples (``n <= capacity``), oldest first."""
+        end = self.total % self.capacity
+        index = np.arange(end - n, end) % self.capacity
+        return self.samples[index]
+
+
+class SweepAssembler:
+    """Split a sample stream into sweeps at voltage resets."""
+
+    def __init__(self, capacity=ring_capacity, threshold=reset_threshold, min_points=min_sweep_points):
+        self.buffer = RingBuffer(capacity)
+        self.threshold = threshold
+        self.min_points = min_points
+        self.sweep_start = 0  # Absolute sample number where the running sweep began
+        self.last_voltage = None
+        self.discarded = 0  # Sweeps that were too short or did not fit in the buffer
+
+    def push(self, samples):
+        """Add an ``(n, 2)`` block; return the sweeps it completed as ``(voltage, current)`` pairs."""
+        if len(samples) == 0:
+            return []
+        voltage = samples[:, 0]
+        previous = np.concatenate([[voltage[0] if self.last_voltage is None else self.last_voltage], voltage[:-1]])
+        resets = np.flatnonzero(previous - voltage > self.threshold)
+        sweeps = []
+        block_start = self.buffer.total
+        done = 0
+        for reset in resets:
+            # Sample ``reset`` starts a new sweep: the running one ends just before it
+            self.buffer.extend(samples[done:reset])
+            done = reset
+            sweeps.extend(self._complete(block_start + reset))
+        self.buffer.extend(samples[done:])
+        self.last_voltage = voltage[-1]
+        return sweeps
+
+    def flush(self):
+        """Complete the running sweep (at the end of the stream)."""
+        return self._complete(self.buffer.total)
+
+    def _complete(self, end):
+        n_points = end - self.sweep_start
+        self.sweep_start = end
+        if n_points < self.min_points or n_points > self.buffer.capacity:
+            self.discarded += 1
+            return []
+        sweep = self.buffer.last(n_points).T.copy()
+        return [(sweep[0], sweep[1])]
+
+
+@dataclass
+class SweepResult:
+    sweep: int  # Running number of the analysed sweep
+    n_points: int
+    Te: float
+    Vp: float  # From the derivative peak
+    Vp_intersection: float
+    Ie_sat: float
+    Te_average: float
+    Vp_average: float
+    Ie_sat_average: float
+    latency: float  # s from the end of the sweep to the result
+    derivative: np.ndarray = None  # Smoothed dI/dV of the sweep
+
+    def summary(self):
+        return (f"sweep {self.sweep}: Te={self.Te:.3g} eV Vp={self.Vp:.3g} V Ie_sat={self.Ie_sat:.3e} A "
+                f"(average Te={self.Te_average:.3g} eV Vp={self.Vp_average:.3g} V "
+                f"Ie_sat={self.Ie_sat_average:.3e} A) latency {self.latency * 1e3:.1f} ms")
+
+
+def _average(previous, value, weight):
+    if previous is None or not np.isfinite(previous):
+        return value
+    if not np.isfinite(value):
+        return previous
+    return (1 - weight) * previous + weight * value
+
+
+class StreamAnalyzer:
+    """Assemble sweeps from a sample stream and analyse each as it completes."""
+
+    def __init__(self, capacity=ring_capacity, threshold=reset_threshold, min_points=min_sweep_points,
+                 weight=average_weight, max_pending=2, history=1000, on_result=None):
+        self.assembler = SweepAssembler(capacity, threshold, min_points)
+        self.weight = weight
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.results = deque(maxlen=history)
+        self.on_result = on_result
+        self.samples = 0
+        self.dropped = 0  # Sweeps dropped because the analysis fell behind
+        self.analysed = 0
+        self.failed = 0  # Sweeps whose analysis or on_result raised
+        self.errors = deque(maxlen=history)  # (completion time, reason) of the failed sweeps
+        self._averages = {'Te': None, 'Vp': None, 'Ie_sat': None}
+
+    @property
+    def latest(self):
+        return self.results[-1] if self.results else None
+
+    def feed(self, samples):
+        """Push an ``(n, 2)`` block of samples; completed sweeps are queued for analysis."""
+        self.samples += len(samples)
+        self._enqueue(self.assembler.push(samples))
+
+    def _enqueue(self, sweeps):
+        for voltage, current in sweeps:
+            if self.queue.full():
+                # Keep latency bounded: the oldest waiting sweep makes way
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self.dropped += 1
+            self.queue.put_nowait((voltage, current, time.perf_counter()))
+
+    def analyse(self, voltage, current, completed):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result, fits = analysis.analyze_batch(voltage, current, return_fits=True)
+        result = result[0]
+        self.analysed += 1
+        Te, Vp, Ie_sat = float(result['Te']), float(result['Vp_derivative']), float(result['Ie_sat'])
+        for name, value in (('Te', Te), ('Vp', Vp), ('Ie_sat', Ie_sat)):
+            self._averages[name] = _average(self._averages[name], value, self.weight)
+        return SweepResult(self.analysed, len(voltage), Te, Vp, float(result['Vp_intersection']), Ie_sat,
+                           self._averages['Te'], self._averages['Vp'], self._averages['Ie_sat'],
+                           time.perf_counter() - completed, fits['derivative'][0])
+
+    async def _analyse_queue(self):
+        while True:
+            voltage, current, completed = await self.queue.get()
+            try:
+                # Off the event loop, so reading keeps up while a sweep is analysed
+                sweep_result = await asyncio.to_thread(self.analyse, voltage, current, completed)
+                self.results.append(sweep_result)
+                if self.on_result is not None:
+                    self.on_result(sweep_result)
+            except Exception as error:
+                # One bad sweep must not stop the stream; it is counted and its reason kept
+                self.failed += 1
+                self.errors.append((completed, f"{type(error).__name__}: {error}"))
+            finally:
+                self.queue.task_done()
+
+    def _check_worker(self, worker):
+        # Raise the analysis worker's exception if it died, instead of waiting for it forever
+        if worker.done():
+            worker.result()
+            raise RuntimeError("the analysis worker stopped")
+
+    async def consume(self, reader):
+        """Read ``voltage,current`` lines from an ``asyncio.StreamReader`` until EOF."""
+        worker = asyncio.create_task(self._analyse_queue())
+        remainder = b''
+        try:
+            while True:
+                chunk = await reader.read(read_size)
+                if not chunk:
+                    break
+                lines, _, remainder = (remainder + chunk).rpartition(b'\n')
+                self.feed(parse_samples(lines))
+                self._check_worker(worker)
+            if remainder.strip():
+                self.feed(parse_samples(remainder))
+            # The last sweep has no following reset; close it at end of stream
+            self._enqueue(self.assembler.flush())
+            joined = asyncio.ensure_future(self.queue.join())
+            await asyncio.wait({joined, worker}, return_when=asyncio.FIRST_COMPLETED)
+            if not joined.done():
+                joined.cancel()
+                self._check_worker(worker)
+        finally:
+            worker.cancel()
+
+    async def run(self, source):
+        """Consume ``source``: ``tcp://host:port``, ``-`` for stdin, or a file/FIFO/device path."""
+        # The analysis loads scipy.signal (about a second) on first use; load it before connecting,
+        # so the first sweeps are not delayed or dropped while it loads
+        await asyncio.to_thread(importlib.import_module, 'scipy.signal')
+        reader, close = await open_source(source)
+        try:
+            await self.consume(reader)
+        finally:
+            close()
+
+
+def parse_samples(text):
+    """``(n, 2)`` array from ``voltage,current`` lines; malformed lines are skipped."""
+    rows = []
+    for line in text.split(b'\n'):
+        fields = line.split(b',')
+        if len(fields) != 2:
+            continue
+        try:
+            rows.append((float(fields[0]), float(fields[1])))
+        except ValueError:
+            continue
+    return np.array(rows, dtype=float).reshape(-1, 2)
+
+
+async def open_source(source):
+    """Return ``(reader, close)`` for a source spec (see ``StreamAnalyzer.run``)."""
+    if source.startswith('tcp://'):
+        host, _, port = source[len('tcp://'):].rpartition(':')
+        reader, writer = await asyncio.open_connection(host or '127.0.0.1', int(port))
+        return reader, writer.close
+    loop = asyncio.get_running_loop()
+    pipe = sys.stdin.buffer if source == '-' else open(source, 'rb', buffering=0)
+    reader = asyncio.StreamReader()
+    try:
+        transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    except ValueError:
+        # Regular files cannot be polled; read them in a thread instead
+        def pump():
+            while True:
+                data = pipe.read(read_size)
+                if not data:
+                    break
+                loop.call_soon_threadsafe(reader.feed_data, data)
+            loop.call_soon_threadsafe(reader.feed_eof)
+        loop.run_in_executor(None, pump)
+        return reader, pipe.close
+    return reader, transport.close
+
+
+class FakeInstrument:
+    """TCP server that replays LMSIMData files as ``voltage,current`` lines.
+
+    Every connection gets the selected files in order, ``rate`` samples per
+    second (0: as fast as possible), ``repeat`` times (0: forever).
+    """
+
+    def __init__(self, directory='LMSIMData', kind='averaged_noisy', rate=50000, repeat=1, block=256):
+        index = ArchiveIndex(directory)
+        self.curves = [index.load(entry, mmap_mode=None) for entry in index.select(kind=kind)]
+        if not self.curves:
+            raise ValueError(f"no {kind} files in {directory}")
+        self.rate = rate
+        self.repeat = repeat
+        self.block = block
+        self.server = None
+
+    def lines(self):
+        # Text for every curve, encoded once
+        return [''.join(f"{v!r},{i!r}\n" for v, i in zip(*curve.tolist())).encode().splitlines(keepends=True)
+                for curve in self.curves]
+
+    async def _serve(self, reader, writer):
+        curves = self.lines()
+        start = time.perf_counter()
+        sent = 0
+        try:
+            cycle = 0
+            while self.repeat == 0 or cycle < self.repeat:
+                for lines in curves:
+                    for first in range(0, len(lines), self.block):
+                        block = lines[first:first + self.block]
+                        writer.write(b''.join(block))
+                        await writer.drain()
+                        sent += len(block)
+                        if self.rate:
+                            # Pace against the wall clock so the average rate holds
+                            delay = start + sent / self.rate - time.perf_counter()
+                            if delay > 0:
+                                await asyncio.sleep(delay)
+                        else:
+                            await asyncio.sleep(0)  # Let a consumer in the same process run
+                cycle += 1
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=DEFAULT_PORT):
+        self.server = await asyncio.start_server(self._serve, host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+
+async def _demo(args):
+    instrument = FakeInstrument(args.directory, args.kind, args.rate, args.repeat)
+    host, port = await instrument.start(port=0)
+    analyzer = StreamAnalyzer(max_pending=args.max_pending, on_result=lambda result: print(result.summary()))
+    try:
+        await analyzer.run(f"tcp://{host}:{port}")
+    finally:
+        instrument.close()
+    return analyzer
+
+
+def _report(analyzer):
+    latencies = [result.latency for result in analyzer.results]
+    if latencies:
+        print(f"{analyzer.analysed} sweeps from {analyzer.samples} samples; latency mean "
+              f"{np.mean(latencies) * 1e3:.1f} ms, max {np.max(latencies) * 1e3:.1f} ms; "
+              f"{analyzer.dropped} dropped, {analyzer.assembler.discarded} incomplete")
+    if analyzer.failed:
+        print(f"{analyzer.failed} sweeps failed, last: {analyzer.errors[-1][1]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Streaming Langmuir analysis of live probe sweeps.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    listen = commands.add_parser('listen', help="analyse sweeps from tcp://host:port, - (stdin) or a path")
+    listen.add_argument('source')
+    listen.add_argument('--threshold', type=float, default=reset_threshold, help="voltage drop (V) between sweeps")
+    listen.add_argument('--max-pending', type=int, default=2, help="sweeps waiting for analysis before dropping")
+    for name in ('serve', 'demo'):
+        command = commands.add_parser(name, help="fake instrument replaying LMSIMData" if name == 'serve'
+                                      else "fake instrument and analyser in one process")
+        command.add_argument('--directory', default='LMSIMData')
+        command.add_argument('--kind', choices=('theory', 'averaged_noisy'), default='averaged_noisy')
+        command.add_argument('--rate', type=float, default=50000, help="samples per second (0: unpaced)")
+        command.add_argument('--repeat', type=int, default=1 if name == 'demo' else 0,
+                             help="passes over the files (0: forever)")
+    commands.choices['serve'].add_argument('--host', default='127.0.0.1')
+    commands.choices['serve'].add_argument('--port', type=int, default=DEFAULT_PORT)
+    commands.choices['demo'].add_argument('--max-pending', type=int, default=2)
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        async def serve():
+            instrument = FakeInstrument(args.directory, args.kind, args.rate, args.repeat)
+            host, port = await instrument.start(args.host, args.port)
+            print(f"replaying {len(instrument.curves)} curves from {os.path.abspath(args.directory)} "
+                  f"on tcp://{host}:{port}")
+            await instrument.server.serve_forever()
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            pass
+        return
+    if args.command == 'demo':
+        analyzer = asyncio.run(_demo(args))
+    else:
+        analyzer = StreamAnalyzer(threshold=args.threshold, max_pending=args.max_pending,
+                                  on_result=lambda result: print(result.summary()))
+        try:
+            asyncio.run(analyzer.run(args.source))
+        except KeyboardInterrupt:
+            pass
+    _report(analyzer)
+
+
+if __name__ == '__main__':
+    main()
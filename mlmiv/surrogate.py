@@ -0,0 +1,260 @@
+"""Surrogate index: instant parameter estimates from a precomputed grid of model curves.
+
+``SurrogateIndex.build`` runs the theory model (``simulate.simulate_batch``:
+Vp, the saturation currents, Ie, Ip and the knee smoothing) over a dense,
+log-spaced Te x ne grid covering the plasmas of interest and keeps one short
+feature vector per curve in a KD-tree (``scipy.spatial.cKDTree``):
+
+- the curve divided by its largest current, projected on the leading
+  principal components of all normalised grid curves;
+- the derivative-peak voltage (``analysis.smoothed_derivative``);
+- log10 of the largest current.
+
+``estimate`` computes the same features for measured curves (resampled to
+the index's voltage grid when theirs differs) and looks up the
+``neighbours`` nearest grid curves, O(log n) per curve. Te, ne, ni and Vp
+are interpolated between them with inverse-distance weights, ne and ni after
+scaling each neighbour by the ratio of the measured to its largest current.
+The weighted spread of the neighbours' values is reported as the
+interpolation error, together with the feature distance to the nearest grid
+curve, which grows outside the grid's envelope. ``refine`` starts the model
+fits of ``mlmiv.inverse`` from the estimates.
+
+Indexes are saved as compressed ``.npz`` files; the tree is rebuilt on load.
+
+Example, from the repository root:
+
+    python -m mlmiv.surrogate build -o surrogate.npz
+    python -m mlmiv.surrogate estimate surrogate.npz LMSIMData -o estimates.csv --refine
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from . import analysis, grid, simulate
+
+GRID_PARAMETERS = ('Te', 'ne', 'ni', 'Vp')
+SURROGATE_DTYPE = np.dtype([(name, float) for name in GRID_PARAMETERS] + [
+    ('Te_error', float),  # Relative spread of the neighbours' Te
+    ('ne_error', float),  # Relative spread of the neighbours' (scaled) ne
+    ('ni_error', float),  # Relative spread of the neighbours' (scaled) ni
+    ('Vp_error', float),  # Spread of the neighbours' Vp in V
+    ('distance', float),  # Feature distance to the nearest grid curve (inf for unusable curves)
+])
+
+# Grid and index settings
+Te_range = (0.1, 2.0)  # eV, log-spaced
+Te_points = 160
+ne_range = (1e15, 1e17)  # m^-3, log-spaced
+ne_points = 41
+ni_ratio = 1.0  # ni = ni_ratio * ne on the grid
+components = 16  # Principal components of the normalised curves in each feature vector
+peak_weight = 0.1  # Feature units per V of derivative-peak voltage (it jitters on noisy curves)
+scale_weight = 0.3  # Feature units per decade of the largest current
+neighbours = 4  # Grid curves interpolated per estimate
+
+
+def _features(V_range, currents, mean, basis, peak_weight, scale_weight, scale=None):
+    # (features, scale, usable) of the currents on V_range
+    if scale is None:
+        scale = np.max(currents, axis=1)
+    usable = np.isfinite(scale) & (scale > 0) & np.all(np.isfinite(currents), axis=1)
+    safe_scale = np.where(usable, scale, 1.0)
+    projected = (currents / safe_scale[:, None] - mean) @ basis.T
+    # The derivative filter raises on non-finite samples, so only usable rows get a peak
+    peak_index = np.full(len(currents), -1)
+    if usable.any():
+        with np.errstate(invalid='ignore', divide='ignore'):
+            derivative = analysis.smoothed_derivative(V_range, currents[usable])
+        peak_index[usable] = analysis.derivative_peak_index(derivative)
+    usable &= peak_index >= 0
+    peak = V_range[np.maximum(peak_index, 0)]
+    features = np.column_stack([projected, peak_weight * peak, scale_weight * np.log10(safe_scale)])
+    return features, scale, usable
+
+
+class SurrogateIndex:
+    """Feature vectors of a grid of model curves, with the grid parameters and a KD-tree over them."""
+
+    def __init__(self, V_range, parameters, scale, mean, basis, features, peak_weight=peak_weight,
+                 scale_weight=scale_weight, model=None):
+        from scipy.spatial import cKDTree
+        self.V_range = np.asarray(V_range, dtype=float)
+        self.parameters = {name: np.asarray(parameters[name], dtype=float) for name in GRID_PARAMETERS}
+        self.scale = np.asarray(scale, dtype=float)  # Largest current of every grid curve
+        self.mean = np.asarray(mean, dtype=float)  # Mean normalised curve
+        self.basis = np.asarray(basis, dtype=float)  # (components, V_points) principal directions
+        self.features = np.asarray(features, dtype=float)
+        self.peak_weight = float(peak_weight)
+        self.scale_weight = float(scale_weight)
+        self.model = dict(model or {})  # simulate_batch options of the grid, for the record
+        self.tree = cKDTree(self.features)
+
+    def __len__(self):
+        return len(self.features)
+
+    @classmethod
+    def build(cls, V_range=None, Te=None, ne=None, ni_ratio=ni_ratio, components=components,
+              peak_weight=peak_weight, scale_weight=scale_weight, **model):
+        """Simulate the grid and index it.
+
+        ``Te`` and ``ne`` are the grid axes (default: ``Te_points`` and
+        ``ne_points`` log-spaced values over ``Te_range`` and ``ne_range``).
+        ``model`` holds further ``simulate_batch`` options shared by the whole
+        grid (``height_modifier``, ``stretch_modifier``, the slopes, ``Tp`` and
+        the probe geometry); the knee is smoothed in ``'fast'`` mode.
+        """
+        V_range = simulate.voltage_range() if V_range is None else np.asarray(V_range, dtype=float)
+        Te = np.geomspace(*Te_range, Te_points) if Te is None else np.asarray(Te, dtype=float)
+        ne = np.geomspace(*ne_range, ne_points) if ne is None else np.asarray(ne, dtype=float)
+        grid = simulate.parameter_grid(Te, ne)
+        grid['ni'] = ni_ratio * grid['ne']
+        model.setdefault('smoothing_mode', 'fast')
+        batch = simulate.simulate_batch(grid['Te'], grid['ne'], grid['ni'], V_range=V_range, **model)
+        parameters = {'Te': grid['Te'], 'ne': grid['ne'], 'ni': grid['ni'], 'Vp': batch.Vp}
+
+        scale = np.max(batch.total, axis=1)
+        normalised = batch.total / scale[:, None]
+        mean = normalised.mean(axis=0)
+        normalised -= mean
+        # Principal directions from the eigenvectors of the covariance, largest first
+        _, vectors = np.linalg.eigh(normalised.T @ normalised)
+        basis = vectors[:, ::-1][:, :components].T.copy()
+        features, _, _ = _features(V_range, batch.total, mean, basis, peak_weight, scale_weight, scale)
+        return cls(V_range, parameters, scale, mean, basis, features, peak_weight, scale_weight, model)
+
+    def estimate(self, voltage, currents, neighbours=neighbours):
+        """Interpolated Te, ne, ni and Vp of every row of ``currents`` on ``voltage``.
+
+        Returns a structured array with the fields of ``SURROGATE_DTYPE``;
+        curves with non-finite samples, without a positive maximum or without
+        a derivative peak get NaN values and an infinite distance.
+        """
+        voltage = np.asarray(voltage, dtype=float)
+        currents = grid.resample(voltage, np.atleast_2d(np.asarray(currents, dtype=float)), self.V_range)
+        features, scale, usable = _features(self.V_range, currents, self.mean, self.basis, self.peak_weight,
+                                            self.scale_weight)
+        result = np.full(len(currents), np.nan, dtype=SURROGATE_DTYPE)
+        result['distance'] = np.inf
+        if not usable.any():
+            return result
+        distance, neighbour = self.tree.query(features[usable], k=min(neighbours, len(self)))
+        distance, neighbour = distance.reshape(len(distance), -1), neighbour.reshape(len(neighbour), -1)
+        weights = 1 / np.maximum(distance, 1e-12)
+        weights /= weights.sum(axis=1, keepdims=True)
+        rescale = np.log(scale[usable][:, None] / self.scale[neighbour])
+
+        def interpolated(values):
+            value = np.sum(weights * values, axis=1)
+            spread = np.sqrt(np.sum(weights * (values - value[:, None]) ** 2, axis=1))
+            return value, spread
+
+        log_Te, Te_spread = interpolated(np.log(self.parameters['Te'][neighbour]))
+        log_ne, ne_spread = interpolated(np.log(self.parameters['ne'][neighbour]) + rescale)
+        log_ni, ni_spread = interpolated(np.log(self.parameters['ni'][neighbour]) + rescale)
+        Vp, Vp_spread = interpolated(self.parameters['Vp'][neighbour])
+        for name, value in (('Te', np.exp(log_Te)), ('ne', np.exp(log_ne)), ('ni', np.exp(log_ni)), ('Vp', Vp),
+                            ('Te_error', np.expm1(Te_spread)), ('ne_error', np.expm1(ne_spread)),
+                            ('ni_error', np.expm1(ni_spread)), ('Vp_error', Vp_spread),
+                            ('distance', distance[:, 0])):
+            result[name][usable] = value
+        return result
+
+    def refine(self, voltage, currents, estimates=None, **options):
+        """``inverse.fit_curves`` of ``currents`` started from the index's estimates.
+
+        ``options`` are passed on to ``fit_curves``. Returns its
+        ``(result, report)``.
+        """
+        from . import inverse
+        if estimates is None:
+            estimates = self.estimate(voltage, currents)
+        start = dict(options.pop('start', None) or {})
+        for name in GRID_PARAMETERS:
+            start.setdefault(name, estimates[name])
+        return inverse.fit_curves(voltage, currents, start=start, **options)
+
+    def save(self, path):
+        np.savez_compressed(path, V_range=self.V_range, scale=self.scale, mean=self.mean, basis=self.basis,
+                            features=self.features, weights=[self.peak_weight, self.scale_weight],
+                            model=json.dumps(self.model),
+                            **{f'parameter_{name}': values for name, values in self.parameters.items()})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['V_range'], {name: data[f'parameter_{name}'] for name in GRID_PARAMETERS},
+                       data['scale'], data['mean'], data['basis'], data['features'], *data['weights'],
+                       json.loads(str(data['model'])))
+
+    def summary(self):
+        Te, ne = self.parameters['Te'], self.parameters['ne']
+        return (f"{len(self)} grid curves, Te {Te.min():.3g}-{Te.max():.3g} eV, ne {ne.min():.3g}-{ne.max():.3g} "
+                f"m^-3, {len(self.V_range)} voltage points, {self.basis.shape[0]} components")
+
+
+def estimate_sources(index, sources, kind=None, refine=False):
+    """Estimates for every curve of LMSIMData directories and/or HDF5 datasets, as a pandas DataFrame."""
+    from . import reprocess
+    frames = []
+    for task in reprocess.plan_tasks(sources, kind=kind):
+        groups, labels = reprocess._load_task(task)
+        rows = [None] * len(labels)
+        for voltage, currents, positions in groups:
+            estimates = index.estimate(voltage, currents)
+            columns = {name: estimates[name] for name in SURROGATE_DTYPE.names}
+            if refine:
+                fitted, _ = index.refine(voltage, currents, estimates)
+                columns.update({f'fit_{name}': fitted[name] for name in fitted.dtype.names})
+            for offset, position in enumerate(positions):
+                rows[position] = {**labels[position], **{name: values[offset] for name, values in columns.items()}}
+        frames.extend(rows)
+    return reprocess._pandas().DataFrame(frames)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a surrogate index of model curves and look up "
+                                                 "parameter estimates in it.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="simulate and index a Te x ne grid")
+    build.add_argument('-o', '--output', required=True, help="index file, .npz")
+    build.add_argument('--te-range', type=float, nargs=2, default=Te_range, metavar=('MIN', 'MAX'))
+    build.add_argument('--te-points', type=int, default=Te_points)
+    build.add_argument('--ne-range', type=float, nargs=2, default=ne_range, metavar=('MIN', 'MAX'))
+    build.add_argument('--ne-points', type=int, default=ne_points)
+    build.add_argument('--ni-ratio', type=float, default=ni_ratio, help="ni / ne on the grid")
+    build.add_argument('--components', type=int, default=components)
+    build.add_argument('--stretch', type=float, default=simulate.stretch_modifier, help="stretch_modifier")
+    estimate = commands.add_parser('estimate', help="estimate the parameters of every curve of the sources")
+    estimate.add_argument('index', help="index file written by build")
+    estimate.add_argument('sources', nargs='+', help="LMSIMData-style directories and/or .h5 dataset files")
+    estimate.add_argument('-o', '--output', required=True, help="results table, .csv or .parquet")
+    estimate.add_argument('--kind', choices=('theory', 'averaged_noisy'), default=None)
+    estimate.add_argument('--refine', action='store_true', help="also run the inverse model fits from the estimates")
+    args = parser.parse_args(argv)
+
+    start_time = time.perf_counter()
+    if args.command == 'build':
+        index = SurrogateIndex.build(Te=np.geomspace(*args.te_range, args.te_points),
+                                     ne=np.geomspace(*args.ne_range, args.ne_points), ni_ratio=args.ni_ratio,
+                                     components=args.components, stretch_modifier=args.stretch)
+        index.save(args.output)
+        print(f"{index.summary()}; built in {time.perf_counter() - start_time:.2f} s, written to {args.output}")
+        return
+
+    from . import reprocess
+    output_format = reprocess.check_output_format(args.output)
+    index = SurrogateIndex.load(args.index)
+    table = estimate_sources(index, args.sources, args.kind, args.refine)
+    if output_format == 'parquet':
+        table.to_parquet(args.output, index=False)
+    else:
+        table.to_csv(args.output, index=False)
+    print(f"{len(table)} curves estimated in {time.perf_counter() - start_time:.2f} s; "
+          f"results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""Fits of the EEDF script's ``a * tanh(b * (x - c)) + d`` step, one row at a time.
+
+The script starts both fits from ``(1, 0.5, 0, 0)`` with finite-difference
+Jacobians. Probe currents are of order mA, so that guess is three orders of
+magnitude off in ``a`` and ``d`` and the knee is rarely near 0 V. Here every
+fit uses the analytic Jacobian and starts from
+
+- ``'data'``: plateau levels from the ends of the curve (``a``, ``d``), the
+  knee at the steepest point of the curve (``c``) and ``b`` from the slope
+  there (``dy/dx = a * b`` at the knee);
+- ``'warm'``: the previous row's solution, for ordered sweeps and time
+  series, falling back to ``'data'`` if that fit fails;
+- ``'fixed'``: the script's guess, or the ``p0`` passed in (one start for
+  all rows or one per row, e.g. a previous fit of the same curves).
+
+``fit_tanh`` returns the parameters together with a ``FitReport`` with the
+time, function evaluations and failures of the batch. ``fit_tanh_legacy``
+runs the script's own fits (fixed guess, numerical Jacobian) with the same
+report, for comparison.
+"""
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+script_guess = (1, 0.5, 0, 0)  # a, b, c, d as in MLM-IV-EEDF-Analysis.py
+plateau_fraction = 0.05  # Share of points at each end averaged for the plateau levels
+GUESSES = ('data', 'warm', 'fixed')
+
+
+def tanh_model(x, a, b, c, d):
+    return a * np.tanh(b * (x - c)) + d
+
+
+def tanh_jacobian(x, a, b, c, d):
+    """``(n_points, 4)`` derivatives of ``tanh_model`` with respect to ``a, b, c, d``."""
+    t = np.tanh(b * (x - c))
+    sech2 = 1 - t ** 2
+    return np.column_stack([t, a * sech2 * (x - c), -a * b * sech2, np.ones_like(x)])
+
+
+def data_guess(x, y):
+    """Initial ``(a, b, c, d)`` from the plateau levels and the steepest point of ``y``."""
+    k = max(1, int(len(x) * plateau_fraction))
+    low, high = np.mean(y[:k]), np.mean(y[-k:])
+    a = (high - low) / 2
+    d = (high + low) / 2
+    if a == 0:
+        return np.array(script_guess, dtype=float)
+    slope = np.gradient(y, x) * np.sign(a)
+    knee = np.argmax(slope)
+    b = slope[knee] / abs(a)
+    if not np.isfinite(b) or b <= 0:
+        b = 4 / (x[-1] - x[0])  # Step over the central half of the range
+    return np.array([a, b, x[knee], d])
+
+
+@dataclass
+class FitReport:
+    n_fits: int
+    elapsed: float  # Wall time of the batch in s
+    nfev: np.ndarray  # Function evaluations per row (all attempts)
+    success: np.ndarray  # Per row
+    errors: list  # Reason per failed row, '' otherwise
+    retries: int = 0  # Warm starts that were repeated from the data guess
+    method: str = 'lm'
+    guess: str = 'data'
+    njev: np.ndarray = None  # Jacobian evaluations per row
+
+    @property
+    def failures(self):
+        return int(self.n_fits - np.count_nonzero(self.success))
+
+    @property
+    def failure_rate(self):
+        return self.failures / self.n_fits if self.n_fits else 0.0
+
+    @property
+    def mean_nfev(self):
+        return float(np.mean(self.nfev)) if self.n_fits else 0.0
+
+    def summary(self):
+        return (f"{self.n_fits} tanh fits ({self.guess} start, {self.method}) in {self.elapsed * 1e3:.1f} ms, "
+                f"{self.mean_nfev:.1f} evaluations per fit, {self.failures} failed "
+                f"({self.failure_rate:.1%}), {self.retries} warm-start retries")
+
+
+def _fit_one(x, y, p0, method, scale=1.0):
+    # scale is the square root of the per-point weights
+    from scipy.optimize import least_squares
+    result = least_squares(lambda p: (tanh_model(x, *p) - y) * scale, p0,
+                           jac=lambda p: tanh_jacobian(x, *p) * np.reshape(scale, (-1, 1)), method=method)
+    ok = result.success and np.all(np.isfinite(result.x))
+    return result, ok
+
+
+def fit_tanh(x, currents, guess='data', p0=None, method='lm', weights=None):
+    """Fit ``tanh_model`` to every row of ``currents`` on the shared ``x`` row.
+
+    ``guess`` is one of ``GUESSES``; ``p0`` (``(4,)`` or ``(n_rows, 4)``)
+    replaces the script guess for ``'fixed'``, where rows with a non-finite
+    start use the data guess, and seeds the first row for ``'warm'``. ``method`` is passed
+    to ``scipy.optimize.least_squares``. ``weights`` (one per point of ``x``,
+    default 1) weight the squared residuals, e.g. the point spacing on a
+    non-uniform grid. Returns ``(params, report)``; failed rows have ``nan``
+    parameters.
+    """
+    if guess not in GUESSES:
+        raise ValueError(f"guess must be one of {GUESSES}, got {guess!r}")
+    x = np.asarray(x, dtype=float)
+    currents = np.atleast_2d(np.asarray(currents, dtype=float))
+    scale = 1.0 if weights is None else np.sqrt(np.asarray(weights, dtype=float))
+    n_fits = len(currents)
+    params = np.full((n_fits, 4), np.nan)
+    nfev = np.zeros(n_fits, dtype=int)
+    njev = np.zeros(n_fits, dtype=int)
+    success = np.zeros(n_fits, dtype=bool)
+    errors = [''] * n_fits
+    retries = 0
+    starts = np.broadcast_to(np.asarray(script_guess if p0 is None else p0, dtype=float), (n_fits, 4))
+    previous = None if p0 is None or guess != 'warm' else starts[0]
+
+    start_time = time.perf_counter()
+    for row, y in enumerate(currents):
+        if guess == 'fixed' and np.all(np.isfinite(starts[row])):
+            start = starts[row]
+        elif guess == 'warm' and previous is not None:
+            start = previous
+        else:
+            start = data_guess(x, y)
+        try:
+            result, ok = _fit_one(x, y, start, method, scale)
+            nfev[row], njev[row] = result.nfev, result.njev or 0
+            if not ok and guess == 'warm' and previous is not None:
+                # A jump between neighbouring rows: start again from this row's own data
+                retries += 1
+                result, ok = _fit_one(x, y, data_guess(x, y), method, scale)
+                nfev[row] += result.nfev
+                njev[row] += result.njev or 0
+        except ValueError as error:  # e.g. non-finite currents
+            errors[row] = f"ValueError: {error}"
+            continue
+        if ok:
+            params[row] = result.x
+            success[row] = True
+            previous = result.x
+        else:
+            errors[row] = f"fit failed: {result.message}"
+    report = FitReport(n_fits, time.perf_counter() - start_time, nfev, success, errors, retries, method, guess, njev)
+    return params, report
+
+
+def fit_tanh_legacy(x, currents, method='curve_fit'):
+    """The script's fits: ``curve_fit`` or ``least_squares`` from ``script_guess``, numerical Jacobian."""
+    from scipy.optimize import curve_fit, least_squares
+    x = np.asarray(x, dtype=float)
+    currents = np.atleast_2d(np.asarray(currents, dtype=float))
+    n_fits = len(currents)
+    params = np.full((n_fits, 4), np.nan)
+    nfev = np.zeros(n_fits, dtype=int)
+    success = np.zeros(n_fits, dtype=bool)
+    errors = [''] * n_fits
+    start_time = time.perf_counter()
+    for row, y in enumerate(currents):
+        try:
+            if method == 'curve_fit':
+                popt, _, info, _, _ = curve_fit(tanh_model, x, y, p0=script_guess, full_output=True)
+                params[row], nfev[row] = popt, info['nfev']
+                success[row] = True  # curve_fit raises when it does not converge
+            else:
+                result = least_squares(lambda p: tanh_model(x, *p) - y, script_guess)
+                params[row], nfev[row] = result.x, result.nfev
+                success[row] = result.success and np.all(np.isfinite(result.x))
+        except (RuntimeError, ValueError) as error:
+            errors[row] = f"{type(error).__name__}: {error}"
+    report = FitReport(n_fits, time.perf_counter() - start_time, nfev, success, errors, 0, method, 'script')
+    return params, report
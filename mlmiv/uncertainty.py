@@ -0,0 +1,195 @@
+"""Monte-Carlo confidence intervals for the results of ``analysis.analyze_batch``.
+
+MLM-IV-Analysis.py reports point estimates only. ``analysis_intervals``
+perturbs every curve ``n_draws`` times, analyses the ``(n_draws, n_points)``
+stack with ``analyze_batch`` (one call per ``chunk_size`` draws) and reports
+the median, the central ``confidence`` interval and the standard deviation of
+every result over the draws. Two ways of drawing are available:
+
+``'residuals'``
+    Bootstrap of the curve's own residuals: the curve is split into its
+    Savitzky-Golay smoothed part (the analysis' ``savgol_window`` and
+    ``savgol_order``) and the residuals, and every draw adds the residuals
+    back with random signs (wild bootstrap). Unlike drawing residuals with
+    replacement, this keeps each one at its voltage, so noise that is
+    largest around Vp (as in MLM-IV-SimPlot.py) stays there.
+``'noise'``
+    The noise model of ``mlmiv.noise``: Gaussian noise of
+    ``noise_amplitude`` weighted around the curve's derivative-peak Vp,
+    divided by ``sqrt(num_samples)`` for curves that average
+    ``num_samples`` sweeps.
+
+Every curve draws from its own generator (``noise.spawn_seeds`` of
+``seed``), so its intervals do not depend on the other curves or the chunk
+size.
+
+Example, from the repository root:
+
+    python -m mlmiv.uncertainty LMSIMData -o intervals.csv --kind averaged_noisy --draws 2000
+"""
+import argparse
+import time
+import warnings
+from dataclasses import dataclass
+
+import numpy as np
+
+from . import analysis, grid, noise
+
+METHODS = ('residuals', 'noise')
+QUANTITIES = analysis.RESULT_DTYPE.names
+STATISTICS = ('median', 'low', 'high', 'std')
+INTERVAL_DTYPE = np.dtype([(name, float) for name in QUANTITIES]  # Analysis of the curve itself
+                          + [(f'{name}_{statistic}', float) for name in QUANTITIES for statistic in STATISTICS]
+                          + [('valid_draws', int)])  # Draws with a finite result for every quantity
+
+# Monte-Carlo settings
+n_draws = 1000
+confidence = 0.95  # Central interval between the _low and _high percentiles
+chunk_size = 2048  # Draws analysed per analyze_batch call
+
+
+@dataclass
+class IntervalReport:
+    n_curves: int
+    n_draws: int  # Per curve
+    method: str
+    elapsed: float  # Wall time in s
+
+    @property
+    def draws_per_second(self):
+        return self.n_curves * self.n_draws / self.elapsed if self.elapsed > 0 else float('inf')
+
+    def summary(self):
+        return (f"{self.n_curves} curves x {self.n_draws} {self.method} draws in {self.elapsed:.2f} s "
+                f"({self.draws_per_second:.0f} draws/s)")
+
+
+def _draw(rng, centre, spread, method, out):
+    # Draws of centre + spread * (random signs for the bootstrap, standard normal for the noise) in out
+    if method == 'residuals':
+        signs = rng.integers(0, 2, size=out.shape, dtype=np.int8)
+        np.multiply(signs, 2 * spread, out=out)
+        out += centre - spread
+    else:
+        rng.standard_normal(out=out)
+        out *= spread
+        out += centre
+    return out
+
+
+def analysis_intervals(voltage, currents, n_draws=n_draws, method='residuals', confidence=confidence, seed=None,
+                       noise_amplitude=noise.noise_amplitude, num_samples=noise.num_samples,
+                       chunk_size=chunk_size, Aprobe=None):
+    """Confidence intervals of the analysis results of every row of ``currents`` on ``voltage``.
+
+    ``method`` is ``'residuals'`` or ``'noise'`` (see the module docstring;
+    ``noise_amplitude`` and ``num_samples`` only apply to ``'noise'``).
+    ``seed`` is the root of the per-row seeds (``noise.spawn_seeds``) or, as
+    ``seeds`` of ``noise.averaged_noisy_batch``, one seed per row.
+    Returns ``(result, report)``: a structured array with the fields of
+    ``INTERVAL_DTYPE`` and an ``IntervalReport``.
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, got {method!r}")
+    if not 0 < confidence < 1:
+        raise ValueError(f"confidence must be between 0 and 1, got {confidence!r}")
+    options = {} if Aprobe is None else {'Aprobe': Aprobe}
+    voltage = np.asarray(voltage, dtype=float)
+    currents = np.atleast_2d(np.asarray(currents, dtype=float))
+    start_time = time.perf_counter()
+
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        point = analysis.analyze_batch(voltage, currents, **options)
+    if method == 'residuals':
+        centres = grid.savgol_filter(voltage, currents, analysis.savgol_window, analysis.savgol_order)
+        spreads = currents - centres
+    else:
+        centres = currents
+        Vp = np.where(np.isfinite(point['Vp_derivative']), point['Vp_derivative'], np.mean(voltage))
+        spreads = noise_amplitude / np.sqrt(num_samples) * noise.noise_factor(voltage, Vp[:, None])
+
+    result = np.empty(len(currents), dtype=INTERVAL_DTYPE)
+    for name in QUANTITIES:
+        result[name] = point[name]
+    quantiles = [0.5, (1 - confidence) / 2, (1 + confidence) / 2]
+    buffer = np.empty((min(chunk_size, n_draws), len(voltage)))
+    values = np.empty((n_draws, len(QUANTITIES)))
+    seeds = seed
+    if seeds is None or isinstance(seeds, (int, np.integer, np.random.SeedSequence)):
+        seeds = noise.spawn_seeds(seeds, len(currents))
+    for row, curve_seed in enumerate(seeds):
+        rng = noise.curve_rng(curve_seed)
+        for first in range(0, n_draws, len(buffer)):
+            draws = _draw(rng, centres[row], spreads[row], method, buffer[:min(len(buffer), n_draws - first)])
+            with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+                analysed = analysis.analyze_batch(voltage, draws, **options)
+            for column, name in enumerate(QUANTITIES):
+                values[first:first + len(draws), column] = analysed[name]
+        values[~np.isfinite(values)] = np.nan
+        result['valid_draws'][row] = np.count_nonzero(np.all(np.isfinite(values), axis=1))
+        with warnings.catch_warnings():
+            # Quantities without a single finite draw warn; their NaN statistics are the answer
+            warnings.simplefilter('ignore', RuntimeWarning)
+            median, low, high = np.nanquantile(values, quantiles, axis=0)
+            std = np.nanstd(values, axis=0)
+        for column, name in enumerate(QUANTITIES):
+            for statistic, value in zip(STATISTICS, (median, low, high, std)):
+                result[f'{name}_{statistic}'][row] = value[column]
+    return result, IntervalReport(len(currents), n_draws, method, time.perf_counter() - start_time)
+
+
+def interval_sources(sources, kind=None, **options):
+    """``analysis_intervals`` of every curve of LMSIMData directories and/or HDF5 datasets, as a DataFrame.
+
+    ``options`` are passed on to ``analysis_intervals``; every curve keeps
+    its own seed whatever the grouping into tasks, the one it gets from
+    ``analysis_intervals`` of all curves in source order. Returns ``(table,
+    report)`` with an ``IntervalReport`` of all curves.
+    """
+    from . import reprocess
+    root_seed = np.random.SeedSequence(options.pop('seed', None))
+    records = []
+    elapsed = 0.0
+    for task in reprocess.plan_tasks(sources, kind=kind):
+        groups, labels = reprocess._load_task(task)
+        rows = [dict(label) for label in labels]
+        seeds = root_seed.spawn(len(labels))  # In source order
+        for voltage, currents, positions in groups:
+            for position, curve in zip(positions, currents):
+                result, report = analysis_intervals(voltage, curve, seed=[seeds[position]], **options)
+                rows[position].update({name: result[name][0].item() for name in INTERVAL_DTYPE.names})
+                elapsed += report.elapsed
+        records.extend(rows)
+    n_curves = len(records)
+    report = IntervalReport(n_curves, options.get('n_draws', n_draws), options.get('method', 'residuals'), elapsed)
+    return reprocess._pandas().DataFrame(records), report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monte-Carlo confidence intervals of the Langmuir analysis "
+                                                 "of every curve in LMSIMData directories and HDF5 datasets.")
+    parser.add_argument('sources', nargs='+', help="LMSIMData-style directories and/or .h5 dataset files")
+    parser.add_argument('-o', '--output', required=True, help="results table, .csv or .parquet")
+    parser.add_argument('--kind', choices=('theory', 'averaged_noisy'), default=None)
+    parser.add_argument('--draws', type=int, default=n_draws, help="draws per curve")
+    parser.add_argument('--method', choices=METHODS, default='residuals')
+    parser.add_argument('--confidence', type=float, default=confidence)
+    parser.add_argument('--num-samples', type=int, default=noise.num_samples,
+                        help="sweeps averaged into each curve (--method noise)")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    from . import reprocess
+    output_format = reprocess.check_output_format(args.output)
+    table, report = interval_sources(args.sources, args.kind, n_draws=args.draws, method=args.method,
+                                     confidence=args.confidence, num_samples=args.num_samples, seed=args.seed)
+    if output_format == 'parquet':
+        table.to_parquet(args.output, index=False)
+    else:
+        table.to_csv(args.output, index=False)
+    print(f"{report.summary()}; results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()